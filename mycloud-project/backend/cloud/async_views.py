@@ -0,0 +1,98 @@
+"""
+Отдача файлов и архивов без занятого потока на каждое медленное соединение.
+
+Синхронный StreamingHttpResponse/FileResponse под ASGI Django целиком
+вычитывает в память перед отправкой, а под WSGI каждый ответ держит поток
+воркера, пока клиент не дочитает. Поэтому скачивания под ASGI обслуживает
+async_streaming: права, Range, условные запросы и учёт скачиваний остаются
+в прежних синхронных view (они выполняются как обычно, в потоке запроса),
+а тело ответа отдаётся асинхронным итератором. Каждый блок читается с диска
+в общем пуле потоков (thread_sensitive=False), и поток занят только на
+время чтения блока, а не на время передачи клиенту. Тысячи медленных
+скачиваний держат тысячи корутин и несколько потоков пула.
+
+Под WSGI обёртка ничего не меняет: ответ уходит синхронно, с
+wsgi.file_wrapper (sendfile) для FileResponse.
+
+Загрузка частями (PUT /uploads/<id>/) отдельной обёртки не требует: под
+ASGI Django принимает тело запроса асинхронно (в SpooledTemporaryFile, на
+диск сверх FILE_UPLOAD_MAX_MEMORY_SIZE) и вызывает view, когда тело уже
+получено, — медленный клиент не занимает поток.
+
+Долгий опрос журнала изменений (changes_long_poll) под ASGI ждёт новых
+событий в корутине: пока изменений нет, поток занят только на короткий
+запрос change_seq раз в CLOUD_CHANGES_POLL_INTERVAL секунд.
+"""
+import asyncio
+import functools
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .models import UserProfile
+
+# маркер конца итератора (пустой блок b"" — допустимое значение)
+_DONE = object()
+
+
+async def aiter_blocks(iterator):
+    """Асинхронный итератор поверх синхронного: каждый next() — в пуле потоков."""
+    # файлы закрывает response.close(), который Django вызывает и при обрыве соединения
+    read = sync_to_async(next, thread_sensitive=False)
+    while True:
+        block = await read(iterator, _DONE)
+        if block is _DONE:
+            break
+        yield block
+
+
+def async_streaming(view):
+    """
+    Асинхронная обёртка над синхронным view: под ASGI потоковое тело ответа
+    отдаётся через aiter_blocks. Итератор не должен обращаться к БД —
+    потоки общего пула не закрывают соединения.
+    """
+    sync_view = sync_to_async(view)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        response = await sync_view(request, *args, **kwargs)
+        if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+            response.streaming_content = aiter_blocks(iter(response.streaming_content))
+        return response
+
+    return wrapper
+
+
+def changes_long_poll(view):
+    """
+    Долгий опрос для GET /changes/?since=<cursor>&timeout=<секунды>: если
+    после since изменений нет, ответ откладывается, пока они не появятся или
+    не истечёт timeout (не больше CLOUD_CHANGES_MAX_WAIT). Под WSGI ожидание
+    заняло бы поток воркера — там timeout игнорируется и ответ сразу.
+    """
+    sync_view = sync_to_async(view)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        response = await sync_view(request, *args, **kwargs)
+        try:
+            timeout = min(float(request.GET.get("timeout", 0)), getattr(settings, "CLOUD_CHANGES_MAX_WAIT", 25))
+            since = int(request.GET["since"])
+        except (KeyError, ValueError):
+            return response
+        if not isinstance(request, ASGIRequest) or timeout <= 0 or response.status_code != 200 or response.data["cursor"] != since:
+            return response
+        # пользователя уже загрузил view; профиль читаем без DRF и сериализаторов
+        profile = UserProfile.objects.filter(user_id=request.user.pk).values_list("change_seq", flat=True)
+        interval = getattr(settings, "CLOUD_CHANGES_POLL_INTERVAL", 1.0)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            if (await profile.afirst() or 0) != since:
+                return await sync_view(request, *args, **kwargs)
+        return response
+
+    return wrapper
@@ -0,0 +1,202 @@
+"""
+Хранилище содержимого, адресуемого по SHA-256 (см. модель Blob).
+
+Обычная загрузка хэшируется на лету обработчиками загрузки из
+FILE_UPLOAD_HANDLERS — байты читаются один раз, пока Django принимает
+запрос. Если такой blob уже есть, файл на диск не пишется: у blob
+увеличивается refcount, а UserFile ссылается на его байты. Файл загрузки
+по частям хэшируется при завершении и переносится в blobs/ жёсткой ссылкой.
+Файлы, загруженные раньше, переводит на blob команда dedup_files.
+
+SHA-256 blob — заодно контрольная сумма файла: клиент может передать свою
+(поле или заголовок sha256) и получить 400 вместо тихо повреждённого
+файла, а команда verify_storage перепроверяет хранилище по этим суммам.
+"""
+import hashlib
+import logging
+import os
+import re
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+
+from .models import Blob, UserFile
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+# сколько раз повторять регистрацию при гонке с параллельным удалением того же blob
+MAX_ATTEMPTS = 5
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ChecksumMismatch(Exception):
+    """Содержимое не совпало с контрольной суммой, переданной клиентом."""
+
+    def __init__(self, expected, actual):
+        super().__init__(f"ожидался sha256 {expected}, получен {actual}")
+        self.expected = expected
+        self.actual = actual
+
+
+def parse_sha256(value):
+    """Нормализованная hex-строка SHA-256 или ValueError."""
+    value = str(value).strip().lower()
+    if not SHA256_RE.match(value):
+        raise ValueError("sha256 должен быть 64 шестнадцатеричными символами")
+    return value
+
+
+def _check(sha256, expected):
+    if expected is not None and sha256 != expected:
+        raise ChecksumMismatch(expected, sha256)
+
+
+def _storage():
+    return UserFile._meta.get_field("file").storage
+
+
+def blob_path(sha256):
+    return os.path.join("blobs", sha256[:2], sha256[2:4], sha256)
+
+
+def hash_file(fh):
+    """(sha256, размер) содержимого открытого файла или UploadedFile."""
+    digest = hashlib.sha256()
+    size = 0
+    chunks = fh.chunks(HASH_BLOCK_SIZE) if hasattr(fh, "chunks") else iter(lambda: fh.read(HASH_BLOCK_SIZE), b"")
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class HashingUploadMixin:
+    """Считает SHA-256 тех частей загрузки, которые сохраняет сам обработчик."""
+
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed = super().receive_data_chunk(raw_data, start)
+        if passed is None:
+            self._sha256.update(raw_data)
+        return passed
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self._sha256.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def _unlink(names):
+    storage = _storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning("blobs: не удалось удалить %s", name, exc_info=True)
+
+
+def unlink_after_commit(names):
+    """Удаляет байты освобождённых blob после коммита текущей транзакции."""
+    if names:
+        transaction.on_commit(lambda: _unlink(names))
+
+
+def _register(sha256, size, name):
+    """
+    Создаёт строку Blob для файла, уже записанного под именем name.
+    Если параллельный запрос успел создать такой же blob, наш файл
+    удаляется, а ссылка берётся на его blob.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(sha256=sha256, size=size, file_name=name, refcount=1)
+        except IntegrityError:
+            blob = Blob.acquire(sha256)
+            if blob is not None:
+                _unlink([name])
+                return blob
+            # blob удалили между INSERT и acquire — пробуем зарегистрировать свой файл снова
+    raise RuntimeError(f"не удалось сохранить blob {sha256}")
+
+
+def store_upload(uploaded, expected=None):
+    """
+    Blob для UploadedFile (+1 ссылка). Байты пишутся, только если такого содержимого ещё нет.
+    expected — sha256 от клиента: при несовпадении ChecksumMismatch, ничего не сохраняется.
+    """
+    sha256 = getattr(uploaded, "sha256", None)
+    if sha256 is None:
+        sha256, _ = hash_file(uploaded)
+    _check(sha256, expected)
+    blob = Blob.acquire(sha256)
+    if blob is not None:
+        return blob
+    # save() подбирает свободное имя, поэтому файлы параллельных загрузок не перезаписывают друг друга
+    name = _storage().save(blob_path(sha256), uploaded)
+    return _register(sha256, uploaded.size, name)
+
+
+def _link_into_blobs(name, sha256):
+    storage = _storage()
+    source = storage.path(name)
+    while True:
+        target = storage.get_available_name(blob_path(sha256))
+        os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+        try:
+            # link() не перезаписывает существующий файл, в отличие от rename()
+            os.link(source, storage.path(target))
+        except FileExistsError:
+            continue
+        return target
+
+
+def _acquire_or_link(name, expected=None):
+    with _storage().open(name, "rb") as fh:
+        sha256, size = hash_file(fh)
+    _check(sha256, expected)
+    blob = Blob.acquire(sha256)
+    if blob is not None:
+        return blob
+    return _register(sha256, size, _link_into_blobs(name, sha256))
+
+
+def adopt(name, expected=None):
+    """
+    Blob для файла, уже лежащего в хранилище под именем name (+1 ссылка).
+    Файл либо переносится в blobs/ без копирования, либо удаляется как дубликат.
+    При несовпадении с expected — ChecksumMismatch, файл остаётся на месте.
+    """
+    blob = _acquire_or_link(name, expected)
+    _unlink([name])
+    return blob
+
+
+def attach_existing(userfile_id, name):
+    """
+    Переводит файл, загруженный до появления Blob, на общий blob.
+    Старый файл удаляется только после того, как строка UserFile указывает
+    на blob. False — файл успели удалить или изменить.
+    """
+    blob = _acquire_or_link(name)
+    updated = UserFile.objects.filter(pk=userfile_id, blob__isnull=True, file=name).update(
+        blob=blob, file=blob.file_name
+    )
+    if not updated:
+        unlink_after_commit(Blob.release([blob.pk]))
+        return False
+    _unlink([name])
+    return True
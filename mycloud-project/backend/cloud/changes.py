@@ -0,0 +1,117 @@
+"""
+Журнал изменений папок и файлов для инкрементальной синхронизации клиентов.
+
+У каждого пользователя свой счётчик UserProfile.change_seq. record() в
+одной транзакции с изменением сдвигает счётчик на число событий и пишет
+события с номерами подряд. UPDATE счётчика блокирует строку профиля до
+конца транзакции, поэтому события пользователя фиксируются строго по
+порядку номеров: клиент, получивший события до N, уже не увидит позже
+событие с меньшим номером. Номера идут без пропусков — если первое
+событие после since не since + 1, старая часть журнала удалена
+(prune_changes) и клиенту нужна полная синхронизация.
+
+Одиночные save()/delete() папок и файлов пишутся сигналами (models.py),
+массовые операции (bulk_create, update, raw DELETE) вызывают record сами.
+Смена path/depth потомков при переносе папки событий не порождает:
+клиенту достаточно нового parent перенесённой папки. События папок
+заодно сбрасывают кэш дерева папок владельца (tree_cache).
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import tree_cache
+from .models import ChangeEvent, Folder, UserProfile
+
+Delta = namedtuple("Delta", ["cursor", "has_more", "folder_ids", "file_ids", "deleted_folders", "deleted_files"])
+
+
+class JournalGap(Exception):
+    """События после курсора уже удалены или курсор из будущего — нужна полная синхронизация."""
+
+
+def kind_of(model):
+    return ChangeEvent.KIND_FOLDER if model is Folder else ChangeEvent.KIND_FILE
+
+
+def record(owner_id, kind, action, object_ids):
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    with transaction.atomic():
+        last = UserProfile.advance_change_seq(owner_id, len(object_ids))
+        first = last - len(object_ids) + 1
+        ChangeEvent.objects.bulk_create(
+            [
+                ChangeEvent(owner_id=owner_id, seq=first + i, kind=kind, action=action, object_id=object_id)
+                for i, object_id in enumerate(object_ids)
+            ]
+        )
+        if kind == ChangeEvent.KIND_FOLDER:
+            tree_cache.invalidate(owner_id)
+
+
+def record_rows(kind, action, rows):
+    """rows — пары (id объекта, id владельца). Владельцы блокируются по возрастанию id — без взаимных блокировок."""
+    by_owner = defaultdict(list)
+    for object_id, owner_id in rows:
+        by_owner[owner_id].append(object_id)
+    with transaction.atomic():
+        for owner_id in sorted(by_owner):
+            record(owner_id, kind, action, by_owner[owner_id])
+
+
+def record_objects(action, objs):
+    """Объекты одного типа (папки или файлы)."""
+    if objs:
+        record_rows(kind_of(type(objs[0])), action, [(obj.pk, obj.owner_id) for obj in objs])
+
+
+def current_seq(owner_id):
+    return UserProfile.objects.filter(user_id=owner_id).values_list("change_seq", flat=True).first() or 0
+
+
+def changes_since(owner_id, since, cursor, limit):
+    """
+    Изменения после since, не больше limit событий. cursor — текущий
+    change_seq пользователя. Каждый объект попадает в ответ один раз,
+    с последним действием: изменённые — списками id, удалённые — отдельно.
+    """
+    if since > cursor:
+        raise JournalGap
+    if since == cursor:
+        return Delta(since, False, [], [], [], [])
+    events = list(
+        ChangeEvent.objects.filter(owner_id=owner_id, seq__gt=since)
+        .order_by("seq")
+        .values_list("seq", "kind", "action", "object_id")[:limit]
+    )
+    if not events or events[0][0] != since + 1:
+        raise JournalGap
+    latest = {}
+    for _, kind, action, object_id in events:
+        latest[(kind, object_id)] = action
+    changed = {ChangeEvent.KIND_FOLDER: [], ChangeEvent.KIND_FILE: []}
+    deleted = {ChangeEvent.KIND_FOLDER: [], ChangeEvent.KIND_FILE: []}
+    for (kind, object_id), action in latest.items():
+        (deleted if action == ChangeEvent.ACTION_DELETE else changed)[kind].append(object_id)
+    last = events[-1][0]
+    return Delta(
+        cursor=last,
+        has_more=last < cursor,
+        folder_ids=changed[ChangeEvent.KIND_FOLDER],
+        file_ids=changed[ChangeEvent.KIND_FILE],
+        deleted_folders=deleted[ChangeEvent.KIND_FOLDER],
+        deleted_files=deleted[ChangeEvent.KIND_FILE],
+    )
+
+
+def prune(days=None):
+    """Удаляет события старше days (по умолчанию CLOUD_CHANGES_RETENTION_DAYS). Возвращает число удалённых."""
+    if days is None:
+        days = getattr(settings, "CLOUD_CHANGES_RETENTION_DAYS", 30)
+    cutoff = timezone.now() - timedelta(days=days)
+    return ChangeEvent.objects.filter(created_at__lt=cutoff).delete()[0]
@@ -0,0 +1,128 @@
+"""
+Копирование файлов и папок на стороне сервера.
+
+Байты не копируются: копия ссылается на тот же Blob, у которого
+увеличивается refcount. Поддерево папки создаётся bulk_create по уровням
+глубины (INSERT и UPDATE путей на уровень), файлы — пачками bulk_create.
+Квота владельца проверяется условным UPDATE на полный логический размер
+копий в той же транзакции.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import blobs, changes
+from .models import Blob, ChangeEvent, Folder, UserFile, UserProfile
+
+FILE_FIELDS = ("pk", "folder_id", "original_name", "comment", "size", "blob_id", "file")
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class CopyConflict(Exception):
+    """Исходные файлы удалили во время копирования."""
+
+
+def _batch_size():
+    return getattr(settings, "CLOUD_PURGE_CHUNK_SIZE", 1000)
+
+
+def attach_legacy_blobs(files_qs):
+    """
+    Файлы, загруженные до появления Blob, сначала переводятся на blob —
+    иначе копии пришлось бы делить с оригиналом собственный файл.
+    Работает с диском, поэтому вызывается вне транзакции копирования.
+    """
+    for pk, name in files_qs.filter(blob__isnull=True).exclude(file="").values_list("pk", "file").iterator():
+        blobs.attach_existing(pk, name)
+
+
+def _create_files(rows, owner_id, folder_map):
+    """rows — значения FILE_FIELDS; folder_map: id исходной папки -> id новой (None — корень)."""
+    if not Blob.retain([row[5] for row in rows]):
+        raise CopyConflict
+    copies = [
+        UserFile(
+            owner_id=owner_id,
+            folder_id=folder_map[folder_id],
+            original_name=original_name,
+            comment=comment,
+            size=size,
+            blob_id=blob_id,
+            file=name,
+        )
+        for _, folder_id, original_name, comment, size, blob_id, name in rows
+    ]
+    copies = UserFile.objects.bulk_create(copies, batch_size=_batch_size())
+    changes.record(owner_id, ChangeEvent.KIND_FILE, ChangeEvent.ACTION_CREATE, [copy.pk for copy in copies])
+    return copies
+
+
+def _reserve(owner_id, rows):
+    size = sum(row[4] or 0 for row in rows)
+    if not UserProfile.reserve_bytes(owner_id, size):
+        raise QuotaExceeded
+    return size
+
+
+def copy_files(files_qs, owner_id, folder, names=None):
+    """
+    Копирует файлы в folder (None — корень). names: {id: новое имя}.
+    Возвращает созданные UserFile.
+    """
+    attach_legacy_blobs(files_qs)
+    with transaction.atomic():
+        rows = list(files_qs.order_by("pk").values_list(*FILE_FIELDS))
+        if any(row[5] is None for row in rows):
+            raise CopyConflict
+        if names:
+            rows = [(row[0], row[1], names.get(row[0], row[2])) + row[3:] for row in rows]
+        size = _reserve(owner_id, rows)
+        folder_id = folder.pk if folder else None
+        copies = _create_files(rows, owner_id, {row[1]: folder_id for row in rows})
+        UserProfile.commit_reserved(owner_id, size, files_delta=len(copies))
+    return copies
+
+
+def copy_folder(folder, parent, name):
+    """
+    Копирует папку со всем поддеревом в parent (None — корень) под именем name.
+    Возвращает новую папку. Если в parent уже есть папка с таким именем — IntegrityError.
+    """
+    files_qs = UserFile.objects.filter(folder__path__startswith=folder.path)
+    attach_legacy_blobs(files_qs)
+    with transaction.atomic():
+        # снимок поддерева до создания копии: копировать можно и внутрь самой папки
+        sources = list(folder.subtree().order_by("depth", "pk").values_list("pk", "parent_id", "name", "depth"))
+        rows = list(files_qs.filter(folder_id__in=[pk for pk, *_ in sources]).values_list(*FILE_FIELDS))
+        if any(row[5] is None for row in rows):
+            raise CopyConflict
+        size = _reserve(folder.owner_id, rows)
+
+        root = Folder(owner_id=folder.owner_id, parent=parent, name=name)
+        root.save()
+        copied = {folder.pk: root}
+        depth_shift = root.depth - folder.depth
+
+        levels = {}
+        for pk, parent_id, folder_name, depth in sources[1:]:
+            levels.setdefault(depth, []).append((pk, parent_id, folder_name))
+        for depth in sorted(levels):
+            level = levels[depth]
+            created = Folder.objects.bulk_create(
+                [
+                    Folder(owner_id=folder.owner_id, parent_id=copied[parent_id].pk, name=folder_name, depth=depth + depth_shift)
+                    for _, parent_id, folder_name in level
+                ],
+                batch_size=_batch_size(),
+            )
+            for (pk, parent_id, _), new in zip(level, created):
+                new.path = f"{copied[parent_id].path}{new.pk}/"
+                copied[pk] = new
+            Folder.objects.bulk_update(created, ["path"], batch_size=_batch_size())
+            changes.record(folder.owner_id, ChangeEvent.KIND_FOLDER, ChangeEvent.ACTION_CREATE, [new.pk for new in created])
+
+        copies = _create_files(rows, folder.owner_id, {pk: new.pk for pk, new in copied.items()})
+        UserProfile.commit_reserved(folder.owner_id, size, files_delta=len(copies))
+    return root
@@ -0,0 +1,109 @@
+"""
+Буферизованный учёт скачиваний.
+
+Скачивание не пишет в строку UserFile сразу: инкременты копятся в памяти
+процесса и раз в CLOUD_DOWNLOAD_FLUSH_INTERVAL секунд сбрасываются
+несколькими UPDATE вида download_count = download_count + n (по одному на
+каждое встречающееся n), время последнего скачивания у каждого файла своё
+(CASE по id). Каждый процесс прибавляет свои инкременты через F-выражения,
+поэтому при нескольких воркерах ничего не теряется. Остаток сбрасывается
+при завершении процесса (atexit). Интервал 0 — писать сразу.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pid = None
+        self._stop = None
+
+    @property
+    def interval(self):
+        return getattr(settings, "CLOUD_DOWNLOAD_FLUSH_INTERVAL", 5)
+
+    def record(self, file_id, when=None):
+        when = when or timezone.now()
+        with self._lock:
+            count, last = self._pending.get(file_id, (0, when))
+            self._pending[file_id] = (count + 1, max(last, when))
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def flush(self):
+        from .models import UserFile
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        by_count = defaultdict(list)
+        for file_id, (count, last) in pending.items():
+            by_count[count].append((file_id, last))
+        try:
+            with transaction.atomic():
+                for count, items in sorted(by_count.items()):
+                    last = Case(
+                        *(When(pk=pk, then=Value(ts)) for pk, ts in items),
+                        output_field=DateTimeField(),
+                    )
+                    UserFile.objects.filter(pk__in=sorted(pk for pk, _ in items)).update(
+                        download_count=F("download_count") + count,
+                        last_downloaded_at=Greatest(Coalesce(F("last_downloaded_at"), last), last),
+                    )
+        except Exception:
+            logger.exception("не удалось сбросить счётчики скачиваний, повторим позже")
+            with self._lock:
+                for file_id, (count, last) in pending.items():
+                    cur_count, cur_last = self._pending.get(file_id, (0, last))
+                    self._pending[file_id] = (cur_count + count, max(cur_last, last))
+
+    def _ensure_thread(self):
+        # после fork (gunicorn --preload) поток родителя в дочернем процессе не существует
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            thread = threading.Thread(target=self._run, args=(self._stop,), name="download-counter", daemon=True)
+            thread.start()
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def shutdown(self):
+        if self._stop is not None:
+            self._stop.set()
+        self.flush()
+
+
+download_counter = DownloadCounter()
+
+
+def record_download(userfile):
+    download_counter.record(userfile.pk)
+
+
+atexit.register(download_counter.shutdown)
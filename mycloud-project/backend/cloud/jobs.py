@@ -0,0 +1,165 @@
+"""
+Локальная очередь фоновых задач поверх таблицы BackgroundJob.
+
+CLOUD_JOBS_BACKEND:
+  "thread" — задача запускается пулом потоков того же процесса сразу после
+             коммита транзакции, в которой её поставили;
+  "worker" — задачи только ставятся в очередь, выполняет их команда run_jobs.
+
+Задачу забирает тот, кто первым переведёт её из pending в running условным
+UPDATE, поэтому оба способа можно использовать одновременно.
+
+Исполнитель продлевает аренду (heartbeat_at) после каждой пачки. Задача в
+running, чья аренда старше CLOUD_JOBS_LEASE_SECONDS, считается брошенной
+(процесс убит посреди работы): enqueue и run_jobs возвращают её в pending.
+Очистка идемпотентна — перезапуск продолжает с оставшихся строк.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob, Folder, UploadSession, UserFile
+from .purge import delete_files, delete_folders, delete_upload_sessions
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "CLOUD_JOBS_WORKERS", 2),
+                thread_name_prefix="cloud-jobs",
+            )
+        return _executor
+
+
+def _submit_on_commit(job_id):
+    if getattr(settings, "CLOUD_JOBS_BACKEND", "thread") == "thread":
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job_id))
+
+
+def requeue_stale(**filters):
+    """Возвращает в pending задачи в running с истёкшей арендой. Возвращает их количество."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "CLOUD_JOBS_LEASE_SECONDS", 600))
+    requeued = BackgroundJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True),
+        status=BackgroundJob.STATUS_RUNNING,
+        **filters,
+    ).update(status=BackgroundJob.STATUS_PENDING, heartbeat_at=None)
+    if requeued:
+        logger.warning("requeued %s stale job(s) %s", requeued, filters or "")
+    return requeued
+
+
+def enqueue(kind, target_id, requested_by=None):
+    """
+    Ставит задачу в очередь; если такая же ещё не завершена — возвращает её.
+    Брошенная задача с истёкшей арендой перезапускается.
+    """
+    requeued = requeue_stale(kind=kind, target_id=target_id)
+    active = BackgroundJob.objects.filter(
+        kind=kind,
+        target_id=target_id,
+        status__in=(BackgroundJob.STATUS_PENDING, BackgroundJob.STATUS_RUNNING),
+    ).first()
+    if active:
+        if requeued:
+            _submit_on_commit(active.pk)
+        return active
+    job = BackgroundJob.objects.create(kind=kind, target_id=target_id, requested_by=requested_by)
+    _submit_on_commit(job.pk)
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def run_job(job_id):
+    """Выполняет задачу, если её ещё никто не забрал. True — задача выполнена этим вызовом."""
+    now = timezone.now()
+    claimed = BackgroundJob.objects.filter(pk=job_id, status=BackgroundJob.STATUS_PENDING).update(
+        status=BackgroundJob.STATUS_RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+    )
+    if not claimed:
+        return False
+    job = BackgroundJob.objects.get(pk=job_id)
+    try:
+        HANDLERS[job.kind](job)
+    except Exception as exc:
+        logger.exception("job %s failed", job_id)
+        BackgroundJob.objects.filter(pk=job_id).update(
+            status=BackgroundJob.STATUS_FAILED,
+            error=str(exc),
+            finished_at=timezone.now(),
+        )
+    else:
+        BackgroundJob.objects.filter(pk=job_id).update(
+            status=BackgroundJob.STATUS_DONE,
+            finished_at=timezone.now(),
+        )
+    return True
+
+
+def _purge(job, files_qs, folders_qs):
+    # каждая пачка продлевает аренду задачи
+    def files_progress(count, size):
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            files_deleted=count, bytes_freed=size, heartbeat_at=timezone.now()
+        )
+
+    def folders_progress(count):
+        BackgroundJob.objects.filter(pk=job.pk).update(folders_deleted=count, heartbeat_at=timezone.now())
+
+    delete_files(files_qs, progress=files_progress)
+    delete_folders(folders_qs, progress=folders_progress)
+
+
+def purge_folder(job):
+    folder = Folder.objects.filter(pk=job.target_id).first()
+    if folder is None:
+        return
+    _purge(
+        job,
+        UserFile.objects.filter(folder__path__startswith=folder.path),
+        Folder.objects.filter(path__startswith=folder.path),
+    )
+
+
+def purge_user(job):
+    _purge(
+        job,
+        UserFile.objects.filter(owner_id=job.target_id),
+        Folder.objects.filter(owner_id=job.target_id),
+    )
+    with transaction.atomic():
+        # загрузки в корне не попали в delete_folders, а каскад от User удалил бы
+        # только строки — частичные файлы остались бы на диске
+        delete_upload_sessions(UploadSession.objects.filter(owner_id=job.target_id))
+        # файлов и папок уже нет — каскад удалит только профиль и мелкие связи
+        User.objects.filter(pk=job.target_id).delete()
+
+
+HANDLERS = {
+    BackgroundJob.KIND_PURGE_FOLDER: purge_folder,
+    BackgroundJob.KIND_PURGE_USER: purge_user,
+}
@@ -0,0 +1,199 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from cloud.models import Folder, ShareLink, UserFile
+from cloud.pagination import UserFilePagination
+
+User = get_user_model()
+
+# Сколько SQL-запросов допускает эндпоинт. Число не должно зависеть от
+# количества папок и файлов: рост на больших данных — это N+1.
+ENDPOINT_BUDGETS = (
+    ("/api/folders/", 3),
+    ("/api/folders/?depth=1", 3),
+    ("/api/folders/{folder}/", 3),
+    ("/api/folders/{folder}/children/", 2),
+    ("/api/folders/{folder}/files/", 2),
+    ("/api/files/", 1),
+    ("/api/files/?folder={folder}", 1),
+    ("/api/files/search/?q=a", 1),
+    # промах кэша дерева — один запрос, попадание — ни одного
+    ("/api/folders/tree/", 1),
+)
+# эндпоинты администратора запрашиваются от имени несохранённого пользователя с is_staff
+ADMIN_ENDPOINT_BUDGETS = (
+    ("/api/admin-users/", 1),
+    ("/api/admin-users/?page_size=1000", 1),
+    ("/api/admin-users/{owner}/folder_tree/", 2),
+)
+
+
+def create_fixtures():
+    """
+    Небольшой набор данных для пустой базы (CI): пользователь, вложенные папки,
+    по несколько файлов в каждой и ссылка. Вызывается внутри транзакции,
+    которая потом откатывается.
+    """
+    user = User.objects.create_user(username="check_queries")
+    root = Folder.objects.create(owner=user, name="root")
+    child = Folder.objects.create(owner=user, name="child", parent=root)
+    Folder.objects.create(owner=user, name="grandchild", parent=child)
+    files = [
+        UserFile.objects.create(
+            owner=user,
+            folder=folder,
+            original_name=f"a{i}.txt",
+            file=f"user_{user.pk}/a{i}.txt",
+            size=1,
+        )
+        for i, folder in enumerate((None, root, child) * 3)
+    ]
+    ShareLink.objects.create(kind=ShareLink.KIND_FILE, owner=user, file=files[0])
+    return user
+
+
+def plan_checks(user, folder, token):
+    """(название, queryset, индекс или кортеж допустимых индексов, который должен быть в плане)."""
+    files = UserFile.objects.filter(owner=user)
+    last = files.order_by("-uploaded_at", "-id").first()
+    keyset = UserFilePagination()
+    after = keyset._after([last.uploaded_at, last.pk]) if last else Q()
+    return (
+        (
+            "файлы папки пользователя",
+            UserFile.objects.filter(owner=user, folder=folder).order_by("-uploaded_at")[:100],
+            "userfile_owner_folder_recent",
+        ),
+        (
+            "страница файлов папки",
+            UserFile.objects.filter(folder=folder).order_by("-uploaded_at")[:100],
+            "userfile_folder_recent",
+        ),
+        (
+            "все файлы пользователя",
+            UserFile.objects.filter(owner=user).order_by("-uploaded_at", "-id")[:100],
+            "userfile_owner_recent",
+        ),
+        (
+            "следующая страница файлов пользователя",
+            files.order_by(*keyset.ordering).filter(after)[:100],
+            "userfile_owner_recent",
+        ),
+        (
+            "подпапки",
+            Folder.objects.filter(parent=folder).order_by("name")[:100],
+            "folder_parent_name",
+        ),
+        (
+            "корневые папки",
+            Folder.objects.filter(owner=user, parent__isnull=True).order_by("name"),
+            # индекс unique_together; имя генерирует Django
+            "_owner_id_parent_id_name_",
+        ),
+        (
+            "файл по share_token",
+            UserFile.objects.filter(share_token=token),
+            "userfile_share_token_uniq",
+        ),
+        (
+            "ссылка по токену",
+            ShareLink.objects.filter(pk=token),
+            # первичный ключ: PostgreSQL / SQLite
+            ("cloud_sharelink_pkey", "sqlite_autoindex_cloud_sharelink"),
+        ),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет планы горячих запросов (EXPLAIN должен использовать нужные индексы) "
+        "и число SQL-запросов эндпоинтов. Завершается с ошибкой при регрессии — для CI. "
+        "На пустой базе создаёт свои данные; все изменения откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="id или имя пользователя; по умолчанию — у кого больше всего файлов")
+        parser.add_argument("--verbose-plans", action="store_true", help="Печатать EXPLAIN целиком")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            failures = self._run(options)
+            # данные create_fixtures в базе не остаются
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f"регрессий: {failures}")
+        self.stdout.write(self.style.SUCCESS("Планы запросов и число запросов в норме"))
+
+    def _run(self, options):
+        user = self._pick_user(options["user"])
+        folder = Folder.objects.filter(owner=user).order_by("depth", "pk").first()
+        if folder is None:
+            raise CommandError(f"у пользователя {user.pk} нет папок — проверять нечего")
+        token = ShareLink.objects.values_list("pk", flat=True).first() or "-"
+
+        failures = self._check_plans(user, folder, token, options["verbose_plans"])
+        failures += self._check_endpoints(user, folder, ENDPOINT_BUDGETS)
+        admin = User(username="check_queries_admin", is_staff=True)
+        failures += self._check_endpoints(admin, folder, ADMIN_ENDPOINT_BUDGETS)
+        return failures
+
+    def _pick_user(self, value):
+        if value:
+            lookup = {"pk": value} if value.isdigit() else {"username": value}
+            user = User.objects.filter(**lookup).first()
+            if user is None:
+                raise CommandError(f"пользователь {value} не найден")
+            return user
+        user = User.objects.annotate(n=Count("files")).order_by("-n").first()
+        if user is None or not Folder.objects.filter(owner=user).exists():
+            self.stdout.write("в базе нет пользователя с папками — проверка на временных данных")
+            return create_fixtures()
+        return user
+
+    def _explain(self, qs):
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # на маленьких таблицах планировщик предпочтёт Seq Scan; проверяем, что индекс вообще применим
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = qs.explain()
+            # откат к точке сохранения снимает SET LOCAL до проверки эндпоинтов
+            transaction.set_rollback(True)
+        return plan
+
+    def _check_plans(self, user, folder, token, verbose):
+        failures = 0
+        for name, qs, index in plan_checks(user, folder, token):
+            plan = self._explain(qs)
+            expected = index if isinstance(index, tuple) else (index,)
+            ok = any(candidate in plan for candidate in expected)
+            failures += not ok
+            status = self.style.SUCCESS("ok  ") if ok else self.style.ERROR("FAIL")
+            self.stdout.write(f"{status} plan  {name}: ожидается {' | '.join(expected)}")
+            if verbose or not ok:
+                self.stdout.write("      " + plan.replace("\n", "\n      "))
+        return failures
+
+    def _check_endpoints(self, user, folder, budgets):
+        factory = APIRequestFactory()
+        failures = 0
+        for template, budget in budgets:
+            url = template.format(folder=folder.pk, owner=folder.owner_id)
+            request = factory.get(url)
+            force_authenticate(request, user=user)
+            match = resolve(url.split("?", 1)[0])
+            with CaptureQueriesContext(connection) as queries:
+                response = match.func(request, *match.args, **match.kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+            count = len(queries)
+            ok = response.status_code == 200 and count <= budget
+            failures += not ok
+            status = self.style.SUCCESS("ok  ") if ok else self.style.ERROR("FAIL")
+            self.stdout.write(f"{status} query {url}: {count} запросов (лимит {budget}), HTTP {response.status_code}")
+        return failures
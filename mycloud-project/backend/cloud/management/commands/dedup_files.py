@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from cloud.blobs import attach_existing
+from cloud.models import UserFile
+
+
+class Command(BaseCommand):
+    help = "Переводит файлы, загруженные до дедупликации, на общие blob: одинаковое содержимое остаётся на диске один раз"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Сколько файлов выбирать за один запрос")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        last_id = 0
+        attached = failed = 0
+
+        while True:
+            rows = list(
+                UserFile.objects.filter(blob__isnull=True, pk__gt=last_id)
+                .exclude(file="")
+                .order_by("pk")
+                .values_list("pk", "file")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for pk, name in rows:
+                try:
+                    if attach_existing(pk, name):
+                        attached += 1
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"file={pk} {name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Переведено на blob: {attached}, ошибок: {failed}"))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cloud.models import UploadSession, UserFile, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные загрузки по частям и возвращает зарезервированную под них квоту"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24, help="Сколько часов сессия может простаивать")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["hours"])
+        storage = UserFile._meta.get_field("file").storage
+        expired = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+            # удаляет только тот, кто успел — параллельный complete/abort уже вернул резерв
+            if UploadSession.objects.filter(pk=session.pk).delete()[0]:
+                UserProfile.release_bytes(session.owner_id, session.size)
+                storage.delete(session.file_name)
+                expired += 1
+        self.stdout.write(self.style.SUCCESS(f"Удалено сессий загрузки: {expired}"))
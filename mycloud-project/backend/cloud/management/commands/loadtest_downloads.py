@@ -0,0 +1,147 @@
+import asyncio
+import ssl
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.0f} мс"
+
+
+class Client:
+    """Один медленный HTTP/1.1-клиент: GET и чтение тела с ограниченной скоростью."""
+
+    def __init__(self, url, headers, read_rate, duration, timeout):
+        self.url = urlsplit(url)
+        self.headers = headers
+        self.read_rate = read_rate
+        self.duration = duration
+        self.timeout = timeout
+
+    async def _open(self):
+        secure = self.url.scheme == "https"
+        port = self.url.port or (443 if secure else 80)
+        return await asyncio.open_connection(self.url.hostname, port, ssl=ssl.create_default_context() if secure else None)
+
+    def _request(self, extra_headers=()):
+        target = self.url.path or "/"
+        if self.url.query:
+            target += "?" + self.url.query
+        lines = [f"GET {target} HTTP/1.1", f"Host: {self.url.netloc}", "Connection: close", *self.headers, *extra_headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _read_head(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        return int(head.split(b" ", 2)[1])
+
+    async def download(self):
+        """(статус, время до заголовков, принято байт); статус None — ошибка или таймаут."""
+        started = time.monotonic()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(self._open(), self.timeout)
+            writer.write(self._request())
+            await writer.drain()
+            status = await asyncio.wait_for(self._read_head(reader), self.timeout)
+            first_byte = time.monotonic() - started
+            received = 0
+            block = max(1, self.read_rate // 10)
+            deadline = time.monotonic() + self.duration
+            while time.monotonic() < deadline:
+                data = await asyncio.wait_for(reader.read(block), self.timeout)
+                if not data:
+                    break
+                received += len(data)
+                # не читаем быстрее read_rate — сервер упирается в заполненный буфер сокета
+                await asyncio.sleep(len(data) / self.read_rate)
+            return status, first_byte, received
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            return None, None, 0
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def probe(self):
+        """Время ответа на короткий запрос первого байта файла, пока идут медленные скачивания."""
+        started = time.monotonic()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(self._open(), self.timeout)
+            writer.write(self._request(["Range: bytes=0-0"]))
+            await writer.drain()
+            await asyncio.wait_for(self._read_head(reader), self.timeout)
+            return time.monotonic() - started
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            return None
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+class Command(BaseCommand):
+    # команда только ходит по HTTP — проверки проекта и БД ей не нужны
+    requires_system_checks = []
+    help = (
+        "Нагрузочный тест скачиваний: N одновременных медленных клиентов на каждый URL. "
+        "Передайте один и тот же файл под WSGI и под ASGI, чтобы сравнить, сколько "
+        "соединений сервер держит одновременно и отвечает ли он остальным запросам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="URL скачивания, например http://127.0.0.1:8000/api/external/download/<token>/")
+        parser.add_argument("--connections", type=int, default=500, help="Одновременных медленных клиентов")
+        parser.add_argument("--read-rate", type=int, default=64 * 1024, help="Скорость чтения одного клиента, байт/с")
+        parser.add_argument("--duration", type=float, default=20.0, help="Сколько секунд каждый клиент читает тело")
+        parser.add_argument("--timeout", type=float, default=10.0, help="Таймаут соединения, заголовков и каждого чтения")
+        parser.add_argument("--probes", type=int, default=10, help="Быстрых запросов во время нагрузки")
+        parser.add_argument("--cookie", help="Заголовок Cookie для закрытых URL (sessionid=...)")
+
+    def handle(self, *args, **options):
+        if options["connections"] < 1 or options["read_rate"] < 1:
+            raise CommandError("--connections и --read-rate должны быть положительными")
+        headers = [f"Cookie: {options['cookie']}"] if options["cookie"] else []
+        for url in options["urls"]:
+            if urlsplit(url).scheme not in ("http", "https"):
+                raise CommandError(f"ожидается http(s) URL: {url}")
+            client = Client(url, headers, options["read_rate"], options["duration"], options["timeout"])
+            result = asyncio.run(self._run(client, options["connections"], options["probes"], options["duration"]))
+            self._report(url, options["connections"], result)
+
+    async def _run(self, client, connections, probes, duration):
+        downloads = [asyncio.create_task(client.download()) for _ in range(connections)]
+        # пробы — когда медленные клиенты уже подключились и читают
+        await asyncio.sleep(min(2.0, duration / 4))
+        probe_latencies = []
+        for _ in range(probes):
+            probe_latencies.append(await client.probe())
+            await asyncio.sleep(duration / 2 / max(1, probes))
+        return await asyncio.gather(*downloads), probe_latencies
+
+    def _report(self, url, connections, result):
+        downloads, probes = result
+        served = [d for d in downloads if d[0] in (200, 206)]
+        first_bytes = [d[1] for d in served]
+        received = sum(d[2] for d in downloads)
+        answered = [p for p in probes if p is not None]
+        self.stdout.write(url)
+        self.stdout.write(f"  обслужено одновременно: {len(served)} из {connections}")
+        self.stdout.write(f"  ошибок и таймаутов:     {sum(d[0] is None for d in downloads)}")
+        self.stdout.write(f"  другие статусы:         {sum(d[0] is not None and d[0] not in (200, 206) for d in downloads)}")
+        self.stdout.write(
+            f"  до заголовков:          p50 {_ms(_percentile(first_bytes, 0.5))}, p95 {_ms(_percentile(first_bytes, 0.95))}"
+        )
+        self.stdout.write(f"  принято:                {received / 1024 / 1024:.1f} МиБ")
+        self.stdout.write(
+            f"  пробы под нагрузкой:    ответили {len(answered)} из {len(probes)}, "
+            f"медиана {_ms(statistics.median(answered) if answered else None)}"
+        )
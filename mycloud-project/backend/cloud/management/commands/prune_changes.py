@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from cloud.changes import prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет старые события журнала изменений. Клиенты с курсором старше "
+        "оставшейся части журнала получат 410 и выполнят полную синхронизацию"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Сколько дней хранить события (по умолчанию CLOUD_CHANGES_RETENTION_DAYS)")
+
+    def handle(self, *args, **options):
+        deleted = prune(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Удалено событий: {deleted}"))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from cloud.models import UploadSession, UserFile, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет материализованные счётчики used_bytes/files_count с фактическими файлами "
+        "пользователей, а reserved_bytes — с незавершёнными загрузками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Сколько профилей обрабатывать за одну транзакцию")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать расхождения, ничего не менять")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        dry_run = options["dry_run"]
+        last_id = 0
+        checked = fixed = 0
+
+        while True:
+            with transaction.atomic():
+                # блокируем профили пачки до подсчёта, чтобы параллельные
+                # загрузки не потеряли свои F-инкременты
+                profiles = list(
+                    UserProfile.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by("id")[:batch_size]
+                )
+                if not profiles:
+                    break
+                last_id = profiles[-1].id
+
+                totals = {
+                    row["owner_id"]: row
+                    for row in UserFile.objects.filter(owner_id__in=[p.user_id for p in profiles])
+                    .values("owner_id")
+                    .annotate(total=Sum("size"), cnt=Count("id"))
+                }
+                # долговременный резерв держат только живые UploadSession;
+                # обычная загрузка и копирование резервируют квоту на время
+                # одного запроса, поэтому команду лучше запускать вне пиковой нагрузки
+                reserved = dict(
+                    UploadSession.objects.filter(owner_id__in=[p.user_id for p in profiles])
+                    .values("owner_id")
+                    .annotate(total=Sum("size"))
+                    .values_list("owner_id", "total")
+                )
+
+                drifted = []
+                for profile in profiles:
+                    row = totals.get(profile.user_id)
+                    used = int(row["total"] or 0) if row else 0
+                    count = row["cnt"] if row else 0
+                    held = int(reserved.get(profile.user_id) or 0)
+                    if (profile.used_bytes, profile.files_count, profile.reserved_bytes) != (used, count, held):
+                        self.stdout.write(
+                            f"user={profile.user_id}: used_bytes {profile.used_bytes} -> {used}, "
+                            f"files_count {profile.files_count} -> {count}, "
+                            f"reserved_bytes {profile.reserved_bytes} -> {held}"
+                        )
+                        profile.used_bytes = used
+                        profile.files_count = count
+                        profile.reserved_bytes = held
+                        drifted.append(profile)
+
+                if drifted and not dry_run:
+                    UserProfile.objects.bulk_update(drifted, ["used_bytes", "files_count", "reserved_bytes"])
+                checked += len(profiles)
+                fixed += len(drifted)
+
+        verb = "найдено" if dry_run else "исправлено"
+        self.stdout.write(self.style.SUCCESS(f"Проверено профилей: {checked}, {verb} расхождений: {fixed}"))
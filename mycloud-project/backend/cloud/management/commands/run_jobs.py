@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cloud.jobs import requeue_stale, run_job
+from cloud.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди BackgroundJob (очистка папок и пользователей)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Выполнить накопившиеся задачи и выйти")
+        parser.add_argument("--interval", type=float, default=2.0, help="Пауза между опросами очереди, секунд")
+
+    def handle(self, *args, **options):
+        while True:
+            requeue_stale()
+            pending = list(
+                BackgroundJob.objects.filter(status=BackgroundJob.STATUS_PENDING)
+                .order_by("created_at")
+                .values_list("pk", flat=True)[:100]
+            )
+            for job_id in pending:
+                if run_job(job_id):
+                    job = BackgroundJob.objects.get(pk=job_id)
+                    self.stdout.write(f"job {job_id} {job.kind}:{job.target_id} -> {job.status}")
+            if options["once"]:
+                break
+            if not pending:
+                time.sleep(options["interval"])
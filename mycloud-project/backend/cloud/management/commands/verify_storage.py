@@ -0,0 +1,119 @@
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cloud.blobs import hash_file
+from cloud.models import Blob, UploadSession, UserFile
+
+# каталоги хранилища с файлами пользователей: blobs/ и старые user_<id>/ (превью и прочее не трогаем)
+BLOB_DIR = "blobs"
+LEGACY_PREFIX = "user_"
+
+
+def _check_blob(storage, sha256, size, name):
+    """None — файл в порядке, иначе описание проблемы."""
+    try:
+        with storage.open(name, "rb") as fh:
+            actual, actual_size = hash_file(fh)
+    except FileNotFoundError:
+        return "файл отсутствует"
+    except OSError as exc:
+        return f"ошибка чтения: {exc}"
+    if actual_size != size:
+        return f"размер {actual_size}, ожидался {size}"
+    if actual != sha256:
+        return f"sha256 {actual}"
+    return None
+
+
+def _check_legacy(storage, size, name):
+    # у файлов без blob нет контрольной суммы — проверяем только наличие и размер
+    try:
+        actual_size = storage.size(name)
+    except FileNotFoundError:
+        return "файл отсутствует"
+    except OSError as exc:
+        return f"ошибка чтения: {exc}"
+    if actual_size != size:
+        return f"размер {actual_size}, ожидался {size}"
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Перепроверяет хранилище: пересчитывает SHA-256 каждого blob, проверяет наличие и "
+        "размер файлов без blob и ищет файлы, на которые не ссылается ни одна запись"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Сколько файлов проверять параллельно")
+        parser.add_argument("--skip-orphans", action="store_true", help="Не искать файлы без записей в БД")
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        storage = UserFile._meta.get_field("file").storage
+        checked = problems = 0
+
+        jobs = (
+            (f"blob {sha256}", _check_blob, (storage, sha256, size, name))
+            for sha256, size, name in Blob.objects.order_by("pk").values_list("sha256", "size", "file_name").iterator()
+        )
+        legacy = (
+            (f"file={pk}", _check_legacy, (storage, size, name))
+            for pk, size, name in UserFile.objects.filter(blob__isnull=True)
+            .exclude(file="")
+            .order_by("pk")
+            .values_list("pk", "size", "file")
+            .iterator()
+        )
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify-storage") as pool:
+            pending = {}
+            for label, check, check_args in itertools.chain(jobs, legacy):
+                # в очереди не больше двух файлов на поток — память не растёт с размером хранилища
+                if len(pending) >= workers * 2:
+                    checked, problems = self._collect(pending, checked, problems)
+                pending[pool.submit(check, *check_args)] = label
+            while pending:
+                checked, problems = self._collect(pending, checked, problems)
+
+        orphans = 0
+        if not options["skip_orphans"]:
+            for name in self._orphans(storage):
+                orphans += 1
+                self.stdout.write(f"лишний файл {name}")
+
+        summary = f"Проверено файлов: {checked}, повреждённых или отсутствующих: {problems}, лишних: {orphans}"
+        if problems or orphans:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _collect(self, pending, checked, problems):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = pending.pop(future)
+            checked += 1
+            problem = future.result()
+            if problem:
+                problems += 1
+                self.stdout.write(self.style.ERROR(f"{label}: {problem}"))
+        return checked, problems
+
+    def _orphans(self, storage):
+        referenced = set(Blob.objects.values_list("file_name", flat=True).iterator())
+        referenced.update(UserFile.objects.filter(blob__isnull=True).values_list("file", flat=True).iterator())
+        referenced.update(UploadSession.objects.values_list("file_name", flat=True).iterator())
+        root = storage.location
+        try:
+            tops = [entry.name for entry in os.scandir(root) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        for top in sorted(tops):
+            if top != BLOB_DIR and not top.startswith(LEGACY_PREFIX):
+                continue
+            for dirpath, _, filenames in os.walk(os.path.join(root, top)):
+                for filename in sorted(filenames):
+                    name = os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/")
+                    if name not in referenced:
+                        yield name
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_usage_counters(apps, schema_editor):
+    UserProfile = apps.get_model("cloud", "UserProfile")
+    UserFile = apps.get_model("cloud", "UserFile")
+    totals = UserFile.objects.values("owner_id").annotate(total=Sum("size"), cnt=Count("id"))
+    for row in totals.iterator():
+        UserProfile.objects.filter(user_id=row["owner_id"]).update(
+            used_bytes=row["total"] or 0,
+            files_count=row["cnt"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0002_folder_is_shared_folder_share_token_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='files_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='used_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_usage_counters, migrations.RunPython.noop),
+    ]
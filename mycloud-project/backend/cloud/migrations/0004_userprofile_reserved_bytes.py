@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0003_userprofile_usage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='reserved_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
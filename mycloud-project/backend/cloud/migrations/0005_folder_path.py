@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def fill_folder_paths(apps, schema_editor):
+    Folder = apps.get_model("cloud", "Folder")
+    parents = dict(Folder.objects.values_list("id", "parent_id"))
+    paths = {}
+    detached = []
+
+    def path_of(folder_id):
+        chain = []
+        seen = set()
+        node = folder_id
+        while node is not None and node not in paths:
+            if node in seen:
+                # цикл parent, который допускал старый move: папка, на которой цикл
+                # замкнулся, становится корневой, и путь строится заново
+                parents[node] = None
+                detached.append(node)
+                return path_of(folder_id)
+            seen.add(node)
+            chain.append(node)
+            node = parents.get(node)
+        prefix = paths.get(node, "")
+        for pk in reversed(chain):
+            prefix = f"{prefix}{pk}/"
+            paths[pk] = prefix
+        return paths[folder_id]
+
+    batch = []
+    for folder in Folder.objects.only("id").iterator():
+        folder.path = path_of(folder.id)
+        folder.depth = folder.path.count("/") - 1
+        batch.append(folder)
+        if len(batch) >= 1000:
+            Folder.objects.bulk_update(batch, ["path", "depth"])
+            batch = []
+    if batch:
+        Folder.objects.bulk_update(batch, ["path", "depth"])
+    if detached:
+        Folder.objects.filter(pk__in=detached).update(parent=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0004_userprofile_reserved_bytes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=2048),
+        ),
+        migrations.RunPython(fill_folder_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+import cloud.models
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_share_tokens(apps, schema_editor):
+    ShareLink = apps.get_model("cloud", "ShareLink")
+    UserFile = apps.get_model("cloud", "UserFile")
+    Folder = apps.get_model("cloud", "Folder")
+    links = [
+        ShareLink(token=token, kind="file", owner_id=owner_id, file_id=pk)
+        for pk, owner_id, token in UserFile.objects.exclude(share_token__isnull=True).exclude(share_token="").values_list("pk", "owner_id", "share_token")
+    ]
+    links += [
+        ShareLink(token=token, kind="folder", owner_id=owner_id, folder_id=pk)
+        for pk, owner_id, token in Folder.objects.exclude(share_token__isnull=True).exclude(share_token="").values_list("pk", "owner_id", "share_token")
+    ]
+    ShareLink.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0007_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShareLink',
+            fields=[
+                ('token', models.CharField(default=cloud.models.generate_share_token, editable=False, max_length=64, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('file', 'Файл'), ('folder', 'Папка')], max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('max_downloads', models.BigIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)])),
+                ('download_count', models.BigIntegerField(default=0)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='share_links', to='cloud.userfile')),
+                ('folder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='share_links', to='cloud.folder')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='share_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.RunPython(copy_share_tokens, migrations.RunPython.noop),
+    ]
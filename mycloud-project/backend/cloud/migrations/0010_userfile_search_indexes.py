@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+from django.db import migrations
+
+# выражения должны совпадать с запросами cloud/search.py (FULLTEXT_DOCUMENT и UPPER(...) из istartswith/icontains)
+FULLTEXT_DOCUMENT = "to_tsvector('simple', coalesce(original_name, '') || ' ' || coalesce(comment, ''))"
+INDEXES = {
+    "cloud_userfile_owner_name_trgm": "gin (owner_id, (UPPER(original_name::text)) gin_trgm_ops)",
+    "cloud_userfile_owner_comment_trgm": "gin (owner_id, (UPPER(comment)) gin_trgm_ops)",
+    "cloud_userfile_owner_fulltext": f"gin (owner_id, ({FULLTEXT_DOCUMENT}))",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN-индексы с pg_trgm/btree_gin есть только в PostgreSQL; на остальных СУБД поиск работает без них
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    for name, definition in INDEXES.items():
+        # CONCURRENTLY — таблица файлов не блокируется на запись, пока строится индекс
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON cloud_userfile USING {definition}")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('cloud', '0009_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0010_userfile_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='folder',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='cloud.folder'),
+        ),
+        migrations.AlterField(
+            model_name='folder',
+            name='share_token',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='userfile',
+            name='folder',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='files', to='cloud.folder'),
+        ),
+        migrations.AlterField(
+            model_name='userfile',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='files', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='userfile',
+            name='share_token',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['parent', 'name'], name='folder_parent_name'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'folder', '-uploaded_at'], name='userfile_owner_folder_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['folder', '-uploaded_at'], name='userfile_folder_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', '-uploaded_at', '-id'], name='userfile_owner_recent'),
+        ),
+        migrations.AddConstraint(
+            model_name='folder',
+            constraint=models.UniqueConstraint(condition=models.Q(('share_token__isnull', False)), fields=('share_token',), name='folder_share_token_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='userfile',
+            constraint=models.UniqueConstraint(condition=models.Q(('share_token__isnull', False)), fields=('share_token',), name='userfile_share_token_uniq'),
+        ),
+    ]
@@ -1,11 +1,15 @@
 import os
+import secrets
 import uuid
+from collections import Counter, defaultdict
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth import get_user_model
-from django.utils import timezone
 from django.dispatch import receiver
 from django.db.models.signals import post_delete, post_save
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 
 User = get_user_model()
@@ -25,80 +29,298 @@ def user_file_upload_to(instance, filename):
 class UserProfile(models.Model):
     """
     Профиль пользователя: хранит квоту и отображаемое полное имя.
-    used_bytes вычисляется по файлам (не хранится).
+    used_bytes и files_count — материализованные счётчики по файлам
+    пользователя; меняются атомарно через adjust_usage, расхождения
+    исправляет команда reconcile_usage. reserved_bytes — квота, занятая
+    загрузками, которые ещё не завершились (см. reserve_bytes).
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     full_name = models.CharField(max_length=255, blank=True)
     quota = models.BigIntegerField(default=getattr(settings, "USER_DEFAULT_QUOTA", 10 * 1024 * 1024 * 1024), validators=[MinValueValidator(0)])
+    used_bytes = models.BigIntegerField(default=0)
+    files_count = models.BigIntegerField(default=0)
+    reserved_bytes = models.BigIntegerField(default=0)
+    # номер последнего события журнала изменений пользователя (см. changes.py)
+    change_seq = models.BigIntegerField(default=0)
 
     def __str__(self):
         return f"profile:{self.user.username}"
 
-    def get_used_bytes(self):
-        # суммируем size у всех файлов пользователя
-        try:
-            ag = self.user.files.aggregate(total=models.Sum("size"))
-            return int(ag["total"] or 0)
-        except Exception:
-            return 0
+    @classmethod
+    def adjust_usage(cls, user_id, bytes_delta=0, files_delta=0):
+        # один UPDATE с F-выражениями: без чтения строки и без потерянных инкрементов
+        if not bytes_delta and not files_delta:
+            return
+        cls.objects.filter(user_id=user_id).update(
+            used_bytes=F("used_bytes") + bytes_delta,
+            files_count=F("files_count") + files_delta,
+        )
 
-    @property
-    def used_bytes(self):
-        return self.get_used_bytes()
+    @classmethod
+    def reserve_bytes(cls, user_id, size):
+        """
+        Резервирует size байт квоты до записи файла.
+        Условный UPDATE: проверка и резерв — одна операция, строка
+        блокируется только на время этого запроса. False — квота превышена.
+        """
+        return bool(
+            cls.objects.filter(
+                user_id=user_id,
+                quota__gte=F("used_bytes") + F("reserved_bytes") + size,
+            ).update(reserved_bytes=F("reserved_bytes") + size)
+        )
+
+    @classmethod
+    def release_bytes(cls, user_id, size):
+        # запись не удалась — возвращаем резерв
+        cls.objects.filter(user_id=user_id).update(reserved_bytes=F("reserved_bytes") - size)
+
+    @classmethod
+    def commit_reserved(cls, user_id, size, files_delta=1):
+        # файл сохранён — переносим резерв в used_bytes
+        cls.objects.filter(user_id=user_id).update(
+            reserved_bytes=F("reserved_bytes") - size,
+            used_bytes=F("used_bytes") + size,
+            files_count=F("files_count") + files_delta,
+        )
+
+    @classmethod
+    def advance_change_seq(cls, user_id, count):
+        """
+        Выделяет count номеров журнала изменений и возвращает последний.
+        UPDATE блокирует строку профиля до конца транзакции — события
+        пользователя фиксируются строго в порядке номеров.
+        """
+        if not cls.objects.filter(user_id=user_id).update(change_seq=F("change_seq") + count):
+            cls.objects.get_or_create(user_id=user_id)
+            cls.objects.filter(user_id=user_id).update(change_seq=F("change_seq") + count)
+        return cls.objects.filter(user_id=user_id).values_list("change_seq", flat=True).get()
+
+    def get_used_bytes(self):
+        return int(self.used_bytes or 0)
 
     def remaining_bytes(self):
-        used = self.get_used_bytes()
+        used = self.get_used_bytes() + int(self.reserved_bytes or 0)
         return max(0, self.quota - used)
 
 class Folder(models.Model):
+    """
+    Папка пользователя.
+    path — материализованный путь из id предков и самой папки ("1/5/9/"),
+    depth — уровень вложенности (0 у корневых). Поддерево папки выбирается
+    одним индексированным запросом path LIKE '<path>%'. Оба поля
+    пересчитываются в save() при смене родителя, для всего поддерева сразу.
+    """
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="folders")
     name = models.CharField(max_length=255)
-    parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="children")
+    # отдельный индекс не нужен: parent_id — первая колонка folder_parent_name
+    parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="children", db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     is_shared = models.BooleanField(default=False)
-    share_token = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    share_token = models.CharField(max_length=64, null=True, blank=True)
+    path = models.CharField(max_length=2048, blank=True, default="", db_index=True, editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("owner", "parent", "name")
         ordering = ("-created_at", "name")
+        indexes = [
+            # подпапки по имени (children, дерево); корневые папки владельца обслуживает индекс unique_together
+            models.Index(fields=["parent", "name"], name="folder_parent_name"),
+        ]
+        constraints = [
+            # частичный индекс: строки без ссылки (почти все) в него не попадают
+            models.UniqueConstraint(
+                fields=["share_token"], name="folder_share_token_uniq", condition=models.Q(share_token__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} (owner={self.owner_id})"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        moving = self.parent_id and self.path and (update_fields is None or "parent" in update_fields)
+        with transaction.atomic():
+            if moving:
+                Folder.lock_for_move([self], self.parent)
+                if not self.can_move_to(self.parent):
+                    raise ValidationError("Нельзя переместить папку внутрь самой себя")
+            super().save(*args, **kwargs)
+            parent_path = self.parent.path if self.parent_id else ""
+            new_path = f"{parent_path}{self.pk}/"
+            if new_path != self.path:
+                self._rebase_subtree(new_path)
+
+    def _rebase_subtree(self, new_path):
+        # один UPDATE на всё поддерево: заменяем префикс пути и сдвигаем глубину
+        old_path = self.path
+        new_depth = new_path.count("/") - 1
+        if old_path:
+            Folder.objects.filter(path__startswith=old_path).update(
+                path=Concat(Value(new_path), Substr("path", len(old_path) + 1), output_field=models.CharField()),
+                depth=F("depth") + (new_depth - self.depth),
+            )
+        else:
+            Folder.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path = new_path
+        self.depth = new_depth
+
+    def can_move_to(self, parent):
+        # цель внутри собственного поддерева дала бы цикл; path уже загружен — без запросов
+        return parent is None or not parent.path.startswith(self.path)
+
+    @staticmethod
+    def lock_for_move(folders, parent):
+        """
+        Перед перемещением блокирует папки, цель и её предков (в порядке id —
+        встречные перемещения ждут друг друга) и перечитывает их path:
+        can_move_to видит результат уже завершённых перемещений.
+        Вызывается внутри транзакции.
+        """
+        nodes = list(folders) + ([parent] if parent is not None else [])
+        locked = set()
+        while True:
+            ids = {folder.pk for folder in folders}
+            if parent is not None:
+                ids.update(parent.get_ancestor_ids())
+                ids.add(parent.pk)
+            if ids <= locked:
+                return
+            # цель могла переехать, пока мы ждали блокировку, — тогда блокируем и новых предков
+            list(Folder.objects.select_for_update().filter(pk__in=ids - locked).order_by("pk").values_list("pk", flat=True))
+            locked |= ids
+            for node in nodes:
+                node.refresh_from_db(fields=["path", "depth"])
+
+    def move_to(self, parent):
+        self.parent = parent
+        self.save(update_fields=["parent"])
+
+    def subtree(self):
+        """Папка и все её потомки."""
+        return Folder.objects.filter(path__startswith=self.path)
+
+    def get_descendant_ids(self):
+        return list(self.subtree().values_list("id", flat=True))
+
+    def get_ancestor_ids(self):
+        return [int(part) for part in self.path.split("/") if part]
+
     def get_path(self):
-        parts = []
-        node = self
-        while node:
-            parts.append(node.name)
-            node = node.parent
-        return "/".join(reversed(parts))
-
-    def generate_share_token(self):
-        self.share_token = uuid.uuid4().hex
-        self.is_shared = True
-        self.save(update_fields=["share_token", "is_shared"])
-        return self.share_token
+        ids = self.get_ancestor_ids()
+        names = dict(Folder.objects.filter(pk__in=ids).values_list("id", "name"))
+        return "/".join(names.get(pk, "") for pk in ids)
+
+    def generate_share_token(self, expires_at=None, max_downloads=None):
+        from .sharing import share
+        return share(self, expires_at=expires_at, max_downloads=max_downloads).token
 
     def revoke_share(self):
-        self.share_token = None
-        self.is_shared = False
-        self.save(update_fields=["share_token", "is_shared"])
+        from .sharing import revoke
+        revoke(self)
+
+class Blob(models.Model):
+    """
+    Содержимое файла, адресуемое по SHA-256. Одинаковые файлы (в том числе
+    разных пользователей) хранятся на диске один раз; refcount — сколько
+    UserFile на него ссылаются. Байты удаляются, когда счётчик доходит до
+    нуля (см. release). Квота пользователей считается по логическому
+    размеру файлов, дедупликация её не меняет.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    file_name = models.CharField(max_length=1024)
+    refcount = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"blob:{self.sha256} x{self.refcount}"
+
+    @classmethod
+    def acquire(cls, sha256, count=1):
+        """+count ссылок на существующий blob. Возвращает blob или None, если его нет."""
+        with transaction.atomic():
+            if not cls.objects.filter(pk=sha256).update(refcount=F("refcount") + count):
+                return None
+            # строка заблокирована UPDATE до конца транзакции — удалить её никто не успеет
+            return cls.objects.get(pk=sha256)
+
+    @staticmethod
+    def _group_by_count(sha256_list):
+        # {n: [sha256, ...]} — по одному UPDATE на каждое встречающееся число ссылок
+        counts = defaultdict(list)
+        for sha256, count in Counter(pk for pk in sha256_list if pk).items():
+            counts[count].append(sha256)
+        return counts
+
+    @classmethod
+    def retain(cls, sha256_list):
+        """
+        Добавляет по ссылке за каждый элемент списка (повторы учитываются).
+        False — часть blob уже удалена; вызывающий должен откатить транзакцию.
+        """
+        counts = cls._group_by_count(sha256_list)
+        updated = 0
+        for count, ids in counts.items():
+            updated += cls.objects.filter(pk__in=ids).update(refcount=F("refcount") + count)
+        return updated == sum(len(ids) for ids in counts.values())
+
+    @classmethod
+    def release(cls, sha256_list):
+        """
+        Снимает по ссылке за каждый элемент списка (повторы учитываются).
+        Удаляет строки, у которых не осталось ссылок, и возвращает имена
+        их файлов в хранилище — удалять байты вызывающий должен после коммита.
+        """
+        counts = cls._group_by_count(sha256_list)
+        if not counts:
+            return []
+        with transaction.atomic():
+            for count, ids in counts.items():
+                cls.objects.filter(pk__in=ids).update(refcount=F("refcount") - count)
+            # FOR UPDATE: параллельный acquire либо успел поднять счётчик, либо ждёт и не найдёт строку
+            dead = list(
+                cls.objects.select_for_update()
+                .filter(pk__in=[pk for ids in counts.values() for pk in ids], refcount__lte=0)
+                .values_list("pk", "file_name")
+            )
+            if dead:
+                cls.objects.filter(pk__in=[pk for pk, _ in dead]).delete()
+        return [name for _, name in dead]
+
 
 class UserFile(models.Model):
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="files")
-    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name="files", null=True, blank=True)
+    # отдельные индексы по FK не нужны: их покрывают составные индексы из Meta
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="files", db_index=False)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name="files", null=True, blank=True, db_index=False)
     original_name = models.CharField(max_length=1024)
     file = models.FileField(upload_to=user_file_upload_to)
+    # файлы, загруженные до появления Blob, ссылаются только на собственный file
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name="files", null=True, blank=True)
     size = models.BigIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     last_downloaded_at = models.DateTimeField(null=True, blank=True)
     comment = models.TextField(blank=True)
     is_shared = models.BooleanField(default=False)
-    share_token = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    share_token = models.CharField(max_length=64, null=True, blank=True)
     download_count = models.BigIntegerField(default=0)
 
     class Meta:
         ordering = ("-uploaded_at",)
+        indexes = [
+            # список файлов пользователя в папке (или в корне — folder IS NULL), новые сверху
+            models.Index(fields=["owner", "folder", "-uploaded_at"], name="userfile_owner_folder_recent"),
+            # постраничная выдача файлов папки (FolderViewSet.files)
+            models.Index(fields=["folder", "-uploaded_at"], name="userfile_folder_recent"),
+            # все файлы пользователя и результаты поиска, новые сверху
+            models.Index(fields=["owner", "-uploaded_at", "-id"], name="userfile_owner_recent"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["share_token"], name="userfile_share_token_uniq", condition=models.Q(share_token__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.original_name} (owner={self.owner_id})"
@@ -115,37 +337,183 @@ class UserFile(models.Model):
         except Exception:
             pass
 
-    def generate_share_token(self):
-        self.share_token = uuid.uuid4().hex
-        self.is_shared = True
-        self.save(update_fields=["share_token", "is_shared"])
-        return self.share_token
+    def generate_share_token(self, expires_at=None, max_downloads=None):
+        from .sharing import share
+        return share(self, expires_at=expires_at, max_downloads=max_downloads).token
 
     def revoke_share(self):
-        self.share_token = None
-        self.is_shared = False
-        self.save(update_fields=["share_token", "is_shared"])
+        from .sharing import revoke
+        revoke(self)
 
     def mark_downloaded(self):
-        # Увеличиваем счётчик и ставим время
-        try:
-            self.download_count = (self.download_count or 0) + 1
-            self.last_downloaded_at = timezone.now()
-            self.save(update_fields=["download_count", "last_downloaded_at"])
-        except Exception:
-            self.last_downloaded_at = timezone.now()
-            try:
-                self.save(update_fields=["last_downloaded_at"])
-            except Exception:
-                pass
+        # Счётчик увеличивается в буфере и попадает в БД пачкой (см. counters.py)
+        from .counters import record_download
+        record_download(self)
 
     def rename(self, new_name):
         self.original_name = new_name
         self.save(update_fields=["original_name"])
 
-# удаляем файл с диска при удалении записи
+def generate_share_token():
+    return secrets.token_urlsafe(16)
+
+
+class ShareLink(models.Model):
+    """
+    Публичная ссылка на файл или папку. Токен — первичный ключ, поэтому
+    внешний запрос разрешается одним поиском по PK. expires_at и
+    max_downloads необязательны. share_token у UserFile/Folder дублирует
+    токен для совместимости с API.
+    """
+    KIND_FILE = "file"
+    KIND_FOLDER = "folder"
+    KIND_CHOICES = (
+        (KIND_FILE, "Файл"),
+        (KIND_FOLDER, "Папка"),
+    )
+
+    token = models.CharField(max_length=64, primary_key=True, default=generate_share_token, editable=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="share_links")
+    file = models.ForeignKey(UserFile, on_delete=models.CASCADE, related_name="share_links", null=True, blank=True)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name="share_links", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    max_downloads = models.BigIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+    download_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"share:{self.kind}:{self.target_id}"
+
+    @property
+    def target_id(self):
+        return self.file_id if self.kind == self.KIND_FILE else self.folder_id
+
+
+class UploadSession(models.Model):
+    """
+    Возобновляемая загрузка файла по частям.
+    Квота резервируется при создании сессии, части дописываются прямо
+    в итоговый файл хранилища (file_name), offset — сколько байт уже
+    записано. После завершения файл регистрируется как UserFile без
+    повторного копирования, а сессия удаляется.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name="upload_sessions", null=True, blank=True)
+    original_name = models.CharField(max_length=1024)
+    comment = models.TextField(blank=True)
+    size = models.BigIntegerField(validators=[MinValueValidator(0)])
+    offset = models.BigIntegerField(default=0)
+    file_name = models.CharField(max_length=1024)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"upload:{self.original_name} {self.offset}/{self.size} (owner={self.owner_id})"
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.size
+
+
+class BackgroundJob(models.Model):
+    """
+    Фоновая задача (сейчас — очистка папки или пользователя).
+    Очередь хранится в БД: задачу забирает пул потоков веб-процесса
+    или команда run_jobs, внешний брокер не нужен.
+    """
+    KIND_PURGE_FOLDER = "purge_folder"
+    KIND_PURGE_USER = "purge_user"
+    KIND_CHOICES = (
+        (KIND_PURGE_FOLDER, "Очистка папки"),
+        (KIND_PURGE_USER, "Очистка пользователя"),
+    )
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Выполняется"),
+        (STATUS_DONE, "Завершена"),
+        (STATUS_FAILED, "Ошибка"),
+    )
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    # id папки или пользователя; не FK — объект удаляется самой задачей
+    target_id = models.BigIntegerField()
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="jobs")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    files_deleted = models.BigIntegerField(default=0)
+    folders_deleted = models.BigIntegerField(default=0)
+    bytes_freed = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # аренда исполнителя: обновляется после каждой пачки, см. jobs.requeue_stale
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.kind}:{self.target_id} ({self.status})"
+
+class ChangeEvent(models.Model):
+    """
+    Событие журнала изменений: папка или файл пользователя создан, изменён
+    (имя, комментарий, родитель, ссылка) или удалён. seq — номер события у
+    владельца, подряд и без пропусков (см. changes.py).
+    """
+    KIND_FOLDER = "folder"
+    KIND_FILE = "file"
+    KIND_CHOICES = (
+        (KIND_FOLDER, "Папка"),
+        (KIND_FILE, "Файл"),
+    )
+
+    ACTION_CREATE = "create"
+    ACTION_UPDATE = "update"
+    ACTION_DELETE = "delete"
+    ACTION_CHOICES = (
+        (ACTION_CREATE, "Создание"),
+        (ACTION_UPDATE, "Изменение"),
+        (ACTION_DELETE, "Удаление"),
+    )
+
+    # отдельный индекс не нужен: owner_id — первая колонка changeevent_owner_seq_uniq
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+", db_index=False)
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES)
+    # не FK — после удаления объекта событие остаётся
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "seq"], name="changeevent_owner_seq_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id}#{self.seq} {self.action} {self.kind}:{self.object_id}"
+
+# удаляем файл с диска при удалении записи; общий blob — только когда на него больше никто не ссылается
 @receiver(post_delete, sender=UserFile)
 def delete_file_on_record_delete(sender, instance, **kwargs):
+    if instance.blob_id:
+        from .blobs import unlink_after_commit
+        unlink_after_commit(Blob.release([instance.blob_id]))
+        return
     try:
         if instance.file:
             storage = instance.file.storage
@@ -159,3 +527,20 @@ def delete_file_on_record_delete(sender, instance, **kwargs):
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance, quota=getattr(settings, "USER_DEFAULT_QUOTA", 10 * 1024 * 1024 * 1024))
+
+# журнал изменений: одиночные save()/delete() папок и файлов; массовые операции пишут журнал сами
+@receiver(post_save, sender=Folder)
+@receiver(post_save, sender=UserFile)
+def record_change_on_save(sender, instance, created, **kwargs):
+    from .changes import kind_of, record
+    record(instance.owner_id, kind_of(sender), ChangeEvent.ACTION_CREATE if created else ChangeEvent.ACTION_UPDATE, [instance.pk])
+
+
+@receiver(post_delete, sender=Folder)
+@receiver(post_delete, sender=UserFile)
+def record_change_on_delete(sender, instance, origin=None, **kwargs):
+    # каскад от удаления пользователя: журнал удаляется вместе с ним
+    if isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    from .changes import kind_of, record
+    record(instance.owner_id, kind_of(sender), ChangeEvent.ACTION_DELETE, [instance.pk])
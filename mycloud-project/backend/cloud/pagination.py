@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class FolderChildrenPagination(CursorPagination):
+    """Постраничная выдача подпапок: имена уникальны в пределах родителя."""
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "name"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по полям ordering, уникальным в совокупности (последнее — id).
+    Курсор хранит значения этих полей у последней строки страницы, и следующая
+    страница выбирается условием WHERE (a, b) < (x, y) по индексу — страница N
+    стоит столько же, сколько первая, и не сдвигается при вставках. Только вперёд:
+    ответ {"next": url | null, "results": [...]}.
+    """
+    ordering = ("-id",)
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self._after(self.parse_cursor_values(queryset.model, cursor)))
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def _after(self, values):
+        # a <= x отсекает диапазон по индексу, остальное — строгое сравнение кортежей
+        fields = [(f.lstrip("-"), "lt" if f.startswith("-") else "gt") for f in self.ordering]
+        first, first_op = fields[0]
+        tail = Q()
+        for i, (name, op) in enumerate(fields):
+            condition = Q(**{f"{name}__{op}": values[i]})
+            for (prev, _), value in zip(fields[:i], values):
+                condition &= Q(**{prev: value})
+            tail |= condition
+        return Q(**{f"{first}__{first_op}e": values[0]}) & tail
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound("Неверный курсор")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Неверный курсор")
+        return values
+
+    def parse_cursor_values(self, model, values):
+        """Значения курсора, приведённые к типам полей ordering; подделанный курсор — 404, а не 500."""
+        parsed = []
+        for field_name, value in zip(self.ordering, values):
+            if value is None or isinstance(value, (list, dict, bool)):
+                raise NotFound("Неверный курсор")
+            try:
+                value = model._meta.get_field(field_name.lstrip("-")).to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound("Неверный курсор")
+            if value is None:
+                raise NotFound("Неверный курсор")
+            parsed.append(value)
+        return parsed
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip("-"))
+            # isoformat сохраняет микросекунды — иначе курсор попадал бы между строками
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+
+class FolderFilesPagination(KeysetPagination):
+    """Постраничная выдача файлов папки, новые сверху."""
+    ordering = ("-uploaded_at", "-id")
+
+
+class UserFilePagination(KeysetPagination):
+    """Список файлов пользователя (UserFileViewSet.list), новые сверху."""
+    ordering = ("-uploaded_at", "-id")
+
+
+class FileSearchPagination(KeysetPagination):
+    """
+    Результаты поиска, новые сверху. Порядок по дате загрузки, а не по
+    релевантности: иначе каждую страницу пришлось бы ранжировать по всем
+    совпадениям пользователя.
+    """
+    page_size = 50
+    max_page_size = 500
+    ordering = ("-uploaded_at", "-id")
+
+
+class AdminUserPagination(KeysetPagination):
+    """Пользователи в админке по id."""
+    ordering = ("id",)
+
+
+class StorageFoldersPagination(KeysetPagination):
+    """Папки уровня в AdminUserViewSet.storage; курсор — folders_cursor."""
+    ordering = ("name", "id")
+    cursor_query_param = "folders_cursor"
+
+
+class StorageFilesPagination(KeysetPagination):
+    """Файлы уровня в AdminUserViewSet.storage; курсор — files_cursor."""
+    ordering = ("-uploaded_at", "-id")
+    cursor_query_param = "files_cursor"
@@ -0,0 +1,274 @@
+"""
+Превью файлов: уменьшенные изображения, первая страница PDF, начало текста.
+
+Запрошенный размер округляется вверх до одного из SIZES, поэтому у файла
+не больше len(SIZES) превью. Превью рендерятся в пуле процессов
+(CLOUD_PREVIEW_WORKERS) после загрузки файла или при первом запросе и
+кэшируются на диске в CLOUD_PREVIEW_ROOT. Ключ — содержимое файла: sha256
+blob (одинаковые файлы разных пользователей делят превью), для файлов без
+blob — id и время загрузки. Кэш ограничен CLOUD_PREVIEW_CACHE_BYTES: при
+переполнении удаляются давно не запрошенные превью (mtime обновляется при
+каждой отдаче). Превью удалённых файлов больше не запрашиваются и уходят
+из кэша тем же путём.
+"""
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import mimetypes
+import multiprocessing
+import os
+import shutil
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from . import thumbnails
+
+logger = logging.getLogger(__name__)
+
+SIZES = (128, 256, 512, 1024)
+DEFAULT_SIZE = 256
+IMAGE_TYPES = frozenset({"image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp", "image/tiff"})
+TEXT_EXTENSIONS = frozenset({
+    ".txt", ".md", ".csv", ".tsv", ".log", ".json", ".xml", ".yaml", ".yml", ".ini", ".cfg", ".toml",
+    ".py", ".js", ".ts", ".jsx", ".html", ".css", ".sql", ".sh",
+})
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".txt": "text/plain; charset=utf-8",
+}
+# после очистки кэш заполнен не больше чем на эту долю — чтобы не чистить на каждом превью
+EVICT_TO = 0.9
+
+
+class PreviewUnavailable(Exception):
+    """Превью не удалось построить (повреждённый файл, ошибка рендеринга)."""
+
+
+class PreviewNotReady(Exception):
+    """Превью не успело построиться за CLOUD_PREVIEW_TIMEOUT."""
+
+
+def preview_kind(name):
+    """"image", "pdf", "text" или None, если превью для такого файла не строится."""
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding:
+        return None
+    if content_type in IMAGE_TYPES and thumbnails.Image is not None:
+        return "image"
+    if content_type == "application/pdf" and thumbnails.Image is not None and shutil.which("pdftoppm"):
+        return "pdf"
+    if (content_type or "").startswith("text/") or os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS:
+        return "text"
+    return None
+
+
+def size_bucket(size):
+    for bucket in SIZES:
+        if size <= bucket:
+            return bucket
+    return SIZES[-1]
+
+
+def cache_key(userfile, kind, size):
+    ident = userfile.blob_id or f"file{userfile.pk}-{int(userfile.uploaded_at.timestamp())}"
+    # начало текста от размера не зависит
+    return f"{ident}-{'text' if kind == 'text' else size}"
+
+
+def _render_size(kind, size):
+    return getattr(settings, "CLOUD_PREVIEW_TEXT_BYTES", 4096) if kind == "text" else size
+
+
+class PreviewCache:
+    """Дисковый LRU-кэш превью и пул процессов, который их строит."""
+
+    def __init__(self, root, max_bytes, workers):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pool = None
+        # занятый объём; None — ещё не подсчитан (подсчитывается при первой очистке)
+        self._total = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: рабочие процессы не наследуют соединения с БД и потоки Django
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def base_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def find(self, key):
+        """Путь к готовому превью или None. Попадание обновляет mtime — время последнего доступа для LRU."""
+        base = self.base_path(key)
+        for ext in CONTENT_TYPES:
+            try:
+                os.utime(base + ext)
+            except FileNotFoundError:
+                continue
+            return base + ext
+        return None
+
+    def _reset_pool(self, broken):
+        # рабочий процесс убит (например, OOM на огромном изображении) — пул больше не принимает задачи
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+
+    def submit(self, key, kind, source, size):
+        """Ставит превью в очередь пула; повторный запрос того же ключа ждёт ту же задачу."""
+        executor = self._executor()
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            try:
+                future = executor.submit(thumbnails.render, kind, source, self.base_path(key), size)
+            except concurrent.futures.process.BrokenProcessPool:
+                future = None
+            if future is not None:
+                self._pending[key] = future
+        if future is None:
+            self._reset_pool(executor)
+            return self.submit(key, kind, source, size)
+        future.add_done_callback(lambda done: self._finished(key, executor, done))
+        return future
+
+    def _finished(self, key, executor, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        error = future.exception()
+        if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+            self._reset_pool(executor)
+        if error is not None:
+            logger.warning("previews: не удалось построить %s: %s", key, error)
+            return
+        try:
+            added = os.path.getsize(future.result())
+        except OSError:
+            return
+        with self._lock:
+            if self._total is not None:
+                self._total += added
+            over = self._total is None or self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        try:
+            shards = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return []
+        entries = []
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                # временные файлы и каталоги рендеринга не трогаем
+                if entry.is_file() and os.path.splitext(entry.name)[1] in CONTENT_TYPES:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Удаляет самые давно запрошенные превью, пока кэш больше бюджета."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            entries.sort()
+            limit = self.max_bytes * EVICT_TO
+            for _, size, path in entries:
+                if total <= limit:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._total = total
+
+    def get(self, key, kind, source, size, timeout):
+        """Путь к превью: из кэша или после рендеринга (ждём не дольше timeout)."""
+        path = self.find(key)
+        if path is not None:
+            return path
+        future = self.submit(key, kind, source, size)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise PreviewNotReady(key)
+        except Exception as exc:
+            raise PreviewUnavailable(key) from exc
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PreviewCache(
+                root=getattr(settings, "CLOUD_PREVIEW_ROOT", os.path.join(settings.MEDIA_ROOT, "previews")),
+                max_bytes=getattr(settings, "CLOUD_PREVIEW_CACHE_BYTES", 1024 * 1024 * 1024),
+                workers=getattr(settings, "CLOUD_PREVIEW_WORKERS", 2),
+            )
+        return _cache
+
+
+def _source_path(userfile):
+    return userfile.file.storage.path(userfile.file.name)
+
+
+def schedule(userfile):
+    """Строит превью размера DEFAULT_SIZE после коммита загрузки, если это включено и тип поддерживается."""
+    if not getattr(settings, "CLOUD_PREVIEW_ON_UPLOAD", True):
+        return
+    kind = preview_kind(userfile.original_name)
+    if kind is None or not userfile.file:
+        return
+    key = cache_key(userfile, kind, DEFAULT_SIZE)
+    source = _source_path(userfile)
+    transaction.on_commit(lambda: get_cache().submit(key, kind, source, _render_size(kind, DEFAULT_SIZE)))
+
+
+def preview_response(request, userfile, kind, size):
+    """
+    Ответ с превью. 304 по If-None-Match — без обращения к кэшу.
+    PreviewNotReady / PreviewUnavailable — обрабатывает вызывающий view.
+    """
+    size = size_bucket(size)
+    key = cache_key(userfile, kind, size)
+    etag = quote_etag(key)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache = get_cache()
+        timeout = getattr(settings, "CLOUD_PREVIEW_TIMEOUT", 20)
+        path = cache.get(key, kind, _source_path(userfile), _render_size(kind, size), timeout)
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            # превью вытеснили между проверкой и открытием — строим заново
+            fh = open(cache.get(key, kind, _source_path(userfile), _render_size(kind, size), timeout), "rb")
+        response = FileResponse(fh, content_type=CONTENT_TYPES[os.path.splitext(fh.name)[1]])
+    response["ETag"] = etag
+    # содержимое по ключу не меняется, но доступ к файлу может отозваться — только приватный кэш
+    patch_cache_control(response, private=True, max_age=86400)
+    return response
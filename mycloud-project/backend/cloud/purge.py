@@ -0,0 +1,149 @@
+"""
+Пакетное удаление файлов и папок.
+
+В отличие от QuerySet.delete() строки не загружаются в память целиком
+и не проходят через сигналы: каждая пачка удаляется одним DELETE ... WHERE
+id IN (...), счётчики использования владельцев правятся одним UPDATE на
+владельца, а файлы с диска удаляются пулом потоков.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import changes
+from .models import Blob, ChangeEvent, Folder, ShareLink, UploadSession, UserFile, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_size():
+    return getattr(settings, "CLOUD_PURGE_CHUNK_SIZE", 1000)
+
+
+def raw_delete(model, ids):
+    if not ids:
+        return 0
+    qn = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({placeholders})",
+            list(ids),
+        )
+        return cursor.rowcount
+
+
+def _unlink(storage, name):
+    try:
+        storage.delete(name)
+    except Exception:
+        logger.warning("purge: не удалось удалить %s", name, exc_info=True)
+
+
+# колонки строки файла, с которыми работает _delete_file_rows
+FILE_COLUMNS = ("pk", "owner_id", "size", "file", "blob_id")
+
+
+def _delete_file_rows(rows):
+    """
+    Удаляет строки файлов (FILE_COLUMNS) в текущей транзакции.
+    Возвращает (имена файлов для удаления с диска, освобождённые байты).
+    """
+    usage = defaultdict(lambda: [0, 0])
+    for _, owner_id, size, _, _ in rows:
+        usage[owner_id][0] += size or 0
+        usage[owner_id][1] += 1
+    ids = [row[0] for row in rows]
+    # raw DELETE не каскадирует — зависимые строки убираем сами
+    ShareLink.objects.filter(file_id__in=ids).delete()
+    raw_delete(UserFile, ids)
+    for owner_id, (size, count) in usage.items():
+        UserProfile.adjust_usage(owner_id, -size, -count)
+    changes.record_rows(ChangeEvent.KIND_FILE, ChangeEvent.ACTION_DELETE, [row[:2] for row in rows])
+    # байты blob удаляются, только если на них больше никто не ссылается
+    names = Blob.release([blob_id for *_, blob_id in rows])
+    names += [name for _, _, _, name, blob_id in rows if name and not blob_id]
+    return names, sum(size for size, _ in usage.values())
+
+
+def delete_files(files_qs, progress=None):
+    """
+    Удаляет файлы из queryset пачками. progress(files, bytes) вызывается
+    после каждой пачки. Возвращает (количество файлов, освобождённые байты).
+    """
+    storage = UserFile._meta.get_field("file").storage
+    deleted = freed = 0
+    workers = getattr(settings, "CLOUD_PURGE_UNLINK_WORKERS", 8)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="purge-unlink") as pool:
+        while True:
+            with transaction.atomic():
+                # строки пачки блокируются: задача, перезапущенная после истёкшей аренды,
+                # не удалит их второй раз и не спишет использование дважды
+                rows = list(
+                    files_qs.select_for_update(of=("self",))
+                    .order_by("pk")
+                    .values_list(*FILE_COLUMNS)[:_chunk_size()]
+                )
+                if not rows:
+                    break
+                names, size = _delete_file_rows(rows)
+            for name in names:
+                pool.submit(_unlink, storage, name)
+            deleted += len(rows)
+            freed += size
+            if progress:
+                progress(deleted, freed)
+    return deleted, freed
+
+
+def delete_upload_sessions(sessions_qs):
+    """
+    Незавершённые загрузки удаляемых папок или пользователя: возвращает
+    резерв квоты и удаляет частичные файлы (после коммита текущей транзакции).
+    """
+    storage = UserFile._meta.get_field("file").storage
+    for session in sessions_qs.only("pk", "owner_id", "size", "file_name"):
+        if UploadSession.objects.filter(pk=session.pk).delete()[0]:
+            UserProfile.release_bytes(session.owner_id, session.size)
+            transaction.on_commit(partial(_unlink, storage, session.file_name))
+
+
+def delete_folders(folders_qs, progress=None):
+    """
+    Удаляет папки пачками, начиная с самых глубоких, чтобы дочерние
+    строки всегда уходили раньше родительских. Основную массу файлов
+    удаляет delete_files заранее; то, что загрузили в папки уже после
+    этого, удаляется вместе с пачкой папок.
+    """
+    storage = UserFile._meta.get_field("file").storage
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            # блокировка папок держит новые загрузки в них (проверка FK ждёт коммита),
+            # а всё, что успело появиться до блокировки, видно повторной выборкой ниже
+            rows = list(
+                folders_qs.select_for_update(of=("self",))
+                .order_by("-depth", "pk")
+                .values_list("pk", "owner_id")[:_chunk_size()]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _ in rows]
+            names = []
+            late_files = list(UserFile.objects.filter(folder_id__in=ids).values_list(*FILE_COLUMNS))
+            if late_files:
+                names, _ = _delete_file_rows(late_files)
+            delete_upload_sessions(UploadSession.objects.filter(folder_id__in=ids))
+            ShareLink.objects.filter(folder_id__in=ids).delete()
+            raw_delete(Folder, ids)
+            changes.record_rows(ChangeEvent.KIND_FOLDER, ChangeEvent.ACTION_DELETE, rows)
+        for name in names:
+            _unlink(storage, name)
+        deleted += len(ids)
+        if progress:
+            progress(deleted)
+    return deleted
@@ -0,0 +1,46 @@
+"""
+Поиск файлов пользователя по имени и комментарию.
+
+Режимы (?mode=):
+  "prefix"    — имя начинается с q;
+  "substring" — q встречается в имени или комментарии (по умолчанию);
+  "fulltext"  — все слова q есть в имени или комментарии.
+
+На PostgreSQL запросы попадают в индексы миграции 0010: GIN (btree_gin +
+pg_trgm) по (owner_id, UPPER(имя)) и (owner_id, UPPER(комментарий)) —
+под них Django строит istartswith/icontains — и (owner_id, tsvector имени
+и комментария). Выражения индексов и запросов должны совпадать буквально:
+FULLTEXT_DOCUMENT повторён в миграции 0010 и меняется только вместе с
+новой миграцией индекса. На других СУБД (SQLite в разработке)
+полнотекстовый режим сводится к icontains по каждому слову.
+"""
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+MODES = ("prefix", "substring", "fulltext")
+FULLTEXT_CONFIG = "simple"
+FULLTEXT_DOCUMENT = (
+    f"to_tsvector('{FULLTEXT_CONFIG}', coalesce(original_name, '') || ' ' || coalesce(comment, ''))"
+)
+
+
+def search_files(qs, q, mode="substring"):
+    q = q.strip()
+    if mode == "prefix":
+        return qs.filter(original_name__istartswith=q)
+    if mode == "fulltext":
+        if connection.vendor == "postgresql":
+            # колонки без имени таблицы — так выражение совпадает с индексом
+            return qs.filter(
+                RawSQL(
+                    f"{FULLTEXT_DOCUMENT} @@ plainto_tsquery('{FULLTEXT_CONFIG}', %s)",
+                    [q],
+                    output_field=BooleanField(),
+                )
+            )
+        condition = Q()
+        for word in q.split():
+            condition &= Q(original_name__icontains=word) | Q(comment__icontains=word)
+        return qs.filter(condition)
+    return qs.filter(Q(original_name__icontains=q) | Q(comment__icontains=q))
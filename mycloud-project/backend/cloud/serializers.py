@@ -1,9 +1,11 @@
 import re
 from django.contrib.auth import get_user_model, authenticate
 from django.core.validators import validate_email
-from django.db.models import Sum
+from collections import defaultdict
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
-from .models import Folder, UserFile, UserProfile
+from .models import BackgroundJob, Folder, UploadSession, UserFile, UserProfile
 
 User = get_user_model()
 
@@ -72,21 +74,129 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    used_bytes = serializers.SerializerMethodField()
-
     class Meta:
         model = UserProfile
-        fields = ("id", "quota", "used_bytes", "full_name")
-
-    def get_used_bytes(self, obj):
-        try:
-            return obj.get_used_bytes()
-        except Exception:
-            try:
-                ag = obj.user.files.aggregate(total=Sum("size"))
-                return int(ag["total"] or 0)
-            except Exception:
-                return 0
+        fields = ("id", "quota", "used_bytes", "files_count", "full_name")
+        read_only_fields = ("used_bytes", "files_count")
+
+
+def _count_subquery(model, fk):
+    qs = model.objects.filter(**{fk: OuterRef("pk")}).order_by().values(fk).annotate(c=Count("pk")).values("c")
+    return Coalesce(Subquery(qs), 0)
+
+
+def folder_queryset():
+    """
+    Папки вместе с владельцем, профилем и счётчиками детей/файлов —
+    всё, что нужно FolderSerializer, без запросов на каждый узел.
+    """
+    return Folder.objects.select_related("owner__profile").annotate(
+        num_files=_count_subquery(UserFile, "folder"),
+        num_children=_count_subquery(Folder, "parent"),
+    )
+
+
+def file_queryset():
+    return UserFile.objects.select_related("owner__profile")
+
+
+class FolderTree:
+    """
+    Индекс дерева папок для вложенной сериализации.
+
+    При первом обращении к папке загружает её поддерево — папки и файлы
+    (по запросу, path LIKE '<path>%') — и дальше раскладывает детей по
+    parent_id в памяти. prefetch загружает поддеревья всего списка сразу.
+    Пустые папки (по счётчикам folder_queryset) не загружаются вовсе.
+    Передаётся в контексте сериализатора под ключом "folder_tree".
+
+    depth ограничивает глубину раскрытия (None — всё дерево), include_files
+    отключает вложенные списки файлов. При ограниченной глубине prefetch
+    загружает только нужные уровни — по запросу на уровень.
+    """
+
+    def __init__(self, depth=None, include_files=True):
+        self.depth = depth
+        self.include_files = include_files
+        self._loaded = set()
+        self._seen_folders = set()
+        self._seen_files = set()
+        self._expanded = set()
+        self._children = defaultdict(list)
+        self._files = defaultdict(list)
+
+    @classmethod
+    def for_folders(cls, folders, **options):
+        """Индекс с заранее загруженными поддеревьями folders."""
+        tree = cls(**options)
+        tree.prefetch(folders)
+        return tree
+
+    def prefetch(self, folders):
+        if self.depth is None:
+            self._load(folders)
+            return
+        frontier = [f.pk for f in folders]
+        for _ in range(self.depth):
+            if not frontier:
+                break
+            self._expanded.update(frontier)
+            children = list(folder_queryset().filter(parent_id__in=frontier).order_by("name"))
+            for folder in children:
+                self._children[folder.parent_id].append(folder)
+            if self.include_files:
+                for f in file_queryset().filter(folder_id__in=frontier).order_by("-uploaded_at"):
+                    self._files[f.folder_id].append(f)
+            frontier = [c.pk for c in children]
+
+    def is_expanded(self, level):
+        return self.depth is None or level < self.depth
+
+    def _is_loaded(self, path):
+        # загружено ли поддерево самой папки или одного из её предков
+        prefix = ""
+        for part in path.split("/")[:-1]:
+            prefix = f"{prefix}{part}/"
+            if prefix in self._loaded:
+                return True
+        return False
+
+    def _load(self, folders):
+        paths = []
+        for folder in sorted(folders, key=lambda f: len(f.path)):
+            if getattr(folder, "num_children", None) == 0 and getattr(folder, "num_files", None) == 0:
+                continue
+            if not folder.path or self._is_loaded(folder.path):
+                continue
+            self._loaded.add(folder.path)
+            paths.append(folder.path)
+        if not paths:
+            return
+        folder_q = Q()
+        file_q = Q()
+        for path in paths:
+            folder_q |= Q(path__startswith=path)
+            file_q |= Q(folder__path__startswith=path)
+        # корни поддеревьев тоже попадают в выборку — повторно не добавляем
+        for folder in folder_queryset().filter(folder_q).order_by("name"):
+            if folder.pk not in self._seen_folders:
+                self._seen_folders.add(folder.pk)
+                self._children[folder.parent_id].append(folder)
+        if self.include_files:
+            for f in file_queryset().filter(file_q).order_by("-uploaded_at"):
+                if f.pk not in self._seen_files:
+                    self._seen_files.add(f.pk)
+                    self._files[f.folder_id].append(f)
+
+    def children_of(self, folder):
+        if folder.pk not in self._expanded:
+            self._load([folder])
+        return self._children.get(folder.pk, [])
+
+    def files_of(self, folder):
+        if folder.pk not in self._expanded:
+            self._load([folder])
+        return self._files.get(folder.pk, [])
 
 
 class FolderSerializer(serializers.ModelSerializer):
@@ -115,6 +225,11 @@ class FolderSerializer(serializers.ModelSerializer):
             "files",
         )
 
+    def validate_parent(self, value):
+        if self.instance is not None and not self.instance.can_move_to(value):
+            raise serializers.ValidationError("Нельзя переместить папку внутрь самой себя")
+        return value
+
     def get_owner_username(self, obj):
         return obj.owner.username if obj.owner else None
 
@@ -128,23 +243,41 @@ class FolderSerializer(serializers.ModelSerializer):
         return getattr(obj.owner, "first_name", None) or getattr(obj.owner, "username", None)
 
     def get_files_count(self, obj):
+        if hasattr(obj, "num_files"):
+            return obj.num_files
         try:
             return obj.files.count()
         except Exception:
             return 0
 
     def get_children_count(self, obj):
+        if hasattr(obj, "num_children"):
+            return obj.num_children
         try:
             return obj.children.count()
         except Exception:
             return 0
-        
+
     def get_children(self, obj):
-        children = Folder.objects.filter(parent=obj).order_by("name")
-        return FolderSerializer(children, many=True, context=self.context).data
+        # None — уровень не раскрыт (см. FolderTree.depth), его подгружают через /children/
+        tree = self.context.get("folder_tree")
+        level = self.context.get("level", 0)
+        if tree is not None:
+            if not tree.is_expanded(level):
+                return None
+            children = tree.children_of(obj)
+        else:
+            children = folder_queryset().filter(parent=obj).order_by("name")
+        return FolderSerializer(children, many=True, context={**self.context, "level": level + 1}).data
 
     def get_files(self, obj):
-        files = UserFile.objects.filter(folder=obj).order_by("-uploaded_at")
+        tree = self.context.get("folder_tree")
+        if tree is not None:
+            if not (tree.include_files and tree.is_expanded(self.context.get("level", 0))):
+                return None
+            files = tree.files_of(obj)
+        else:
+            files = file_queryset().filter(folder=obj).order_by("-uploaded_at")
         return UserFileSerializer(files, many=True, context=self.context).data
 
 
@@ -153,6 +286,8 @@ class UserFileSerializer(serializers.ModelSerializer):
     owner_username = serializers.SerializerMethodField()
     owner_full_name = serializers.SerializerMethodField()
     downloads_count = serializers.SerializerMethodField()
+    # контрольная сумма содержимого; null — файл ещё не переведён на blob (dedup_files)
+    sha256 = serializers.CharField(source="blob_id", read_only=True)
 
     class Meta:
         model = UserFile
@@ -170,8 +305,19 @@ class UserFileSerializer(serializers.ModelSerializer):
             "owner_full_name",
             "folder",
             "file",
+            "sha256",
+        )
+        # содержимое и размер меняются только загрузкой (create): там учитываются blob и квота
+        read_only_fields = (
+            "id",
+            "uploaded_at",
+            "last_downloaded_at",
+            "downloads_count",
+            "share_token",
+            "owner",
+            "file",
+            "size",
         )
-        read_only_fields = ("id", "uploaded_at", "last_downloaded_at", "downloads_count", "share_token", "owner")
 
     def get_owner_username(self, obj):
         return obj.owner.username if obj.owner else None
@@ -197,7 +343,37 @@ class UserFileSerializer(serializers.ModelSerializer):
             return 0
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ("id", "original_name", "comment", "folder", "size", "offset", "created_at", "updated_at")
+        read_only_fields = ("id", "offset", "created_at", "updated_at")
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BackgroundJob
+        fields = (
+            "id",
+            "kind",
+            "target_id",
+            "status",
+            "files_deleted",
+            "folders_deleted",
+            "bytes_freed",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+
 class AdminUserSerializer(serializers.ModelSerializer):
+    """
+    Все поля берутся из профиля — queryset должен быть с select_related("profile").
+    files_count/files_size — материализованные счётчики UserProfile, без COUNT/SUM по файлам.
+    """
     full_name = serializers.SerializerMethodField()
     quota = serializers.SerializerMethodField()
     files_count = serializers.SerializerMethodField()
@@ -229,14 +405,12 @@ class AdminUserSerializer(serializers.ModelSerializer):
         return profile.quota if profile else None
 
     def get_files_count(self, obj):
-        try:
-            return obj.files.count()
-        except Exception:
-            return 0
+        profile = getattr(obj, "profile", None)
+        return profile.files_count if profile else 0
 
     def get_files_size(self, obj):
-        ag = obj.files.aggregate(total=Sum("size"))
-        return int(ag["total"] or 0)
+        profile = getattr(obj, "profile", None)
+        return profile.used_bytes if profile else 0
 
     def get_storage_url(self, obj):
         request = self.context.get("request")
@@ -0,0 +1,234 @@
+"""
+Отдача содержимого UserFile.
+
+CLOUD_FILE_SERVING выбирает, кто передаёт байты клиенту:
+  "django" — FileResponse из процесса Django; WSGI-сервер с wsgi.file_wrapper
+             (gunicorn) отдаёт файл через sendfile(), блоками CLOUD_FILE_BLOCK_SIZE;
+  "nginx"  — заголовок X-Accel-Redirect на internal-location
+             CLOUD_ACCEL_REDIRECT_PREFIX, который смотрит в MEDIA_ROOT;
+  "apache" — заголовок X-Sendfile с абсолютным путём (mod_xsendfile).
+Во всех случаях Django только проверяет права и учитывает скачивание.
+
+Условные запросы (If-None-Match / If-Modified-Since) обрабатываются до
+открытия файла — 304 не трогает диск. Запросы Range (в том числе
+несколько диапазонов) в режиме "django" отдаются ответом 206, в режимах
+nginx/apache диапазоны обрабатывает веб-сервер.
+"""
+import base64
+import mimetypes
+import re
+import secrets
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+# больше диапазонов в одном запросе не обслуживаем — отдаём файл целиком
+MAX_RANGES = 16
+
+
+def _content_type(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding:
+        # как и FileResponse: сжатый файл отдаём как есть, без Content-Encoding
+        return "application/octet-stream"
+    return content_type or "application/octet-stream"
+
+
+def file_etag(userfile):
+    # содержимое UserFile после загрузки не меняется: sha256 blob, у старых файлов — id + размер + время загрузки
+    if userfile.blob_id:
+        return quote_etag(userfile.blob_id)
+    return quote_etag(f"{userfile.pk}-{userfile.size or 0:x}-{int(userfile.uploaded_at.timestamp())}")
+
+
+def repr_digest(userfile):
+    """Значение Repr-Digest (RFC 9530) — клиент может проверить скачанный файл; None без blob."""
+    if not userfile.blob_id:
+        return None
+    return "sha-256=:" + base64.b64encode(bytes.fromhex(userfile.blob_id)).decode("ascii") + ":"
+
+
+def file_last_modified(userfile):
+    return int(userfile.uploaded_at.timestamp())
+
+
+def parse_ranges(header, size):
+    """
+    Разбирает заголовок Range. Возвращает список (start, end) включительно,
+    [] — если ни один диапазон не удовлетворим, None — если заголовок
+    некорректен или его нужно проигнорировать.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    ranges = []
+    for part in header[len("bytes="):].split(","):
+        match = RANGE_RE.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first == "" and last == "":
+            return None
+        if first == "":
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(("\"", "W/")):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified <= date
+
+
+def _iter_parts(fh, parts, tail, block_size):
+    # parts: (заголовок части, start, end); файл закрывается и при обрыве соединения
+    try:
+        for head, start, end in parts:
+            if head:
+                yield head
+            fh.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = fh.read(min(block_size, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+        if tail:
+            yield tail
+    finally:
+        fh.close()
+
+
+def _range_response(userfile, ranges, content_type, block_size):
+    size = userfile.size or 0
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        parts, tail = [(b"", start, end)], b""
+        response_type = content_type
+    else:
+        boundary = secrets.token_hex(16)
+        parts = [
+            (
+                (
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("ascii"),
+                start,
+                end,
+            )
+            for start, end in ranges
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+        response_type = f"multipart/byteranges; boundary={boundary}"
+
+    fh = userfile.file.storage.open(userfile.file.name, "rb")
+    response = StreamingHttpResponse(_iter_parts(fh, parts, tail, block_size), status=206, content_type=response_type)
+    if len(ranges) == 1:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = sum(len(head) + end - start + 1 for head, start, end in parts) + len(tail)
+    response["Content-Length"] = str(length)
+    return response
+
+
+def is_new_download(request, response):
+    """
+    Считать ли ответ скачиванием: полный файл или диапазон с начала файла.
+    Повторные запросы диапазонов (перемотка видео, докачка) и 304 не считаются.
+    """
+    if response.status_code == 206:
+        return response.get("Content-Range", "").startswith("bytes 0-")
+    if response.status_code != 200:
+        return False
+    # в режимах nginx/apache диапазон обрабатывает веб-сервер, Django видит только заголовок
+    range_header = request.META.get("HTTP_RANGE", "").replace(" ", "")
+    return not range_header or range_header.startswith("bytes=0-")
+
+
+def discard(response):
+    """
+    Закрывает файл ответа, который не будет отправлен. response.close() здесь
+    не подходит: он шлёт request_finished посреди запроса.
+    """
+    for closer in response._resource_closers:
+        closer()
+    response._resource_closers.clear()
+
+
+def file_response(request, userfile, as_attachment=True):
+    etag = file_etag(userfile)
+    last_modified = file_last_modified(userfile)
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        # 304/412 — без обращения к файлу
+        response = conditional
+    else:
+        response = _body_response(request, userfile, as_attachment, etag, last_modified)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Accept-Ranges"] = "bytes"
+    digest = repr_digest(userfile)
+    if digest:
+        response["Repr-Digest"] = digest
+    return response
+
+
+def _body_response(request, userfile, as_attachment, etag, last_modified):
+    backend = getattr(settings, "CLOUD_FILE_SERVING", "django")
+    name = userfile.file.name
+    content_type = _content_type(userfile.original_name)
+    disposition = content_disposition_header(as_attachment, userfile.original_name)
+
+    if backend in ("nginx", "apache"):
+        response = HttpResponse(content_type=content_type)
+        if backend == "nginx":
+            prefix = getattr(settings, "CLOUD_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+            response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(name)
+        else:
+            response["X-Sendfile"] = userfile.file.path
+        response["Content-Disposition"] = disposition
+        return response
+
+    block_size = getattr(settings, "CLOUD_FILE_BLOCK_SIZE", FileResponse.block_size)
+    size = userfile.size or 0
+    range_header = request.META.get("HTTP_RANGE")
+    if range_header and _if_range_matches(request, etag, last_modified):
+        ranges = parse_ranges(range_header, size)
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if ranges:
+            response = _range_response(userfile, ranges, content_type, block_size)
+            response["Content-Disposition"] = disposition
+            return response
+
+    response = FileResponse(
+        userfile.file.storage.open(name, "rb"),
+        as_attachment=as_attachment,
+        filename=userfile.original_name,
+    )
+    response.block_size = block_size
+    return response
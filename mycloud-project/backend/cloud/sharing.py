@@ -0,0 +1,183 @@
+"""
+Публичные ссылки: создание, отзыв и разрешение токена.
+
+Горячие токены держатся в небольшом LRU-кэше процесса (CLOUD_SHARE_CACHE_SIZE
+записей, не дольше CLOUD_SHARE_CACHE_TTL секунд). Отзыв в этом процессе
+сбрасывает запись сразу. В других процессах отзыв тоже виден сразу: объект
+выбирается вместе с проверкой share_token, а отозванный токен там уже
+очищен. TTL ограничивает только то, как долго другие воркеры видят старые
+expires_at/max_downloads.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import changes
+from .models import ChangeEvent, Folder, ShareLink, UserFile, generate_share_token
+
+CachedLink = namedtuple("CachedLink", ["token", "kind", "target_id", "expires_at", "max_downloads", "cached_at"])
+
+
+class LinkCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, token):
+        ttl = getattr(settings, "CLOUD_SHARE_CACHE_TTL", 60)
+        with self._lock:
+            item = self._items.get(token)
+            if item is None:
+                return None
+            if time.monotonic() - item.cached_at > ttl:
+                del self._items[token]
+                return None
+            self._items.move_to_end(token)
+            return item
+
+    def put(self, item):
+        size = getattr(settings, "CLOUD_SHARE_CACHE_SIZE", 1024)
+        with self._lock:
+            self._items[item.token] = item
+            self._items.move_to_end(item.token)
+            while len(self._items) > size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._items.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+link_cache = LinkCache()
+
+
+def resolve(token):
+    """Ссылка по токену (CachedLink) или None. Промах кэша — один запрос по PK."""
+    item = link_cache.get(token)
+    if item is not None:
+        return item
+    link = ShareLink.objects.filter(pk=token).first()
+    if link is None:
+        return None
+    item = CachedLink(link.token, link.kind, link.target_id, link.expires_at, link.max_downloads, time.monotonic())
+    link_cache.put(item)
+    return item
+
+
+def is_expired(item):
+    return item.expires_at is not None and item.expires_at <= timezone.now()
+
+
+def claim_download(item):
+    """
+    Учитывает скачивание по ссылке с лимитом. False — лимит исчерпан.
+    Ссылки без лимита ничего не пишут.
+    """
+    if item.max_downloads is None:
+        return True
+    return bool(
+        ShareLink.objects.filter(pk=item.token, download_count__lt=F("max_downloads")).update(
+            download_count=F("download_count") + 1
+        )
+    )
+
+
+def _kind_of(obj):
+    return ShareLink.KIND_FILE if isinstance(obj, UserFile) else ShareLink.KIND_FOLDER
+
+
+def share(obj, expires_at=None, max_downloads=None):
+    """
+    Создаёт ссылку на UserFile или Folder либо возвращает существующую.
+    Переданные expires_at/max_downloads применяются и к существующей ссылке.
+    """
+    return share_many([obj], expires_at, max_downloads)[obj.pk]
+
+
+def share_many(objs, expires_at=None, max_downloads=None):
+    """
+    share() для списка однотипных объектов: {id объекта: ShareLink}.
+    Существующие ссылки выбираются одним запросом, новые создаются
+    bulk_create, токены в объектах пишутся одним bulk_update.
+    """
+    if not objs:
+        return {}
+    kind = _kind_of(objs[0])
+    target_field = "file_id" if kind == ShareLink.KIND_FILE else "folder_id"
+    with transaction.atomic():
+        existing = {
+            getattr(link, target_field): link
+            for link in ShareLink.objects.filter(pk__in=[obj.share_token for obj in objs if obj.share_token])
+        }
+        links, created, changed = {}, [], []
+        for obj in objs:
+            link = existing.get(obj.pk)
+            if link is None:
+                link = ShareLink(
+                    token=generate_share_token(),
+                    kind=kind,
+                    owner_id=obj.owner_id,
+                    expires_at=expires_at,
+                    max_downloads=max_downloads,
+                    **{target_field: obj.pk},
+                )
+                created.append(link)
+                obj.share_token = link.token
+                obj.is_shared = True
+                changed.append(obj)
+            links[obj.pk] = link
+        ShareLink.objects.bulk_create(created)
+        type(objs[0]).objects.bulk_update(changed, ["share_token", "is_shared"])
+        changes.record_objects(ChangeEvent.ACTION_UPDATE, changed)
+
+        if existing and (expires_at is not None or max_downloads is not None):
+            ShareLink.objects.filter(pk__in=[link.pk for link in existing.values()]).update(
+                expires_at=expires_at, max_downloads=max_downloads
+            )
+            for link in existing.values():
+                link.expires_at = expires_at
+                link.max_downloads = max_downloads
+                link_cache.invalidate(link.token)
+    return links
+
+
+def revoke(obj):
+    revoke_many([obj])
+
+
+def revoke_many(objs):
+    """Отзывает ссылки списка однотипных объектов: один DELETE и один UPDATE."""
+    if not objs:
+        return
+    kind = _kind_of(objs[0])
+    ids = [obj.pk for obj in objs]
+    with transaction.atomic():
+        ShareLink.objects.filter(**{f"{kind}_id__in": ids}).delete()
+        type(objs[0]).objects.filter(pk__in=ids).update(share_token=None, is_shared=False)
+        changes.record_objects(ChangeEvent.ACTION_UPDATE, [obj for obj in objs if obj.share_token])
+    for obj in objs:
+        if obj.share_token:
+            link_cache.invalidate(obj.share_token)
+        obj.share_token = None
+        obj.is_shared = False
+
+
+def shared_object(item):
+    """
+    Объект, на который указывает ссылка, или None.
+    Проверка share_token отсекает ссылки, отозванные в других процессах.
+    """
+    model = UserFile if item.kind == ShareLink.KIND_FILE else Folder
+    obj = model.objects.filter(pk=item.target_id, share_token=item.token).first()
+    if obj is None:
+        link_cache.invalidate(item.token)
+    return obj
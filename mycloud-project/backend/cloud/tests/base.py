@@ -0,0 +1,32 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+class CloudTestMixin:
+    """Временный MEDIA_ROOT, без превью и фоновых потоков задач."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp(prefix="cloud-tests-")
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CLOUD_PREVIEW_ON_UPLOAD=False,
+            CLOUD_JOBS_BACKEND="worker",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_user(self, username, **extra):
+        return User.objects.create_user(username=username, password="Passw0rd!", **extra)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
@@ -0,0 +1,63 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from cloud.models import Blob, UserFile
+
+from .base import CloudTestMixin
+
+
+class SharedBlobTests(CloudTestMixin, TestCase):
+    def upload(self, client, content, name="a.txt"):
+        response = client.post("/api/files/", {"file": SimpleUploadedFile(name, content)}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def test_purge_keeps_blob_of_other_owner(self):
+        alice, bob = self.make_user("alice"), self.make_user("bob")
+        alice_client, bob_client = self.client_for(alice), self.client_for(bob)
+        alice_file = self.upload(alice_client, b"same bytes")
+        bob_file = self.upload(bob_client, b"same bytes")
+        blob = Blob.objects.get()
+        self.assertEqual(blob.refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = alice_client.delete(f"/api/files/{alice_file}/purge/")
+        self.assertEqual(response.status_code, 204)
+
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertTrue(UserFile.objects.get(pk=bob_file).file.storage.exists(blob.file_name))
+        response = bob_client.get(f"/api/files/{bob_file}/download/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"same bytes")
+
+    def test_purge_of_last_reference_removes_bytes(self):
+        alice = self.make_user("alice")
+        client = self.client_for(alice)
+        file_id = self.upload(client, b"only mine")
+        name = Blob.objects.get().file_name
+        storage = UserFile.objects.get(pk=file_id).file.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(f"/api/files/{file_id}/purge/")
+
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_patch_cannot_replace_content(self):
+        alice = self.make_user("alice")
+        client = self.client_for(alice)
+        file_id = self.upload(client, b"original")
+        blob = Blob.objects.get()
+
+        response = client.patch(
+            f"/api/files/{file_id}/",
+            {"file": SimpleUploadedFile("evil.txt", b"x" * 1000), "size": 1, "comment": "note"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        userfile = UserFile.objects.get(pk=file_id)
+        self.assertEqual((userfile.comment, userfile.size, userfile.blob_id), ("note", 8, blob.pk))
+        self.assertEqual(userfile.file.name, blob.file_name)
+        self.assertEqual(Blob.objects.count(), 1)
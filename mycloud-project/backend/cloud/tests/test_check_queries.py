@@ -0,0 +1,23 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from cloud.models import Folder, UserFile
+
+from .base import CloudTestMixin
+
+User = get_user_model()
+
+
+class CheckQueriesCommandTests(CloudTestMixin, TestCase):
+    def test_runs_on_empty_database_and_rolls_back_fixtures(self):
+        out = StringIO()
+        call_command("check_queries", stdout=out)
+
+        self.assertIn("временных данных", out.getvalue())
+        self.assertNotIn("FAIL", out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Folder.objects.exists())
+        self.assertFalse(UserFile.objects.exists())
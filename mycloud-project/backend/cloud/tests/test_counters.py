@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+
+from cloud.counters import DownloadCounter
+from cloud.models import UserFile
+
+from .base import CloudTestMixin
+
+
+class DownloadCounterTests(CloudTestMixin, TestCase):
+    def test_flush_keeps_per_file_timestamps(self):
+        alice = self.make_user("alice")
+        first, second = (
+            UserFile.objects.create(owner=alice, file=SimpleUploadedFile(name, b"x"), original_name=name, size=1)
+            for name in ("a.txt", "b.txt")
+        )
+        earlier = timezone.now() - timedelta(hours=2)
+        later = timezone.now() - timedelta(hours=1)
+        counter = DownloadCounter()
+        with self.settings(CLOUD_DOWNLOAD_FLUSH_INTERVAL=60):
+            # одинаковое число скачиваний — оба файла попадают в один UPDATE
+            counter._pending = {first.pk: (1, earlier), second.pk: (1, later)}
+            counter.flush()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.download_count, first.last_downloaded_at), (1, earlier))
+        self.assertEqual((second.download_count, second.last_downloaded_at), (1, later))
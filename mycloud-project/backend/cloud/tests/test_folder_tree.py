@@ -0,0 +1,35 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cloud.models import Folder, UserFile
+from cloud.serializers import FolderTree, folder_queryset
+
+from .base import CloudTestMixin
+
+
+class FolderTreeLoadTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user("alice")
+        self.docs = Folder.objects.create(owner=self.alice, name="docs")
+        self.sub = Folder.objects.create(owner=self.alice, name="sub", parent=self.docs)
+        self.other = Folder.objects.create(owner=self.alice, name="other")
+        for folder in (self.docs, self.sub, self.other):
+            UserFile.objects.create(owner=self.alice, folder=folder, original_name="a.txt", file="x/a.txt", size=1)
+
+    def test_loads_only_subtree_of_serialized_folder(self):
+        tree = FolderTree()
+        self.assertEqual([f.pk for f in tree.children_of(self.docs)], [self.sub.pk])
+        self.assertEqual(len(tree.files_of(self.sub)), 1)
+        self.assertNotIn(self.other.pk, tree._seen_folders)
+        loaded_in = set(UserFile.objects.filter(pk__in=tree._seen_files).values_list("folder_id", flat=True))
+        self.assertEqual(loaded_in, {self.docs.pk, self.sub.pk})
+
+    def test_empty_folder_is_not_loaded(self):
+        empty = folder_queryset().get(pk=Folder.objects.create(owner=self.alice, name="empty").pk)
+        tree = FolderTree()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tree.children_of(empty), [])
+            self.assertEqual(tree.files_of(empty), [])
+        self.assertEqual(len(queries), 0)
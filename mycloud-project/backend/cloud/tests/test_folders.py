@@ -0,0 +1,56 @@
+from django.test import TestCase
+
+from cloud.models import Folder, UserFile
+from cloud.views import FolderViewSet
+
+from .base import CloudTestMixin
+
+
+class FolderMoveTests(CloudTestMixin, TestCase):
+    def test_cycle_check_uses_fresh_paths(self):
+        alice = self.make_user("alice")
+        a = Folder.objects.create(owner=alice, name="a")
+        b = Folder.objects.create(owner=alice, name="b")
+        stale_a, stale_b = Folder.objects.get(pk=a.pk), Folder.objects.get(pk=b.pk)
+        # встречное перемещение b -> a завершилось, пока наши объекты лежали в памяти
+        response = self.client_for(alice).post(f"/api/folders/{b.pk}/move/", {"parent": a.pk}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+        response = FolderViewSet()._move_folders([stale_a], stale_b)
+
+        self.assertEqual(response.status_code, 400)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertIsNone(a.parent_id)
+        self.assertEqual((b.parent_id, b.path), (a.pk, f"{a.pk}/{b.pk}/"))
+
+
+class FolderBulkMoveTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user("alice")
+        self.bob = self.make_user("bob")
+        self.admin = self.make_user("admin", is_staff=True)
+
+    def bulk_move(self, user, payload):
+        return self.client_for(user).post("/api/folders/bulk_move/", payload, format="json")
+
+    def test_bad_ids_are_rejected(self):
+        for payload in ({"folders": ["abc"]}, {"files": [None]}, {"folders": [{"id": 1}]}, {"parent": "abc"}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.bulk_move(self.alice, payload).status_code, 400)
+
+    def test_staff_cannot_move_into_other_owners_folder(self):
+        target = Folder.objects.create(owner=self.alice, name="target")
+        folder = Folder.objects.create(owner=self.bob, name="bob")
+        userfile = UserFile.objects.create(owner=self.bob, original_name="b.txt", file="x/b.txt", size=1)
+
+        for payload in ({"folders": [folder.pk]}, {"files": [userfile.pk]}):
+            with self.subTest(payload=payload):
+                response = self.bulk_move(self.admin, {**payload, "parent": target.pk})
+                self.assertEqual(response.status_code, 403)
+
+        folder.refresh_from_db()
+        userfile.refresh_from_db()
+        self.assertIsNone(folder.parent_id)
+        self.assertIsNone(userfile.folder_id)
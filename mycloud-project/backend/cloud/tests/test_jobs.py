@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+
+from cloud import jobs
+from cloud.models import BackgroundJob, Folder, UploadSession, UserFile, UserProfile
+from cloud.purge import delete_folders
+
+from .base import CloudTestMixin
+
+
+class StaleJobTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user("alice")
+        self.client = self.client_for(self.alice)
+        response = self.client.post("/api/folders/", {"name": "old"}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.folder_id = response.json()["id"]
+
+    def running_job(self, heartbeat_at):
+        return BackgroundJob.objects.create(
+            kind=BackgroundJob.KIND_PURGE_FOLDER,
+            target_id=self.folder_id,
+            status=BackgroundJob.STATUS_RUNNING,
+            started_at=heartbeat_at,
+            heartbeat_at=heartbeat_at,
+        )
+
+    def test_enqueue_restarts_job_with_expired_lease(self):
+        job = self.running_job(timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.enqueue(BackgroundJob.KIND_PURGE_FOLDER, self.folder_id).pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_PENDING)
+
+        self.assertTrue(jobs.run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+        self.assertFalse(Folder.objects.filter(pk=self.folder_id).exists())
+
+    def test_live_job_is_not_requeued(self):
+        job = self.running_job(timezone.now())
+
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(jobs.enqueue(BackgroundJob.KIND_PURGE_FOLDER, self.folder_id).pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.STATUS_RUNNING)
+        self.assertFalse(jobs.run_job(job.pk))
+
+    def test_folder_purge_removes_files_uploaded_after_file_pass(self):
+        # файл появился в папке уже после прохода delete_files — папки удаляются вместе с ним
+        response = self.client.post(
+            "/api/files/",
+            {"file": SimpleUploadedFile("late.txt", b"late bytes"), "folder": self.folder_id},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_folders(Folder.objects.filter(pk=self.folder_id))
+
+        self.assertFalse(Folder.objects.exists())
+        self.assertFalse(UserFile.objects.exists())
+        profile = UserProfile.objects.get(user=self.alice)
+        self.assertEqual((profile.used_bytes, profile.files_count), (0, 0))
+
+
+class PurgeUserTests(CloudTestMixin, TestCase):
+    def test_removes_partial_files_of_root_uploads(self):
+        alice = self.make_user("alice")
+        client = self.client_for(alice)
+        response = client.post("/api/uploads/", {"original_name": "big.bin", "size": 10}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        file_name = UploadSession.objects.get(pk=response.json()["id"]).file_name
+        storage = UserFile._meta.get_field("file").storage
+        self.assertTrue(storage.exists(file_name))
+
+        job = jobs.enqueue(BackgroundJob.KIND_PURGE_USER, alice.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(jobs.run_job(job.pk))
+
+        self.assertFalse(get_user_model().objects.filter(pk=alice.pk).exists())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(storage.exists(file_name))
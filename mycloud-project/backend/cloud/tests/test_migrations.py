@@ -0,0 +1,34 @@
+import importlib
+
+from django.apps import apps
+from django.test import TestCase
+
+from cloud.models import Folder
+
+from .base import CloudTestMixin
+
+folder_path_migration = importlib.import_module("cloud.migrations.0005_folder_path")
+
+
+class FillFolderPathsTests(CloudTestMixin, TestCase):
+    def test_parent_cycle_is_detached(self):
+        alice = self.make_user("alice")
+        a = Folder.objects.create(owner=alice, name="a")
+        b = Folder.objects.create(owner=alice, name="b", parent=a)
+        c = Folder.objects.create(owner=alice, name="c", parent=b)
+        # цикл a -> b -> a, как его оставлял старый move
+        Folder.objects.filter(pk=a.pk).update(parent=b)
+        Folder.objects.update(path="", depth=0)
+
+        folder_path_migration.fill_folder_paths(apps, None)
+
+        rows = {
+            pk: (parent_id, path, depth)
+            for pk, parent_id, path, depth in Folder.objects.values_list("pk", "parent_id", "path", "depth")
+        }
+        root = next(pk for pk, (parent_id, _, _) in rows.items() if parent_id is None)
+        self.assertIn(root, (a.pk, b.pk))
+        other = b.pk if root == a.pk else a.pk
+        self.assertEqual(rows[root][1:], (f"{root}/", 0))
+        self.assertEqual(rows[other][1:], (f"{root}/{other}/", 1))
+        self.assertEqual(rows[c.pk][1:], (f"{rows[b.pk][1]}{c.pk}/", rows[b.pk][2] + 1))
@@ -0,0 +1,38 @@
+import base64
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from .base import CloudTestMixin
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+class KeysetCursorTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.make_user("alice"))
+        for i in range(3):
+            self.client.post("/api/files/", {"file": SimpleUploadedFile(f"{i}.txt", b"x%d" % i)}, format="multipart")
+
+    def test_pages_follow_next_link(self):
+        first = self.client.get("/api/files/?page_size=2").json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(first["results"]), 2)
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next"])
+
+    def test_malformed_cursor_is_404(self):
+        for bad in (
+            "not-base64!",
+            cursor(["2026-01-01T00:00:00+00:00"]),
+            cursor(["not a date", 1]),
+            cursor(["2026-01-01T00:00:00+00:00", "abc"]),
+            cursor([None, 1]),
+            cursor([{"a": 1}, [1]]),
+        ):
+            with self.subTest(cursor=bad):
+                self.assertEqual(self.client.get(f"/api/files/?cursor={bad}").status_code, 404)
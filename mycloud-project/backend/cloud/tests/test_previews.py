@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from cloud import previews, thumbnails
+
+
+@unittest.skipIf(thumbnails.Image is None, "Pillow не установлен (requirements.txt)")
+class ThumbnailRenderTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cloud-previews-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def source(self, name, save_format):
+        path = os.path.join(self.root, name)
+        thumbnails.Image.new("RGB", (600, 300), "teal").save(path, save_format)
+        return path
+
+    def assert_preview(self, path, size):
+        with thumbnails.Image.open(path) as image:
+            self.assertEqual(max(image.size), size)
+
+    def test_image_preview(self):
+        self.assertEqual(previews.preview_kind("photo.png"), "image")
+        path = thumbnails.render("image", self.source("photo.png", "PNG"), os.path.join(self.root, "out"), 128)
+        self.assertTrue(path.endswith(".jpg"))
+        self.assert_preview(path, 128)
+
+    @unittest.skipUnless(shutil.which("pdftoppm"), "нет pdftoppm (poppler-utils)")
+    def test_pdf_preview(self):
+        self.assertEqual(previews.preview_kind("doc.pdf"), "pdf")
+        path = thumbnails.render("pdf", self.source("doc.pdf", "PDF"), os.path.join(self.root, "out"), 256)
+        self.assert_preview(path, 256)
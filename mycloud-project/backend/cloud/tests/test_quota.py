@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import TransactionTestCase
+
+from cloud.models import UserFile, UserProfile
+
+from .base import CloudTestMixin
+
+FILE_SIZE = 100
+FITS = 10
+ATTEMPTS = 30
+
+
+@unittest.skipIf(connection.vendor == "sqlite", "SQLite сериализует запись целиком — гонки за квоту не воспроизвести")
+class ParallelUploadQuotaTests(CloudTestMixin, TransactionTestCase):
+    def test_parallel_uploads_do_not_overshoot_quota(self):
+        user = self.make_user("alice")
+        UserProfile.objects.filter(user=user).update(quota=FILE_SIZE * FITS)
+        barrier = threading.Barrier(ATTEMPTS)
+        statuses = []
+        lock = threading.Lock()
+
+        def upload(i):
+            try:
+                client = self.client_for(user)
+                # разное содержимое — каждая загрузка пишет свой blob
+                content = f"{i:0{FILE_SIZE}d}".encode("ascii")
+                barrier.wait()
+                response = client.post("/api/files/", {"file": SimpleUploadedFile(f"{i}.txt", content)}, format="multipart")
+                with lock:
+                    statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=upload, args=(i,)) for i in range(ATTEMPTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(statuses.count(201), FITS)
+        self.assertEqual(statuses.count(400), ATTEMPTS - FITS)
+        self.assertLessEqual(profile.used_bytes + profile.reserved_bytes, profile.quota)
+        self.assertEqual(profile.used_bytes, FILE_SIZE * FITS)
+        self.assertEqual(profile.reserved_bytes, 0)
+        self.assertEqual(profile.files_count, FITS)
+        self.assertEqual(UserFile.objects.filter(owner=user).count(), FITS)
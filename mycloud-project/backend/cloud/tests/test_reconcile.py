@@ -0,0 +1,30 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from cloud.models import UploadSession, UserProfile
+
+from .base import CloudTestMixin
+
+
+class ReconcileUsageTests(CloudTestMixin, TestCase):
+    def test_recomputes_reserved_bytes_from_live_sessions(self):
+        alice = self.make_user("alice")
+        UploadSession.objects.create(owner=alice, original_name="big.bin", size=300, file_name="uploads/big.bin")
+        # воркер упал между reserve_bytes и commit/release — резерв завис
+        UserProfile.objects.filter(user=alice).update(reserved_bytes=10_000)
+
+        call_command("reconcile_usage", stdout=StringIO())
+
+        self.assertEqual(UserProfile.objects.get(user=alice).reserved_bytes, 300)
+
+    def test_releases_reservation_without_sessions(self):
+        alice = self.make_user("alice")
+        UserProfile.objects.filter(user=alice).update(reserved_bytes=500)
+
+        call_command("reconcile_usage", "--dry-run", stdout=StringIO())
+        self.assertEqual(UserProfile.objects.get(user=alice).reserved_bytes, 500)
+
+        call_command("reconcile_usage", stdout=StringIO())
+        self.assertEqual(UserProfile.objects.get(user=alice).reserved_bytes, 0)
@@ -0,0 +1,50 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from cloud import sharing
+from cloud.models import ShareLink, UserFile
+
+from .base import CloudTestMixin
+
+
+class LimitedLinkRangeTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        alice = self.make_user("alice")
+        response = self.client_for(alice).post(
+            "/api/files/", {"file": SimpleUploadedFile("a.txt", b"0123456789")}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.link = sharing.share(UserFile.objects.get(), max_downloads=1)
+        self.url = f"/api/external/download/{self.link.token}/"
+        self.anonymous = APIClient()
+
+    def download_count(self):
+        return ShareLink.objects.get(pk=self.link.pk).download_count
+
+    def get(self, range_header=None):
+        extra = {"HTTP_RANGE": range_header} if range_header else {}
+        response = self.anonymous.get(self.url, **extra)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def test_range_not_from_start_counts_against_limit(self):
+        self.assertEqual(self.get("bytes=1-").status_code, 206)
+        self.assertEqual(self.download_count(), 1)
+        self.assertEqual(self.get("bytes=1-").status_code, 410)
+        self.assertEqual(self.get().status_code, 410)
+
+    def test_range_after_exhausted_limit_is_refused(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get("bytes=1-").status_code, 410)
+        self.assertEqual(self.get("bytes=0-1,4-5").status_code, 410)
+        self.assertEqual(self.download_count(), 1)
+
+    def test_multi_range_counts_against_limit(self):
+        response = self.get("bytes=0-1,4-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        self.assertEqual(self.download_count(), 1)
+        self.assertEqual(self.get("bytes=0-1,4-5").status_code, 410)
@@ -0,0 +1,38 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from cloud import tree_cache
+from cloud.models import Folder
+
+from .base import CloudTestMixin
+
+
+class TreeCacheTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_user("alice")
+        self.folder = Folder.objects.create(owner=self.alice, name="docs")
+
+    def rename_elsewhere(self):
+        # переименование в другом процессе: версия дерева в этом кэше не сдвинута
+        Folder.objects.filter(pk=self.folder.pk).update(name="renamed")
+
+    @override_settings(CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL=0)
+    def test_process_local_cache_is_bypassed(self):
+        self.assertEqual(tree_cache.get_tree(self.alice.pk)[0]["name"], "docs")
+        self.rename_elsewhere()
+        self.assertEqual(tree_cache.get_tree(self.alice.pk)[0]["name"], "renamed")
+
+    def test_shared_cache_keeps_tree_until_invalidated(self):
+        location = tempfile.mkdtemp(prefix="cloud-cache-")
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}}
+        with override_settings(CACHES=shared, CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL=0):
+            self.assertEqual(tree_cache.get_tree(self.alice.pk)[0]["name"], "docs")
+            self.rename_elsewhere()
+            self.assertEqual(tree_cache.get_tree(self.alice.pk)[0]["name"], "docs")
+            with self.captureOnCommitCallbacks(execute=True):
+                tree_cache.invalidate(self.alice.pk)
+            self.assertEqual(tree_cache.get_tree(self.alice.pk)[0]["name"], "renamed")
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.core.handlers.wsgi import LimitedStream
+from django.db import connection
+from django.test import TestCase
+
+from cloud.models import Folder, UploadSession, UserFile, UserProfile
+
+from .base import CloudTestMixin
+
+
+class ChunkedUploadTests(CloudTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("alice")
+        self.client = self.client_for(self.user)
+
+    def start(self, size):
+        response = self.client.post("/api/uploads/", {"original_name": "a.bin", "size": size}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def put(self, session_id, data, start, total):
+        return self.client.generic(
+            "PUT",
+            f"/api/uploads/{session_id}/",
+            data,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(data) - 1}/{total}",
+        )
+
+    def read_bytes(self, session_id):
+        session = UploadSession.objects.get(pk=session_id)
+        with UserFile._meta.get_field("file").storage.open(session.file_name, "rb") as fh:
+            return fh.read()
+
+    def test_stale_offset_does_not_touch_file(self):
+        session_id = self.start(10)
+        self.assertEqual(self.put(session_id, b"abcde", 0, 10).status_code, 200)
+
+        # повтор первой части с другой длиной — смещение уже не 0
+        response = self.put(session_id, b"XY", 0, 10)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 5)
+        self.assertEqual(self.read_bytes(session_id), b"abcde")
+        self.assertEqual(UploadSession.objects.get(pk=session_id).offset, 5)
+
+    def test_offset_advanced_while_reading_body(self):
+        session_id = self.start(10)
+        stale = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(self.put(session_id, b"abcde", 0, 10).status_code, 200)
+
+        # параллельный PUT сдвинул смещение, пока этот запрос читал тело
+        with mock.patch("cloud.views.UploadSessionViewSet._get_session", return_value=stale):
+            response = self.put(session_id, b"XY", 0, 10)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 5)
+        self.assertEqual(self.read_bytes(session_id), b"abcde")
+        self.assertEqual(UploadSession.objects.get(pk=session_id).offset, 5)
+
+    def test_body_is_read_outside_transaction(self):
+        session_id = self.start(10)
+        # TestCase сам открывает транзакции — считаем только вложенные в запрос
+        outer = len(connection.atomic_blocks)
+        depths = []
+        read = LimitedStream.read
+
+        def tracking_read(stream, *args):
+            depths.append(len(connection.atomic_blocks))
+            return read(stream, *args)
+
+        with mock.patch.object(LimitedStream, "read", tracking_read):
+            self.assertEqual(self.put(session_id, b"abcde", 0, 10).status_code, 200)
+
+        self.assertTrue(depths)
+        self.assertEqual(set(depths), {outer})
+        self.assertEqual(self.read_bytes(session_id), b"abcde")
+
+    def test_chunks_complete_into_file(self):
+        session_id = self.start(8)
+        self.assertEqual(self.put(session_id, b"abcd", 0, 8).status_code, 200)
+        self.assertEqual(self.put(session_id, b"efgh", 4, 8).status_code, 200)
+
+        response = self.client.post(f"/api/uploads/{session_id}/complete/")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        userfile = UserFile.objects.get(pk=response.json()["id"])
+        with userfile.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"abcdefgh")
+
+
+class FolderDeleteWithUploadTests(CloudTestMixin, TestCase):
+    def test_destroy_releases_pending_upload(self):
+        user = self.make_user("alice")
+        client = self.client_for(user)
+        parent = Folder.objects.create(owner=user, name="a")
+        child = Folder.objects.create(owner=user, name="b", parent=parent)
+        response = client.post("/api/uploads/", {"original_name": "a.bin", "size": 100, "folder": child.pk}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        file_name = UploadSession.objects.get().file_name
+        self.assertEqual(UserProfile.objects.get(user=user).reserved_bytes, 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.delete(f"/api/folders/{parent.pk}/").status_code, 204)
+
+        self.assertEqual(UserProfile.objects.get(user=user).reserved_bytes, 0)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(UserFile._meta.get_field("file").storage.exists(file_name))
@@ -0,0 +1,104 @@
+"""
+Рендеринг превью в процессах пула (см. previews).
+
+Модуль не импортирует Django: рабочие процессы запускаются через spawn и
+получают только пути к файлам. Результат пишется во временный файл рядом
+с целевым и переименовывается — читатели кэша не видят недописанных превью.
+
+Pillow нужен для изображений и PDF, pdftoppm (poppler-utils) — для PDF.
+Без них доступно только начало текстовых файлов.
+"""
+import os
+import subprocess
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — превью изображений недоступны
+    Image = None
+
+JPEG_QUALITY = 82
+# на сколько секунд даём pdftoppm отрендерить первую страницу
+PDF_TIMEOUT = 30
+
+
+def _atomic_target(target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+    os.close(fd)
+    return tmp
+
+
+def _save_image(image, target_base):
+    """Сохраняет превью: JPEG, или PNG, если у изображения есть прозрачность. Возвращает путь."""
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if has_alpha:
+        image, ext, options = image.convert("RGBA"), ".png", {"optimize": True}
+    else:
+        image, ext, options = image.convert("RGB"), ".jpg", {"quality": JPEG_QUALITY, "optimize": True}
+    target = target_base + ext
+    tmp = _atomic_target(target)
+    try:
+        image.save(tmp, format="PNG" if ext == ".png" else "JPEG", **options)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return target
+
+
+def render_image(source, target_base, size):
+    with Image.open(source) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе — не разворачиваем в память весь снимок
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        return _save_image(image, target_base)
+
+
+def render_pdf(source, target_base, size):
+    """Первая страница PDF через pdftoppm, затем как изображение."""
+    os.makedirs(os.path.dirname(target_base), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(target_base)) as workdir:
+        prefix = os.path.join(workdir, "page")
+        subprocess.run(
+            ["pdftoppm", "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(size), "-png", source, prefix],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=PDF_TIMEOUT,
+        )
+        return render_image(prefix + ".png", target_base, size)
+
+
+def render_text(source, target_base, limit):
+    """Первые limit байт текста, обрезанные по последней целой строке, в UTF-8."""
+    with open(source, "rb") as fh:
+        head = fh.read(limit + 1)
+    if len(head) > limit:
+        head = head[:limit]
+        cut = head.rfind(b"\n")
+        if cut > 0:
+            head = head[: cut + 1]
+    target = target_base + ".txt"
+    tmp = _atomic_target(target)
+    try:
+        with open(tmp, "wb") as out:
+            out.write(head.decode("utf-8", errors="replace").encode("utf-8"))
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return target
+
+
+RENDERERS = {
+    "image": render_image,
+    "pdf": render_pdf,
+    "text": render_text,
+}
+
+
+def render(kind, source, target_base, size):
+    """Точка входа для пула процессов. Возвращает путь к готовому превью."""
+    return RENDERERS[kind](source, target_base, size)
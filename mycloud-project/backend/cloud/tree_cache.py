@@ -0,0 +1,93 @@
+"""
+Кэш дерева папок пользователя (GET /api/folders/tree/ и
+/api/admin-users/<id>/folder_tree/).
+
+Дерево хранится в кэше Django (CACHES["default"]) под ключом с версией
+пользователя. Версия — отдельная запись кэша, её сдвигает любое изменение
+папок: журнал изменений (changes.record) после коммита вызывает
+invalidate. Старые деревья не удаляются — под новым ключом их никто не
+запросит, и они уходят из кэша по таймауту. Повторный запрос дерева —
+попадание в кэш без запросов к БД, промах — один запрос папок.
+
+Версия сдвигается после коммита: читатель, успевший между изменением и
+коммитом, не сохранит старое дерево под новой версией. Если запись версии
+вытеснена, она создаётся заново из текущего времени — старые ключи не
+совпадут с новыми.
+
+С LocMemCache каждый процесс видит только свои сбросы версии, и другие
+воркеры отдавали бы старое дерево до истечения таймаута. Поэтому с
+кэшем в памяти процесса дерево живёт CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL
+секунд (0 — не кэшировать), а полный CLOUD_FOLDER_TREE_CACHE_TTL
+действует только с общим бэкендом (Redis, Memcached, FileBasedCache).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .models import Folder
+
+
+def _version_key(user_id):
+    return f"cloud:folder-tree-version:{user_id}"
+
+
+def _version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(user_id):
+    """Сдвигает версию дерева пользователя после коммита текущей транзакции."""
+    def bump():
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # записи версии нет — следующий читатель создаст новую
+            pass
+
+    transaction.on_commit(bump)
+
+
+def build_tree(folders):
+    """Вложенное дерево из плоского списка (id, name, parent_id), дети — в порядке списка."""
+    nodes = {}
+    roots = []
+    for pk, name, parent_id in folders:
+        nodes[pk] = {"id": pk, "name": name, "parent": parent_id, "children": []}
+    for pk, _, parent_id in folders:
+        node = nodes[pk]
+        if parent_id is None:
+            roots.append(node)
+        elif parent_id in nodes:
+            nodes[parent_id]["children"].append(node)
+    return roots
+
+
+def _ttl():
+    if isinstance(caches["default"], LocMemCache):
+        return getattr(settings, "CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL", 5)
+    return getattr(settings, "CLOUD_FOLDER_TREE_CACHE_TTL", 3600)
+
+
+def _load_tree(user_id):
+    folders = list(Folder.objects.filter(owner_id=user_id).order_by("name").values_list("id", "name", "parent_id"))
+    return build_tree(folders)
+
+
+def get_tree(user_id):
+    ttl = _ttl()
+    if ttl <= 0:
+        return _load_tree(user_id)
+    key = f"cloud:folder-tree:{user_id}:{_version(user_id)}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = _load_tree(user_id)
+        cache.set(key, tree, timeout=ttl)
+    return tree
@@ -1,17 +1,24 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FolderViewSet, UserFileViewSet, external_download, RegisterView, LoginView, LogoutView, AdminUserViewSet
-from .views import csrf_token_view, current_user_view, folder_tree_view, welcome_view
+from .views import FolderViewSet, UserFileViewSet, external_download, RegisterView, LoginView, LogoutView, AdminUserViewSet, BackgroundJobViewSet, UploadSessionViewSet
+from .views import changes_view, csrf_token_view, current_user_view, folder_tree_view, welcome_view
+from .async_views import async_streaming, changes_long_poll
 
 router = DefaultRouter()
 router.register(r"folders", FolderViewSet, basename="folders")
 router.register(r"files", UserFileViewSet, basename="files")
 router.register(r"admin-users", AdminUserViewSet, basename="admin-users")
+router.register(r"jobs", BackgroundJobViewSet, basename="jobs")
+router.register(r"uploads", UploadSessionViewSet, basename="uploads")
 
 urlpatterns = [
     path("folders/tree/", folder_tree_view, name="folder-tree"),
     path("welcome/", welcome_view, name="welcome"),
-    path("external/download/<str:token>/", external_download, name="external-download"),
+    path("changes/", changes_long_poll(changes_view), name="changes"),
+    path("external/download/<str:token>/", async_streaming(external_download), name="external-download"),
+    # скачивания под ASGI отдаются асинхронно; маршруты перекрывают такие же из router
+    path("files/<int:pk>/download/", async_streaming(UserFileViewSet.as_view({"get": "download"})), name="files-download"),
+    path("folders/<int:pk>/download_zip/", async_streaming(FolderViewSet.as_view({"get": "download_zip"})), name="folders-download-zip"),
     path("auth/register/", RegisterView.as_view(), name="auth-register"),
     path("auth/login/", LoginView.as_view(), name="auth-login"),
     path("auth/logout/", LogoutView.as_view(), name="auth-logout"),
@@ -1,8 +1,10 @@
+import functools
 import os
-import tempfile
-import zipfile
-import secrets
+import re
 import logging
+import shutil
+import tempfile
+from datetime import timedelta
 
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
@@ -10,29 +12,73 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from rest_framework.exceptions import PermissionDenied
-from django.http import FileResponse, Http404, JsonResponse
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.core.files.base import ContentFile
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import login as django_login, logout as django_logout, get_user_model
-from django.db import transaction
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.conf import settings
 from django.utils import timezone
 from django.urls import reverse
+from django.utils.http import content_disposition_header
 
-from .models import Folder, UserFile, UserProfile
+from . import blobs, changes, copying, jobs, previews, search, sharing, tree_cache
+from .counters import record_download
+from .models import BackgroundJob, Blob, ChangeEvent, Folder, ShareLink, UploadSession, UserFile, UserProfile, user_file_upload_to
 from .serializers import (
     FolderSerializer,
     UserFileSerializer,
+    UploadSessionSerializer,
     RegistrationSerializer,
     LoginSerializer,
     AdminUserSerializer,
+    BackgroundJobSerializer,
+    FolderTree,
+    folder_queryset,
+    file_queryset,
+)
+from .purge import delete_files, delete_upload_sessions
+from .pagination import (
+    AdminUserPagination,
+    FileSearchPagination,
+    FolderChildrenPagination,
+    FolderFilesPagination,
+    StorageFilesPagination,
+    StorageFoldersPagination,
+    UserFilePagination,
 )
+from .serving import discard, file_response, is_new_download
+from .zipstream import ZipEntry, stream_zip
 
 User = get_user_model()
 
 
+def zip_folder_response(folder, files_qs):
+    """
+    Отдаёт содержимое папки ZIP-архивом, который собирается по мере отправки.
+    Список файлов читается из БД до начала передачи: под ASGI архив
+    собирается в потоках общего пула (см. async_views), где БД недоступна.
+    """
+    storage = UserFile._meta.get_field("file").storage
+    rows = list(files_qs.exclude(file="").values_list("original_name", "file", "size", "uploaded_at"))
+    entries = (
+        ZipEntry(
+            arcname=original_name,
+            opener=functools.partial(storage.open, name, "rb"),
+            size=size,
+            date_time=uploaded_at,
+        )
+        for original_name, name, size, uploaded_at in rows
+    )
+
+    resp = StreamingHttpResponse(stream_zip(entries), content_type="application/zip")
+    resp["Content-Disposition"] = content_disposition_header(True, f"{folder.name}.zip")
+    return resp
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_staff:
@@ -73,6 +119,78 @@ class LogoutView(APIView):
         return Response({"detail": "вышел из системы"}, status=status.HTTP_200_OK)
 
 
+# сколько файлов принимают пакетные операции за один запрос
+BULK_MAX_ITEMS = 10000
+
+
+def share_options(request):
+    """(expires_at, max_downloads) из необязательных expires_in (секунды) и max_downloads; ValueError — неверные значения."""
+    expires_at = max_downloads = None
+    try:
+        if request.data.get("expires_in") not in (None, ""):
+            expires_in = int(request.data["expires_in"])
+            if expires_in <= 0:
+                raise ValueError
+            expires_at = timezone.now() + timedelta(seconds=expires_in)
+        if request.data.get("max_downloads") not in (None, ""):
+            max_downloads = int(request.data["max_downloads"])
+            if max_downloads <= 0:
+                raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError("expires_in и max_downloads должны быть положительными целыми")
+    return expires_at, max_downloads
+
+
+def expected_sha256(request):
+    """SHA-256 содержимого от клиента (поле sha256 или заголовок X-Content-SHA256) или None; ValueError — неверный формат."""
+    value = request.data.get("sha256") or request.META.get("HTTP_X_CONTENT_SHA256")
+    if value in (None, ""):
+        return None
+    return blobs.parse_sha256(value)
+
+
+def checksum_mismatch_response(exc):
+    return Response(
+        {"detail": "Контрольная сумма не совпала, файл не сохранён", "expected": exc.expected, "sha256": exc.actual},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def share_link_data(request, link):
+    return {
+        "share_url": request.build_absolute_uri(reverse("external-download", args=[link.token])),
+        "expires_at": link.expires_at,
+        "max_downloads": link.max_downloads,
+    }
+
+
+def share_response(request, obj):
+    """
+    Общая часть share-действий файла и папки.
+    action=revoke|unshare отзывает ссылку; иначе ссылка создаётся или
+    возвращается существующая. Необязательные expires_in (секунды) и
+    max_downloads ограничивают срок жизни ссылки.
+    """
+    if request.data.get("action") in ("revoke", "unshare"):
+        sharing.revoke(obj)
+        return Response({"detail": "Ссылка отозвана"})
+    try:
+        expires_at, max_downloads = share_options(request)
+    except ValueError as exc:
+        return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    link = sharing.share(obj, expires_at=expires_at, max_downloads=max_downloads)
+    return Response(share_link_data(request, link))
+
+
+def renamed_file(original_name, new_name):
+    # расширение файла сохраняется, расширение из нового имени отбрасывается
+    if "." in new_name:
+        new_name = new_name.rsplit(".", 1)[0]
+    if "." in original_name:
+        return f"{new_name}.{original_name.split('.')[-1]}"
+    return new_name
+
+
 class FolderViewSet(viewsets.ModelViewSet):
     queryset = Folder.objects.all()
     serializer_class = FolderSerializer
@@ -81,7 +199,7 @@ class FolderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         parent_q = self.request.query_params.get("parent")
-        qs = Folder.objects.filter(owner=user)  # Только свои папки
+        qs = folder_queryset().filter(owner=user)  # Только свои папки
         
         if parent_q:
             if parent_q.lower() in ("null", "none", ""):
@@ -91,6 +209,56 @@ class FolderViewSet(viewsets.ModelViewSet):
         
         return qs.order_by("name")
 
+    def _tree_options(self, default_depth=None):
+        params = self.request.query_params
+        depth = params.get("depth")
+        if depth in (None, ""):
+            depth = default_depth
+        else:
+            try:
+                depth = int(depth)
+                if depth < 0:
+                    raise ValueError()
+            except ValueError:
+                raise ValidationError({"detail": "depth должен быть неотрицательным целым числом"})
+        include_files = params.get("include_files", "true").lower() not in ("0", "false", "no")
+        return depth, include_files
+
+    def get_serializer_context(self, default_depth=None):
+        context = super().get_serializer_context()
+        depth, include_files = self._tree_options(default_depth)
+        context["folder_tree"] = FolderTree(depth=depth, include_files=include_files)
+        return context
+
+    def _serialize_tree(self, folders, many=True, default_depth=None):
+        context = self.get_serializer_context(default_depth)
+        context["folder_tree"].prefetch(folders if many else [folders])
+        return FolderSerializer(folders, many=many, context=context).data
+
+    def list(self, request, *args, **kwargs):
+        folders = list(self.filter_queryset(self.get_queryset()))
+        return Response(self._serialize_tree(folders))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self._serialize_tree(self.get_object(), many=False))
+
+    @action(detail=True, methods=["get"])
+    def children(self, request, pk=None):
+        """Подпапки одного уровня с курсорной пагинацией (по умолчанию depth=0)."""
+        folder = self.get_object()
+        paginator = FolderChildrenPagination()
+        page = paginator.paginate_queryset(folder_queryset().filter(parent=folder), request, view=self)
+        return paginator.get_paginated_response(self._serialize_tree(page, default_depth=0))
+
+    @action(detail=True, methods=["get"])
+    def files(self, request, pk=None):
+        """Файлы папки с курсорной пагинацией."""
+        folder = self.get_object()
+        paginator = FolderFilesPagination()
+        page = paginator.paginate_queryset(file_queryset().filter(folder=folder), request, view=self)
+        data = UserFileSerializer(page, many=True, context={"request": request}).data
+        return paginator.get_paginated_response(data)
+
     def perform_create(self, serializer):
         if self.request.user.is_staff:
             data = serializer.validated_data
@@ -124,53 +292,30 @@ class FolderViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Только чтение в режиме администратора"}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        # каскад удалит и файлы поддерева — вычитаем их из счётчиков владельца
+        files = UserFile.objects.filter(folder__path__startswith=instance.path)
+        # незавершённые загрузки поддерева каскад удалил бы без возврата резерва квоты и с файлами на диске
+        delete_upload_sessions(UploadSession.objects.filter(folder__path__startswith=instance.path))
+        with transaction.atomic():
+            totals = files.aggregate(sum=Sum("size"), cnt=Count("id"))
+            instance.delete()
+            UserProfile.adjust_usage(instance.owner_id, -(totals["sum"] or 0), -totals["cnt"])
+
     @action(detail=True, methods=["post"])
     def share(self, request, pk=None):
         folder = self.get_object()
         if not (request.user.is_staff or folder.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        if not folder.share_token:
-            folder.share_token = secrets.token_urlsafe(16)
-            folder.save(update_fields=["share_token"])
-        share_url = request.build_absolute_uri(reverse("external-download", args=[folder.share_token]))
-        return Response({"share_url": share_url})
+        return share_response(request, folder)
 
     @action(detail=True, methods=["get"])
     def download_zip(self, request, pk=None):
         folder = self.get_object()
         if not (request.user.is_staff or folder.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        files_qs = UserFile.objects.filter(folder__in=self._collect_folder_and_children_ids(folder))
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-        try:
-            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
-                for f in files_qs:
-                    try:
-                        path = f.file.path
-                        arcname = f.original_name
-                        zf.write(path, arcname=arcname)
-                    except Exception:
-                        continue
-            tmp.flush()
-            tmp.close()
-            resp = FileResponse(open(tmp.name, "rb"), as_attachment=True, filename=f"{folder.name}.zip")
-            return resp
-        finally:
-            try:
-                os.unlink(tmp.name)
-            except Exception:
-                pass
-
-    def _collect_folder_and_children_ids(self, folder):
-        ids = [folder.id]
-        stack = [folder]
-        while stack:
-            cur = stack.pop()
-            children = Folder.objects.filter(parent=cur)
-            for c in children:
-                ids.append(c.id)
-                stack.append(c)
-        return ids
+        files_qs = UserFile.objects.filter(folder__path__startswith=folder.path)
+        return zip_folder_response(folder, files_qs)
 
     @action(detail=True, methods=["post"])
     def rename(self, request, pk=None):
@@ -190,31 +335,129 @@ class FolderViewSet(viewsets.ModelViewSet):
         if not (request.user.is_staff or folder.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
         parent_id = request.data.get("parent")
-        if parent_id in (None, "", "null"):
-            folder.parent = None
-            folder.save(update_fields=["parent"])
-            return Response(self.get_serializer(folder).data)
+        p = None
+        if parent_id not in (None, "", "null"):
+            try:
+                p = Folder.objects.get(pk=parent_id)
+            except Folder.DoesNotExist:
+                return Response({"detail": "Target parent not found"}, status=status.HTTP_400_BAD_REQUEST)
+            if not (request.user.is_staff or p.owner == request.user):
+                return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+        error = self._move_folders([folder], p)
+        if error:
+            return error
+        return Response(self.get_serializer(folder).data)
+
+    def _move_folders(self, folders, parent):
         try:
-            p = Folder.objects.get(pk=parent_id)
-        except Folder.DoesNotExist:
-            return Response({"detail": "Target parent not found"}, status=status.HTTP_400_BAD_REQUEST)
-        if not (request.user.is_staff or p.owner == request.user):
+            with transaction.atomic():
+                # проверка цикла — по path, перечитанному под блокировкой
+                Folder.lock_for_move(folders, parent)
+                for folder in folders:
+                    if not folder.can_move_to(parent):
+                        return Response({"detail": "Нельзя переместить папку внутрь самой себя", "id": folder.pk}, status=status.HTTP_400_BAD_REQUEST)
+                for folder in folders:
+                    folder.move_to(parent)
+        except IntegrityError:
+            return Response({"detail": "В целевой папке уже есть папка с таким именем"}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    @action(detail=True, methods=["post"])
+    def copy(self, request, pk=None):
+        """
+        Копирует папку со всем содержимым: {"parent": <id | null>, "name": ...}.
+        Без parent копия создаётся рядом с оригиналом. Байты файлов не копируются.
+        """
+        folder = self.get_object()
+        if not (request.user.is_staff or folder.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        folder.parent = p
-        folder.save(update_fields=["parent"])
-        return Response(self.get_serializer(folder).data)
+        parent = folder.parent
+        if "parent" in request.data:
+            parent_id = request.data.get("parent")
+            parent = None
+            if parent_id not in (None, "", "null"):
+                try:
+                    parent = Folder.objects.get(pk=parent_id)
+                except Folder.DoesNotExist:
+                    return Response({"detail": "Target parent not found"}, status=status.HTTP_400_BAD_REQUEST)
+                if parent.owner_id != folder.owner_id:
+                    return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+        name = request.data.get("name") or (
+            f"{folder.name} (копия)" if parent == folder.parent else folder.name
+        )
+        try:
+            copy = copying.copy_folder(folder, parent, name)
+        except copying.QuotaExceeded:
+            return Response({"detail": "Квота превышена"}, status=status.HTTP_400_BAD_REQUEST)
+        except copying.CopyConflict:
+            return Response({"detail": "Содержимое папки изменилось, повторите копирование"}, status=status.HTTP_409_CONFLICT)
+        except IntegrityError:
+            return Response({"detail": "В целевой папке уже есть папка с таким именем"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(copy).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def bulk_move(self, request):
+        """
+        Перемещает несколько папок и файлов в одну целевую папку:
+        {"folders": [...], "files": [...], "parent": <id | null>}.
+        Поддерево каждой папки переписывается одним UPDATE.
+        """
+        folder_ids = request.data.get("folders") or []
+        file_ids = request.data.get("files") or []
+        if not isinstance(folder_ids, list) or not isinstance(file_ids, list):
+            return Response({"detail": "folders и files должны быть списками"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(folder_ids) + len(file_ids) > BULK_MAX_ITEMS:
+            return Response({"detail": f"Не больше {BULK_MAX_ITEMS} объектов за запрос"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            folder_ids = list(dict.fromkeys(int(pk) for pk in folder_ids))
+            file_ids = list(dict.fromkeys(int(pk) for pk in file_ids))
+        except (TypeError, ValueError):
+            return Response({"detail": "folders и files должны содержать целые числа"}, status=status.HTTP_400_BAD_REQUEST)
+
+        parent_id = request.data.get("parent")
+        parent = None
+        if parent_id not in (None, "", "null"):
+            try:
+                parent = Folder.objects.get(pk=int(parent_id))
+            except (Folder.DoesNotExist, TypeError, ValueError):
+                return Response({"detail": "Target parent not found"}, status=status.HTTP_400_BAD_REQUEST)
+            if not (request.user.is_staff or parent.owner == request.user):
+                return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+
+        folders_qs = Folder.objects.filter(pk__in=folder_ids)
+        files_qs = UserFile.objects.filter(pk__in=file_ids)
+        if not request.user.is_staff:
+            folders_qs = folders_qs.filter(owner=request.user)
+            files_qs = files_qs.filter(owner=request.user)
+        folders = list(folders_qs.order_by("depth"))
+        file_owners = set(files_qs.values_list("owner_id", flat=True))
+        if len(folders) != len(folder_ids) or files_qs.count() != len(file_ids):
+            return Response({"detail": "Часть объектов не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        # администратор видит чужие объекты, но переносить их в папку другого владельца нельзя
+        if parent is not None and ({f.owner_id for f in folders} | file_owners) - {parent.owner_id}:
+            return Response({"detail": "Папка принадлежит другому пользователю"}, status=status.HTTP_403_FORBIDDEN)
+
+        # папки, чей предок тоже выбран, переедут вместе с ним
+        selected = {f.pk for f in folders}
+        roots = [f for f in folders if not any(pk in selected for pk in f.get_ancestor_ids()[:-1])]
+
+        with transaction.atomic():
+            error = self._move_folders(roots, parent)
+            if error:
+                return error
+            changes.record_rows(ChangeEvent.KIND_FILE, ChangeEvent.ACTION_UPDATE, files_qs.values_list("pk", "owner_id"))
+            files_qs.update(folder=parent)
+
+        return Response({"folders": [f.pk for f in folders], "files": list(file_ids)}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["delete"])
     def purge(self, request, pk=None):
         folder = self.get_object()
         if not (request.user.is_staff or folder.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        ids = self._collect_folder_and_children_ids(folder)
-        files = UserFile.objects.filter(folder_id__in=ids)
-        total_size = files.aggregate(sum=Sum("size"))["sum"] or 0
-        files.delete()
-        Folder.objects.filter(id__in=ids).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # удаление большого поддерева выполняется в фоне; статус — /api/jobs/<id>/
+        job = jobs.enqueue(BackgroundJob.KIND_PURGE_FOLDER, folder.pk, request.user)
+        return Response(BackgroundJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
 class UserFileViewSet(viewsets.ModelViewSet):
@@ -222,11 +465,12 @@ class UserFileViewSet(viewsets.ModelViewSet):
     serializer_class = UserFileSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = UserFilePagination
 
     def get_queryset(self):
         user = self.request.user
         folder_q = self.request.query_params.get("folder")
-        qs = UserFile.objects.filter(owner=user)
+        qs = file_queryset().filter(owner=user)
 
         if folder_q is not None:
             if folder_q.lower() in ("null", "none", ""):
@@ -268,6 +512,11 @@ class UserFileViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Только чтение"}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            UserProfile.adjust_usage(instance.owner_id, -(instance.size or 0), -1)
+
     def create(self, request, *args, **kwargs):
         uploaded_file = request.FILES.get("file")
         if not uploaded_file:
@@ -285,23 +534,39 @@ class UserFileViewSet(viewsets.ModelViewSet):
 
         comment = request.data.get("comment", "")
         original_name = request.data.get("original_name", uploaded_file.name)
+        try:
+            expected = expected_sha256(request)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         profile = getattr(request.user, "profile", None)
-        size = getattr(uploaded_file, "size", None)
-        if profile and size is not None:
-            used = profile.get_used_bytes()
-            if profile.quota is not None and (used + size > profile.quota):
-                return Response({"detail": "Квота превышена"}, status=status.HTTP_400_BAD_REQUEST)
+        size = getattr(uploaded_file, "size", None) or 0
+        if profile and not UserProfile.reserve_bytes(request.user.id, size):
+            return Response({"detail": "Квота превышена"}, status=status.HTTP_400_BAD_REQUEST)
 
         userfile = UserFile(
             owner=request.user,
             folder=folder,
             original_name=original_name,
             comment=comment,
-            size=getattr(uploaded_file, "size", 0),
+            size=size,
         )
-        userfile.file.save(uploaded_file.name, uploaded_file, save=False)
-        userfile.save()
+        try:
+            # одинаковое содержимое хранится один раз — файл ссылается на общий blob
+            userfile.blob = blobs.store_upload(uploaded_file, expected)
+            userfile.file.name = userfile.blob.file_name
+            with transaction.atomic():
+                userfile.save()
+                UserProfile.commit_reserved(request.user.id, size)
+                previews.schedule(userfile)
+        except Exception as exc:
+            UserProfile.release_bytes(request.user.id, size)
+            # строка в БД откатилась вместе с транзакцией — снимаем и ссылку на blob
+            if userfile.blob_id:
+                blobs.unlink_after_commit(Blob.release([userfile.blob_id]))
+            if isinstance(exc, blobs.ChecksumMismatch):
+                return checksum_mismatch_response(exc)
+            raise
 
         serializer = self.get_serializer(userfile, context={"request": request})
         headers = self.get_success_headers(serializer.data)
@@ -313,11 +578,7 @@ class UserFileViewSet(viewsets.ModelViewSet):
         obj = self.get_object()
         if not (request.user.is_staff or obj.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        if not obj.share_token:
-            obj.share_token = secrets.token_urlsafe(16)
-            obj.save(update_fields=["share_token"])
-        share_url = request.build_absolute_uri(reverse("external-download", args=[obj.share_token]))
-        return Response({"share_url": share_url})
+        return share_response(request, obj)
 
     @action(detail=True, methods=["get"])
     def download(self, request, pk=None):
@@ -325,15 +586,41 @@ class UserFileViewSet(viewsets.ModelViewSet):
         if not (request.user.is_staff or obj.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
         try:
-            try:
-                obj.download_count = (obj.download_count or 0) + 1
-                obj.last_downloaded_at = timezone.now()
-                obj.save(update_fields=["download_count", "last_downloaded_at"])
-            except Exception:
-                pass
-            return FileResponse(obj.file.open("rb"), as_attachment=True, filename=obj.original_name)
+            response = file_response(request, obj)
         except Exception:
             raise Http404
+        if is_new_download(request, response):
+            record_download(obj)
+        return response
+
+    @action(detail=True, methods=["get"])
+    def preview(self, request, pk=None):
+        """
+        Превью файла вместо оригинала: ?size=<px> округляется до previews.SIZES.
+        Изображения и первая страница PDF — картинкой, текст — начало файла.
+        """
+        obj = self.get_object()
+        if not (request.user.is_staff or obj.owner == request.user):
+            return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+        kind = previews.preview_kind(obj.original_name)
+        if kind is None or not obj.file:
+            return Response({"detail": "Превью недоступно"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            size = int(request.query_params.get("size", previews.DEFAULT_SIZE))
+            if size <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({"detail": "Неверный размер"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return previews.preview_response(request, obj, kind, size)
+        except previews.PreviewNotReady:
+            return Response(
+                {"detail": "Превью готовится, повторите запрос"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "2"},
+            )
+        except previews.PreviewUnavailable:
+            return Response({"detail": "Превью недоступно"}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=True, methods=["post"])
     def rename(self, request, pk=None):
@@ -343,16 +630,7 @@ class UserFileViewSet(viewsets.ModelViewSet):
         new_name = request.data.get("name")
         if not new_name:
             return Response({"detail": "имя обязательно"}, status=status.HTTP_400_BAD_REQUEST)
-        if "." in obj.original_name:
-            ext = obj.original_name.split(".")[-1]
-            if "." in new_name:
-                new_name = new_name.rsplit(".", 1)[0]
-            obj.original_name = f"{new_name}.{ext}"
-        else:
-            # no extension present
-            if "." in new_name:
-                new_name = new_name.rsplit(".", 1)[0]
-            obj.original_name = new_name
+        obj.original_name = renamed_file(obj.original_name, new_name)
         obj.save(update_fields=["original_name"])
         return Response(self.get_serializer(obj).data)
 
@@ -376,26 +654,373 @@ class UserFileViewSet(viewsets.ModelViewSet):
         obj.save(update_fields=["folder"])
         return Response(self.get_serializer(obj).data)
 
+    @action(detail=True, methods=["post"])
+    def copy(self, request, pk=None):
+        """
+        Копирует файл: {"folder": <id | null>, "name": ...}. Без folder копия
+        создаётся в той же папке. Копия ссылается на те же байты (Blob).
+        """
+        obj = self.get_object()
+        if not (request.user.is_staff or obj.owner == request.user):
+            return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+        target = obj.folder
+        if "folder" in request.data:
+            folder_id = request.data.get("folder")
+            target = None
+            if folder_id not in (None, "", "null"):
+                try:
+                    target = Folder.objects.get(pk=folder_id)
+                except Folder.DoesNotExist:
+                    return Response({"detail": "Target folder not found"}, status=status.HTTP_400_BAD_REQUEST)
+                if target.owner_id != obj.owner_id:
+                    return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+        names = {obj.pk: request.data["name"]} if request.data.get("name") else None
+        try:
+            copies = copying.copy_files(UserFile.objects.filter(pk=obj.pk), obj.owner_id, target, names)
+        except copying.QuotaExceeded:
+            return Response({"detail": "Квота превышена"}, status=status.HTTP_400_BAD_REQUEST)
+        except copying.CopyConflict:
+            return Response({"detail": "Файл изменился, повторите копирование"}, status=status.HTTP_409_CONFLICT)
+        if not copies:
+            raise Http404
+        return Response(self.get_serializer(copies[0]).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=["delete"])
     def purge(self, request, pk=None):
         """Удаление файла"""
         obj = self.get_object()
         if not (request.user.is_staff or obj.owner == request.user):
             return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
-        size = obj.size or 0
-        owner_profile = getattr(obj.owner, "profile", None)
-        obj.file.delete(save=False)
-        obj.delete()
+        # байты удаляет post_delete через Blob.release — только когда на blob больше никто не ссылается
+        self.perform_destroy(obj)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Поиск по своим файлам: ?q=...&mode=prefix|substring|fulltext[&folder=<id>].
+        С folder ищет только в папке и её подпапках.
+        """
+        q = (request.query_params.get("q") or "").strip()
+        if not q:
+            return Response({"detail": "q обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+        mode = request.query_params.get("mode") or "substring"
+        if mode not in search.MODES:
+            return Response({"detail": f"mode: одно из {', '.join(search.MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = file_queryset().filter(owner=request.user)
+        folder_id = request.query_params.get("folder")
+        if folder_id:
+            folder = Folder.objects.filter(pk=folder_id, owner=request.user).only("path").first()
+            if folder is None:
+                return Response({"detail": "Папка не найдена"}, status=status.HTTP_404_NOT_FOUND)
+            qs = qs.filter(folder__path__startswith=folder.path)
+
+        paginator = FileSearchPagination()
+        page = paginator.paginate_queryset(search.search_files(qs, q, mode), request, view=self)
+        data = UserFileSerializer(page, many=True, context={"request": request}).data
+        return paginator.get_paginated_response(data)
+
+    # --- пакетные операции: {"ids": [...]} -> {"results": [{"id", "status", ...}, ...]} ---
+
+    def _bulk_files(self, request, ids):
+        """
+        Файлы из ids одним запросом. Возвращает (ids, {id: UserFile}) или
+        Response с ошибкой. Чужие файлы для не-администратора не видны и
+        получают тот же статус 404, что и несуществующие.
+        """
+        if not isinstance(ids, list) or not ids:
+            return None, Response({"detail": "ids должен быть непустым списком"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > BULK_MAX_ITEMS:
+            return None, Response({"detail": f"Не больше {BULK_MAX_ITEMS} файлов за запрос"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids))
+        except (TypeError, ValueError):
+            return None, Response({"detail": "ids должны быть целыми числами"}, status=status.HTTP_400_BAD_REQUEST)
+        qs = UserFile.objects.filter(pk__in=ids)
+        if not request.user.is_staff:
+            qs = qs.filter(owner=request.user)
+        return ids, {f.pk: f for f in qs}
+
+    @staticmethod
+    def _bulk_results(ids, results):
+        # results: {id: dict} для обработанных; остальные — не найдены
+        return Response({
+            "results": [
+                results.get(pk) or {"id": pk, "status": 404, "detail": "Файл не найден"}
+                for pk in ids
+            ]
+        })
+
+    @action(detail=False, methods=["post"])
+    def bulk_move(self, request):
+        """{"ids": [...], "folder": <id | null>} — одним UPDATE."""
+        ids, found = self._bulk_files(request, request.data.get("ids"))
+        if ids is None:
+            return found
+        folder_id = request.data.get("folder")
+        target = None
+        if folder_id not in (None, "", "null"):
+            try:
+                target = Folder.objects.get(pk=folder_id)
+            except Folder.DoesNotExist:
+                return Response({"detail": "Target folder not found"}, status=status.HTTP_400_BAD_REQUEST)
+            if not (request.user.is_staff or target.owner == request.user):
+                return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+
+        results = {}
+        movable = []
+        for pk, f in found.items():
+            if target is not None and f.owner_id != target.owner_id:
+                results[pk] = {"id": pk, "status": 403, "detail": "Папка принадлежит другому пользователю"}
+            else:
+                movable.append(pk)
+                results[pk] = {"id": pk, "status": 200, "folder": target.pk if target else None}
+        with transaction.atomic():
+            UserFile.objects.filter(pk__in=movable).update(folder=target)
+            changes.record_rows(ChangeEvent.KIND_FILE, ChangeEvent.ACTION_UPDATE, [(pk, found[pk].owner_id) for pk in movable])
+        return self._bulk_results(ids, results)
+
+    @action(detail=False, methods=["post"])
+    def bulk_delete(self, request):
+        """{"ids": [...]} — пачками DELETE, как при очистке папки (см. purge.py)."""
+        ids, found = self._bulk_files(request, request.data.get("ids"))
+        if ids is None:
+            return found
+        delete_files(UserFile.objects.filter(pk__in=list(found)))
+        results = {pk: {"id": pk, "status": 204} for pk in found}
+        return self._bulk_results(ids, results)
+
+    @action(detail=False, methods=["post"])
+    def bulk_share(self, request):
+        """
+        {"ids": [...], "expires_in", "max_downloads"} — создаёт или возвращает ссылки;
+        с "action": "revoke" отзывает их.
+        """
+        ids, found = self._bulk_files(request, request.data.get("ids"))
+        if ids is None:
+            return found
+        files = list(found.values())
+        if request.data.get("action") in ("revoke", "unshare"):
+            sharing.revoke_many(files)
+            results = {pk: {"id": pk, "status": 200} for pk in found}
+            return self._bulk_results(ids, results)
+        try:
+            expires_at, max_downloads = share_options(request)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        links = sharing.share_many(files, expires_at=expires_at, max_downloads=max_downloads)
+        results = {pk: {"id": pk, "status": 200, **share_link_data(request, link)} for pk, link in links.items()}
+        return self._bulk_results(ids, results)
+
+    @action(detail=False, methods=["post"])
+    def bulk_rename(self, request):
+        """{"items": [{"id": ..., "name": ...}, ...]} — одним bulk_update."""
+        items = request.data.get("items")
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return Response({"detail": "items должен быть списком объектов {id, name}"}, status=status.HTTP_400_BAD_REQUEST)
+        ids, found = self._bulk_files(request, [item.get("id") for item in items])
+        if ids is None:
+            return found
+
+        results = {}
+        renamed = []
+        for item in items:
+            pk = int(item["id"])
+            f = found.get(pk)
+            if f is None:
+                continue
+            if not item.get("name"):
+                results[pk] = {"id": pk, "status": 400, "detail": "имя обязательно"}
+                continue
+            f.original_name = renamed_file(f.original_name, item["name"])
+            renamed.append(f)
+            results[pk] = {"id": pk, "status": 200, "original_name": f.original_name}
+        with transaction.atomic():
+            UserFile.objects.bulk_update(renamed, ["original_name"], batch_size=1000)
+            changes.record_objects(ChangeEvent.ACTION_UPDATE, renamed)
+        return self._bulk_results(ids, results)
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadSessionViewSet(viewsets.ViewSet):
+    """
+    Возобновляемая загрузка по частям:
+      POST   /uploads/                — начать: original_name, size, folder, comment; квота резервируется
+      PUT    /uploads/<id>/           — дописать часть (Content-Range: bytes <start>-<end>/<total>)
+      GET    /uploads/<id>/           — сколько байт уже принято (offset)
+      POST   /uploads/<id>/complete/  — зарегистрировать готовый файл (необязательно sha256 для проверки)
+      DELETE /uploads/<id>/           — отменить загрузку
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, FormParser]
+    lookup_value_regex = "[0-9a-fA-F-]{32,36}"
+
+    def _get_session(self, request, pk):
+        return get_object_or_404(UploadSession, pk=pk, owner=request.user)
+
+    def create(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        folder = serializer.validated_data.get("folder")
+        if folder and not (request.user.is_staff or folder.owner == request.user):
+            return Response({"detail": "Запрещено"}, status=status.HTTP_403_FORBIDDEN)
+
+        size = serializer.validated_data["size"]
+        if getattr(request.user, "profile", None) and not UserProfile.reserve_bytes(request.user.id, size):
+            return Response({"detail": "Квота превышена"}, status=status.HTTP_400_BAD_REQUEST)
+
+        storage = UserFile._meta.get_field("file").storage
+        try:
+            name = user_file_upload_to(UserFile(owner=request.user, folder=folder), serializer.validated_data["original_name"])
+            file_name = storage.save(name, ContentFile(b""))
+            serializer.save(owner=request.user, file_name=file_name)
+        except Exception:
+            UserProfile.release_bytes(request.user.id, size)
+            raise
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(UploadSessionSerializer(self._get_session(request, pk)).data)
+
+    def update(self, request, pk=None):
+        session = self._get_session(request, pk)
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+
+        content_range = request.META.get("HTTP_CONTENT_RANGE")
+        if content_range:
+            match = CONTENT_RANGE_RE.match(content_range.strip())
+            if not match:
+                return Response({"detail": "Неверный заголовок Content-Range"}, status=status.HTTP_400_BAD_REQUEST)
+            start = int(match.group(1))
+            if int(match.group(2)) - start + 1 != length:
+                return Response({"detail": "Content-Range не совпадает с длиной тела"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            try:
+                start = int(request.META["HTTP_UPLOAD_OFFSET"]) if request.META.get("HTTP_UPLOAD_OFFSET") else None
+            except ValueError:
+                return Response({"detail": "Неверный заголовок Upload-Offset"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # быстрый отказ до чтения тела; окончательно смещение проверяет условный UPDATE ниже
+        if start is None:
+            start = session.offset
+        if start != session.offset:
+            return Response({"detail": "Неверное смещение", "offset": session.offset}, status=status.HTTP_409_CONFLICT)
+        if start + length > session.size:
+            return Response({"detail": "Часть выходит за объявленный размер файла"}, status=status.HTTP_400_BAD_REQUEST)
+
+        error = None
+        written = 0
+        path = UserFile._meta.get_field("file").storage.path(session.file_name)
+        # тело читается от клиента сколь угодно долго — сначала складываем часть
+        # во временный файл рядом с загрузкой, не держа ни транзакции, ни блокировок
+        with tempfile.TemporaryFile(dir=os.path.dirname(path)) as part:
+            try:
+                while written < length:
+                    block = request.stream.read(min(UPLOAD_BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    part.write(block)
+                    written += len(block)
+            except Exception as exc:
+                # обрыв соединения: фиксируем то, что успели получить, и пробрасываем ошибку
+                error = exc
+
+            with transaction.atomic():
+                # условный UPDATE занимает диапазон и держит строку сессии до коммита:
+                # параллельный PUT с тем же смещением не совпадёт ни с одной строкой и получит 409
+                now = timezone.now()
+                claimed = UploadSession.objects.filter(pk=session.pk, offset=start).update(
+                    offset=start + written, updated_at=now
+                )
+                if not claimed:
+                    if error is not None:
+                        raise error
+                    session = get_object_or_404(UploadSession, pk=session.pk)
+                    return Response({"detail": "Неверное смещение", "offset": session.offset}, status=status.HTTP_409_CONFLICT)
+                part.seek(0)
+                with open(path, "r+b") as fh:
+                    fh.seek(start)
+                    shutil.copyfileobj(part, fh, UPLOAD_BLOCK_SIZE)
+                    fh.truncate()
+        if error is not None:
+            raise error
+        session.offset, session.updated_at = start + written, now
+        return Response(UploadSessionSerializer(session).data)
+
+    def destroy(self, request, pk=None):
+        session = self._get_session(request, pk)
+        if UploadSession.objects.filter(pk=session.pk).delete()[0]:
+            UserProfile.release_bytes(session.owner_id, session.size)
+            UserFile._meta.get_field("file").storage.delete(session.file_name)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        session = self._get_session(request, pk)
+        if not session.is_complete:
+            return Response(
+                {"detail": "Файл загружен не полностью", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        try:
+            expected = expected_sha256(request)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+            raise Http404
+        userfile = UserFile(
+            owner=session.owner,
+            folder=session.folder,
+            original_name=session.original_name,
+            comment=session.comment,
+            size=session.size,
+        )
+        try:
+            # байты уже лежат в хранилище — переносим их в blob (или отбрасываем дубликат)
+            userfile.blob = blobs.adopt(session.file_name, expected)
+            userfile.file.name = userfile.blob.file_name
+            with transaction.atomic():
+                userfile.save()
+                UserProfile.commit_reserved(session.owner_id, session.size)
+                previews.schedule(userfile)
+        except Exception as exc:
+            UserProfile.release_bytes(session.owner_id, session.size)
+            if userfile.blob_id:
+                blobs.unlink_after_commit(Blob.release([userfile.blob_id]))
+            else:
+                UserFile._meta.get_field("file").storage.delete(session.file_name)
+            if isinstance(exc, blobs.ChecksumMismatch):
+                # какая часть повреждена, неизвестно — загрузку нужно начать заново
+                return checksum_mismatch_response(exc)
+            raise
+        data = UserFileSerializer(userfile, context={"request": request}).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class BackgroundJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Статус фоновых задач: пользователь видит свои, администратор — все."""
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = BackgroundJob.objects.all()
+        if not self.request.user.is_staff:
+            qs = qs.filter(requested_by=self.request.user)
+        return qs
+
+
 class AdminUserViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAdminUser]
 
     def list(self, request):
-        qs = User.objects.all().order_by("id")
-        serializer = AdminUserSerializer(qs, many=True, context={"request": request})
-        return Response(serializer.data)
+        paginator = AdminUserPagination()
+        page = paginator.paginate_queryset(User.objects.select_related("profile"), request, view=self)
+        serializer = AdminUserSerializer(page, many=True, context={"request": request})
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk=None):
         folder = self.get_object()
@@ -463,27 +1088,43 @@ class AdminUserViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=["get"])
     def storage(self, request, pk=None):
+        """
+        Содержимое папки пользователя: ?parent=<id> (без него — корень).
+        Папки и файлы листаются независимо: folders_next / files_next.
+        """
         user = get_object_or_404(User, pk=pk)
-        folders = Folder.objects.filter(owner=user, parent__isnull=True).order_by("name")
-        files = UserFile.objects.filter(owner=user, folder__isnull=True).order_by("-uploaded_at")
+        parent_id = request.query_params.get("parent")
+        if parent_id in (None, "", "null", "none"):
+            parent = None
+        else:
+            parent = get_object_or_404(Folder, pk=parent_id, owner=user)
+        folder_pages = StorageFoldersPagination()
+        folders = folder_pages.paginate_queryset(
+            folder_queryset().filter(owner=user, parent=parent), request, view=self
+        )
+        file_pages = StorageFilesPagination()
+        files = file_pages.paginate_queryset(
+            file_queryset().filter(owner=user, folder=parent), request, view=self
+        )
 
-        folder_ser = FolderSerializer(folders, many=True, context={"request": request})
+        folder_ser = FolderSerializer(
+            folders, many=True, context={"request": request, "folder_tree": FolderTree.for_folders(folders)}
+        )
         file_ser = UserFileSerializer(files, many=True, context={"request": request})
 
         profile = getattr(user, "profile", None)
-        used_bytes = 0
-        try:
-            used_bytes = int(user.files.aggregate(total=Sum("size"))["total"] or 0)
-        except Exception:
-            used_bytes = 0
         if profile:
+            used_bytes = profile.get_used_bytes()
             quota = profile.quota
         else:
+            used_bytes = 0
             quota = getattr(settings, "USER_DEFAULT_QUOTA", 10 * 1024 * 1024 * 1024)
 
         return Response({
             "folders": folder_ser.data,
             "files": file_ser.data,
+            "folders_next": folder_pages.get_next_link(),
+            "files_next": file_pages.get_next_link(),
             "used_bytes": used_bytes,
             "quota": quota,
         }, status=status.HTTP_200_OK)
@@ -492,11 +1133,14 @@ class AdminUserViewSet(viewsets.ViewSet):
         user = get_object_or_404(User, pk=pk)
         purge = request.query_params.get("purge", "false").lower() in ("1", "true", "yes")
         if purge:
-            with transaction.atomic():
-                files_qs = user.files.all()
-                files_qs.delete()
-                user.delete()
-            return Response({"detail": "Пользователь и его файлы удалены"}, status=status.HTTP_200_OK)
+            # блокируем вход на время очистки, сами данные удаляет фоновая задача
+            user.is_active = False
+            user.save(update_fields=["is_active"])
+            job = jobs.enqueue(BackgroundJob.KIND_PURGE_USER, user.pk, request.user)
+            return Response(
+                {"detail": "Удаление пользователя и его файлов запущено", "job": BackgroundJobSerializer(job).data},
+                status=status.HTTP_202_ACCEPTED,
+            )
         else:
             user.delete()
             return Response({"detail": "Пользователь удален"}, status=status.HTTP_200_OK)
@@ -505,11 +1149,13 @@ class AdminUserViewSet(viewsets.ViewSet):
     def storage_tree(self, request, pk=None):
         user = get_object_or_404(User, pk=pk)
 
-        root_folders = Folder.objects.filter(owner=user, parent__isnull=True).order_by("name")
-        root_files = UserFile.objects.filter(owner=user, folder__isnull=True).order_by("-uploaded_at")
+        root_folders = list(folder_queryset().filter(owner=user, parent__isnull=True).order_by("name"))
+        root_files = file_queryset().filter(owner=user, folder__isnull=True).order_by("-uploaded_at")
 
         tree_data = {
-            "root_folders": FolderSerializer(root_folders, many=True, context={"request": request}).data,
+            "root_folders": FolderSerializer(
+                root_folders, many=True, context={"request": request, "folder_tree": FolderTree.for_folders(root_folders)}
+            ).data,
             "root_files": UserFileSerializer(root_files, many=True, context={"request": request}).data,
             "user_info": {
                 "id": user.id,
@@ -523,30 +1169,7 @@ class AdminUserViewSet(viewsets.ViewSet):
     @action(detail=True, methods=["get"])
     def folder_tree(self, request, pk=None):
         user = get_object_or_404(User, pk=pk)
-        folders = Folder.objects.filter(owner=user).order_by("name")
-        def build_tree(flat_folders):
-            nodes = {}
-            roots = []
-            for folder in flat_folders:
-                nodes[folder.id] = {
-                    'id': folder.id,
-                    'name': folder.name,
-                    'parent': folder.parent_id if folder.parent else None,
-                    'children': []
-                }
-
-            for folder in flat_folders:
-                node = nodes[folder.id]
-                if node['parent']:
-                    if node['parent'] in nodes:
-                        nodes[node['parent']]['children'].append(node)
-                else:
-                    roots.append(node)
-
-            return roots
-
-        tree = build_tree(folders)
-        return Response(tree)
+        return Response(tree_cache.get_tree(user.pk))
 
     @action(detail=True, methods=["get"])
     def folder_contents(self, request, pk=None):
@@ -557,15 +1180,16 @@ class AdminUserViewSet(viewsets.ViewSet):
             return Response({"detail": "folder_id parameter required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            folder = Folder.objects.get(id=folder_id, owner=user)
+            folder = folder_queryset().get(id=folder_id, owner=user)
         except Folder.DoesNotExist:
             return Response({"detail": "Folder not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        children = Folder.objects.filter(parent=folder, owner=user).order_by("name")
-        files = UserFile.objects.filter(folder=folder, owner=user).order_by("-uploaded_at")
+        children = folder_queryset().filter(parent=folder, owner=user).order_by("name")
+        files = file_queryset().filter(folder=folder, owner=user).order_by("-uploaded_at")
 
-        folder_data = FolderSerializer(folder, context={"request": request}).data
-        children_data = FolderSerializer(children, many=True, context={"request": request}).data
+        context = {"request": request, "folder_tree": FolderTree.for_folders([folder])}
+        folder_data = FolderSerializer(folder, context=context).data
+        children_data = FolderSerializer(children, many=True, context=context).data
         files_data = UserFileSerializer(files, many=True, context={"request": request}).data
 
         return Response({
@@ -579,59 +1203,40 @@ class AdminUserViewSet(viewsets.ViewSet):
 @permission_classes([AllowAny])
 def external_download(request, token):
     """
-    Публичный эндпоинт: ищем сначала файл по token, затем папку.
-    Если найден файл — отдаём его (FileResponse) и увеличиваем счётчик.
-    Если найдена папка — создаём zip и отдаём.
+    Публичный эндпоинт: токен разрешается одним поиском по PK ShareLink
+    (горячие токены — из кэша процесса), затем объект выбирается по id.
+    Файл отдаётся через file_response, папка — потоковым zip.
     """
-    try:
-        f = UserFile.objects.filter(share_token=token).first()
-        if f:
-            try:
-                f.download_count = (f.download_count or 0) + 1
-                f.last_downloaded_at = timezone.now()
-                f.save(update_fields=["download_count", "last_downloaded_at"])
-            except Exception:
-                pass
-            try:
-                return FileResponse(f.file.open("rb"), as_attachment=True, filename=f.original_name)
-            except Exception:
-                raise Http404
-
-        folder = Folder.objects.filter(share_token=token).first()
-        if folder:
-            def collect_ids(folder):
-                ids = [folder.id]
-                stack = [folder]
-                while stack:
-                    cur = stack.pop()
-                    children = Folder.objects.filter(parent=cur)
-                    for c in children:
-                        ids.append(c.id)
-                        stack.append(c)
-                return ids
-            ids = collect_ids(folder)
-            files_qs = UserFile.objects.filter(folder_id__in=ids)
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-            try:
-                with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for ff in files_qs:
-                        try:
-                            zf.write(ff.file.path, arcname=ff.original_name)
-                        except Exception:
-                            continue
-                tmp.flush()
-                tmp.close()
-                return FileResponse(open(tmp.name, "rb"), as_attachment=True, filename=f"{folder.name}.zip")
-            finally:
-                try:
-                    os.unlink(tmp.name)
-                except Exception:
-                    pass
-
-    except Exception:
-        pass
-
-    return Response({"detail": "Токен не обнаружен"}, status=status.HTTP_404_NOT_FOUND)
+    link = sharing.resolve(token)
+    if link is None:
+        return Response({"detail": "Токен не обнаружен"}, status=status.HTTP_404_NOT_FOUND)
+    if sharing.is_expired(link):
+        return Response({"detail": "Срок действия ссылки истёк"}, status=status.HTTP_410_GONE)
+
+    obj = sharing.shared_object(link)
+    if obj is None:
+        return Response({"detail": "Токен не обнаружен"}, status=status.HTTP_404_NOT_FOUND)
+
+    if link.kind == ShareLink.KIND_FILE:
+        if not obj.file:
+            return Response({"detail": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
+        response = file_response(request, obj)
+        counted = is_new_download(request, response)
+        # по ссылке с лимитом любой ответ с телом расходует скачивание, иначе запросы
+        # Range (не с начала файла, несколько диапазонов) отдавали бы файл сверх лимита
+        limited = link.max_downloads is not None and request.method == "GET" and response.status_code in (200, 206)
+        if counted or limited:
+            if not sharing.claim_download(link):
+                discard(response)
+                return Response({"detail": "Лимит скачиваний исчерпан"}, status=status.HTTP_410_GONE)
+        if counted:
+            record_download(obj)
+        return response
+
+    if not sharing.claim_download(link):
+        return Response({"detail": "Лимит скачиваний исчерпан"}, status=status.HTTP_410_GONE)
+    files_qs = UserFile.objects.filter(folder__path__startswith=obj.path)
+    return zip_folder_response(obj, files_qs)
 
 
 @ensure_csrf_cookie
@@ -643,33 +1248,51 @@ def csrf_token_view(request):
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def folder_tree_view(request):
-    user = request.user
-    folders = Folder.objects.filter(owner=user).order_by("name")
-
-    def build_tree(flat_folders):
-        nodes = {}
-        roots = []
-
-        for folder in flat_folders:
-            nodes[folder.id] = {
-                'id': folder.id,
-                'name': folder.name,
-                'parent': folder.parent_id if folder.parent else None,
-                'children': []
-            }
+    return Response(tree_cache.get_tree(request.user.pk))
 
-        for folder in flat_folders:
-            node = nodes[folder.id]
-            if node['parent']:
-                if node['parent'] in nodes:
-                    nodes[node['parent']]['children'].append(node)
-            else:
-                roots.append(node)
 
-        return roots
-
-    tree = build_tree(folders)
-    return Response(tree)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def changes_view(request):
+    """
+    Изменения своих папок и файлов после курсора ?since=<cursor>.
+    Без since — только текущий курсор (с него клиент начинает после полной
+    загрузки). 410 — журнал после since уже очищен, нужна полная синхронизация.
+    Долгий опрос (?timeout=) — см. async_views.changes_long_poll.
+    """
+    user = request.user
+    cursor = changes.current_seq(user.pk)
+    since = request.query_params.get("since")
+    if since in (None, ""):
+        return Response({"cursor": cursor})
+    try:
+        since = int(since)
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return Response({"detail": "since должен быть неотрицательным целым"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        delta = changes.changes_since(user.pk, since, cursor, getattr(settings, "CLOUD_CHANGES_PAGE_SIZE", 1000))
+    except changes.JournalGap:
+        return Response({"detail": "Нужна полная синхронизация", "cursor": cursor}, status=status.HTTP_410_GONE)
+
+    folders = list(folder_queryset().filter(owner=user, pk__in=delta.folder_ids))
+    files = list(file_queryset().filter(owner=user, pk__in=delta.file_ids))
+    # объект удалён событием со следующей страницы — для клиента он уже удалён
+    found_folders = {f.pk for f in folders}
+    found_files = {f.pk for f in files}
+    return Response({
+        "cursor": delta.cursor,
+        "has_more": delta.has_more,
+        "folders": FolderSerializer(
+            folders, many=True, context={"request": request, "folder_tree": FolderTree.for_folders(folders)}
+        ).data,
+        "files": UserFileSerializer(files, many=True, context={"request": request}).data,
+        "deleted": {
+            "folders": delta.deleted_folders + [pk for pk in delta.folder_ids if pk not in found_folders],
+            "files": delta.deleted_files + [pk for pk in delta.file_ids if pk not in found_files],
+        },
+    })
 
 
 @api_view(["GET"])
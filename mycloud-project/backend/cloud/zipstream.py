@@ -0,0 +1,213 @@
+"""
+Потоковая сборка ZIP-архива.
+
+Архив формируется "на лету": локальные заголовки, данные, data descriptor'ы
+и центральный каталог отдаются по мере чтения файлов, без временного файла
+на диске. Память ограничена размером блока чтения и записями центрального
+каталога (около сотни байт на файл). Уже сжатые форматы сохраняются без
+повторного сжатия (ZIP_STORED), большие файлы и архивы пишутся в ZIP64.
+"""
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+ZIP64_LIMIT = (1 << 32) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+# флаги: bit 3 — размеры и CRC в data descriptor, bit 11 — имя в UTF-8
+FLAGS = 0x0008 | 0x0800
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# "made by": UNIX (3) в старшем байте
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+EXTERNAL_ATTR = (0o100644 & 0xFFFF) << 16
+
+# расширения, которые не имеет смысла сжимать повторно
+STORED_EXTENSIONS = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm",
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".epub", ".jar", ".apk",
+})
+
+ZipEntry = namedtuple("ZipEntry", ["arcname", "opener", "size", "date_time"])
+ZipEntry.__doc__ = """
+Элемент архива: arcname — имя внутри архива, opener — вызываемый объект,
+возвращающий открытый на чтение бинарный файл, size — ожидаемый размер
+(используется для выбора ZIP64), date_time — datetime или None.
+"""
+
+
+def compression_for(name):
+    ext = os.path.splitext(name)[1].lower()
+    return ZIP_STORED if ext in STORED_EXTENSIONS else ZIP_DEFLATED
+
+
+def _dos_datetime(dt):
+    if dt is None:
+        tt = time.localtime()[:6]
+    else:
+        tt = (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+    year, month, day, hour, minute, second = tt
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    dos_date = ((year - 1980) << 9) | (month << 5) | day
+    dos_time = (hour << 11) | (minute << 5) | (second // 2)
+    return dos_time, dos_date
+
+
+class _Record:
+    __slots__ = ("name", "method", "dos_time", "dos_date", "crc", "compressed", "size", "offset", "zip64")
+
+
+def _local_header(rec):
+    extra = b""
+    comp = size = 0
+    version = VERSION_DEFAULT
+    if rec.zip64:
+        # реальные размеры будут в data descriptor, здесь только резервируем поле
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        comp = size = 0xFFFFFFFF
+        version = VERSION_ZIP64
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50, version, FLAGS, rec.method, rec.dos_time, rec.dos_date,
+        0, comp, size, len(rec.name), len(extra),
+    ) + rec.name + extra
+
+
+def _data_descriptor(rec):
+    if rec.zip64:
+        return struct.pack("<IIQQ", 0x08074B50, rec.crc, rec.compressed, rec.size)
+    return struct.pack("<IIII", 0x08074B50, rec.crc, rec.compressed, rec.size)
+
+
+def _central_header(rec):
+    extra_fields = []
+    size = rec.size
+    comp = rec.compressed
+    offset = rec.offset
+    if size >= ZIP64_LIMIT:
+        extra_fields.append(size)
+        size = 0xFFFFFFFF
+    if comp >= ZIP64_LIMIT:
+        extra_fields.append(comp)
+        comp = 0xFFFFFFFF
+    if offset >= ZIP64_LIMIT:
+        extra_fields.append(offset)
+        offset = 0xFFFFFFFF
+    extra = b""
+    version = VERSION_DEFAULT
+    if extra_fields:
+        extra = struct.pack("<HH", 0x0001, 8 * len(extra_fields)) + struct.pack("<%dQ" % len(extra_fields), *extra_fields)
+        version = VERSION_ZIP64
+    elif rec.zip64:
+        version = VERSION_ZIP64
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, VERSION_MADE_BY, version, FLAGS, rec.method, rec.dos_time, rec.dos_date,
+        rec.crc, comp, size, len(rec.name), len(extra), 0, 0, 0, EXTERNAL_ATTR, offset,
+    ) + rec.name + extra
+
+
+def _end_records(count, cd_offset, cd_size):
+    out = b""
+    if count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_eocd_offset = cd_offset + cd_size
+        out += struct.pack(
+            "<IQHHIIQQQQ",
+            0x06064B50, 44, VERSION_MADE_BY, VERSION_ZIP64, 0, 0,
+            count, count, cd_size, cd_offset,
+        )
+        out += struct.pack("<IIQI", 0x07064B50, 0, zip64_eocd_offset, 1)
+    out += struct.pack(
+        "<IHHHHIIH",
+        0x06054B50, 0, 0,
+        min(count, ZIP_FILECOUNT_LIMIT), min(count, ZIP_FILECOUNT_LIMIT),
+        min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0,
+    )
+    return out
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    Генератор байтов ZIP-архива для итерируемого набора ZipEntry.
+
+    Файлы, которые не удалось открыть, пропускаются (как и при прежней
+    сборке во временный файл). Набор entries читается лениво, поэтому
+    можно передавать генератор поверх queryset.iterator().
+    """
+    records = []
+    offset = 0
+
+    for entry in entries:
+        try:
+            fh = entry.opener()
+        except Exception:
+            logger.warning("zip: не удалось открыть %s, файл пропущен", entry.arcname)
+            continue
+
+        rec = _Record()
+        rec.name = entry.arcname.encode("utf-8")
+        rec.method = compression_for(entry.arcname)
+        rec.dos_time, rec.dos_date = _dos_datetime(entry.date_time)
+        rec.crc = 0
+        rec.compressed = 0
+        rec.size = 0
+        rec.offset = offset
+        # как и zipfile: запас на случай, если deflate увеличит размер
+        rec.zip64 = (entry.size or 0) * 1.05 > ZIP64_LIMIT
+
+        header = _local_header(rec)
+        offset += len(header)
+        yield header
+
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if rec.method == ZIP_DEFLATED else None
+        try:
+            while True:
+                block = fh.read(chunk_size)
+                if not block:
+                    break
+                rec.size += len(block)
+                rec.crc = zlib.crc32(block, rec.crc)
+                data = compressor.compress(block) if compressor else block
+                if data:
+                    rec.compressed += len(data)
+                    yield data
+            if compressor:
+                data = compressor.flush()
+                if data:
+                    rec.compressed += len(data)
+                    yield data
+        finally:
+            fh.close()
+
+        if not rec.zip64 and (rec.size >= ZIP64_LIMIT or rec.compressed >= ZIP64_LIMIT):
+            # размер файла оказался больше заявленного — корректный архив уже не собрать
+            raise ValueError(f"zip: размер {entry.arcname} превысил ожидаемый, требуется ZIP64")
+
+        descriptor = _data_descriptor(rec)
+        offset += rec.compressed + len(descriptor)
+        yield descriptor
+        records.append(rec)
+
+    cd_offset = offset
+    cd_size = 0
+    for rec in records:
+        header = _central_header(rec)
+        cd_size += len(header)
+        yield header
+
+    yield _end_records(len(records), cd_offset, cd_size)
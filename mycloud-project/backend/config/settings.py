@@ -86,12 +86,63 @@ USE_I18N = True
 USE_L10N = True
 USE_TZ = True
 
+# Кэш (дерево папок, см. cloud/tree_cache.py). LocMemCache — только в пределах
+# процесса, сброс дерева в одном воркере другие не видят, поэтому с ним дерево
+# кэшируется лишь на CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL секунд. При нескольких
+# воркерах задайте общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и
+# CACHE_LOCATION=redis://127.0.0.1:6379/1 (нужен пакет redis),
+# django.core.cache.backends.memcached.PyMemcacheCache и 127.0.0.1:11211
+# (пакет pymemcache) или django.core.cache.backends.filebased.FileBasedCache
+# и /var/tmp/mycloud-cache
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "mycloud"),
+    }
+}
+
 # Статические и медиа файлы
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
 MEDIA_ROOT = os.path.abspath(os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media")))
+# Обработчики загрузки заодно считают SHA-256 — по нему одинаковые файлы хранятся один раз (cloud/blobs.py)
+FILE_UPLOAD_HANDLERS = [
+    "cloud.blobs.HashingMemoryFileUploadHandler",
+    "cloud.blobs.HashingTemporaryFileUploadHandler",
+]
+
+# Кто отдаёт файлы при скачивании: "django" (FileResponse), "nginx" (X-Accel-Redirect)
+# или "apache" (X-Sendfile). Для nginx нужен internal-location с alias на MEDIA_ROOT.
+CLOUD_FILE_SERVING = os.getenv("CLOUD_FILE_SERVING", "django")
+CLOUD_ACCEL_REDIRECT_PREFIX = os.getenv("CLOUD_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+CLOUD_FILE_BLOCK_SIZE = int(os.getenv("CLOUD_FILE_BLOCK_SIZE", str(1024 * 1024)))
+# Как часто сбрасывать накопленные счётчики скачиваний в БД, секунд (0 — сразу)
+CLOUD_DOWNLOAD_FLUSH_INTERVAL = float(os.getenv("CLOUD_DOWNLOAD_FLUSH_INTERVAL", "5"))
+# Кэш публичных ссылок в памяти процесса: число записей и время жизни записи, секунд
+CLOUD_SHARE_CACHE_SIZE = int(os.getenv("CLOUD_SHARE_CACHE_SIZE", "1024"))
+CLOUD_SHARE_CACHE_TTL = float(os.getenv("CLOUD_SHARE_CACHE_TTL", "60"))
+# Превью: каталог дискового кэша, его предельный объём, процессы рендеринга,
+# сколько секунд запрос ждёт превью, строить ли превью сразу после загрузки,
+# сколько байт текста показывать
+CLOUD_PREVIEW_ROOT = os.getenv("CLOUD_PREVIEW_ROOT", os.path.join(MEDIA_ROOT, "previews"))
+CLOUD_PREVIEW_CACHE_BYTES = int(os.getenv("CLOUD_PREVIEW_CACHE_BYTES", str(1024 * 1024 * 1024)))
+CLOUD_PREVIEW_WORKERS = int(os.getenv("CLOUD_PREVIEW_WORKERS", "2"))
+CLOUD_PREVIEW_TIMEOUT = float(os.getenv("CLOUD_PREVIEW_TIMEOUT", "20"))
+CLOUD_PREVIEW_ON_UPLOAD = os.getenv("CLOUD_PREVIEW_ON_UPLOAD", "true").lower() in ("1", "true", "yes")
+CLOUD_PREVIEW_TEXT_BYTES = int(os.getenv("CLOUD_PREVIEW_TEXT_BYTES", "4096"))
+# Журнал изменений: сколько дней хранить события (prune_changes), событий на ответ
+# /api/changes/, предельное ожидание долгого опроса и период проверки, секунд
+CLOUD_CHANGES_RETENTION_DAYS = int(os.getenv("CLOUD_CHANGES_RETENTION_DAYS", "30"))
+CLOUD_CHANGES_PAGE_SIZE = int(os.getenv("CLOUD_CHANGES_PAGE_SIZE", "1000"))
+CLOUD_CHANGES_MAX_WAIT = float(os.getenv("CLOUD_CHANGES_MAX_WAIT", "25"))
+CLOUD_CHANGES_POLL_INTERVAL = float(os.getenv("CLOUD_CHANGES_POLL_INTERVAL", "1"))
+# Сколько секунд дерево папок пользователя живёт в кэше (сбрасывается и раньше — при изменении папок);
+# с LocMemCache — отдельный короткий срок, 0 — не кэшировать
+CLOUD_FOLDER_TREE_CACHE_TTL = int(os.getenv("CLOUD_FOLDER_TREE_CACHE_TTL", "3600"))
+CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL = int(os.getenv("CLOUD_FOLDER_TREE_LOCAL_CACHE_TTL", "5"))
 
 # --- ВАЖНО: путь, куда webpack пишет бандл ---
 # webpack output: frontend/webpack.config.js -> ../backend/static/frontend
@@ -142,6 +193,16 @@ REST_FRAMEWORK = {
 
 USER_DEFAULT_QUOTA = int(os.getenv("USER_DEFAULT_QUOTA", str(100 * 1024 * 1024)))
 
+# Фоновые задачи (очистка папок/пользователей):
+# "thread" — пул потоков внутри веб-процесса, "worker" — только `manage.py run_jobs`
+CLOUD_JOBS_BACKEND = os.getenv("CLOUD_JOBS_BACKEND", "thread")
+CLOUD_JOBS_WORKERS = int(os.getenv("CLOUD_JOBS_WORKERS", "2"))
+# задача в running без продления аренды дольше этого срока считается брошенной и перезапускается;
+# срок должен с запасом покрывать обработку одной пачки CLOUD_PURGE_CHUNK_SIZE
+CLOUD_JOBS_LEASE_SECONDS = int(os.getenv("CLOUD_JOBS_LEASE_SECONDS", "600"))
+CLOUD_PURGE_CHUNK_SIZE = int(os.getenv("CLOUD_PURGE_CHUNK_SIZE", "1000"))
+CLOUD_PURGE_UNLINK_WORKERS = int(os.getenv("CLOUD_PURGE_UNLINK_WORKERS", "8"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
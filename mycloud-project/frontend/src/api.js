@@ -1,6 +1,8 @@
 // frontend/src/api.js
 // Central API helper. Default export is apiFetch(path, opts) returning parsed JSON or throwing {status, data}.
 // Also exports getCsrfToken() and postForm helper for FormData file upload.
+// fetchPage()/fetchStorage() load one keyset page; fetchStorageMore() appends the next one.
+// watchChanges() long-polls /api/changes/ and calls onChange when files or folders change in another tab.
 
 function getCookie(name) {
   if (typeof document === 'undefined') return null;
@@ -85,3 +87,81 @@ export async function postForm(path, formData) {
     throw { status: resp.status, data };
   }
 }
+
+// Paginated list endpoints answer {next, results}: returns {items, next} for one page,
+// the caller loads the next page on demand. Plain arrays (non-paginated endpoints) have no next.
+export async function fetchPage(path) {
+  const data = await apiFetch(path);
+  if (Array.isArray(data)) return { items: data, next: null };
+  return { items: data.results || [], next: data.next || null };
+}
+
+function cursorOf(url, param) {
+  return new URL(url, window.location.origin).searchParams.get(param);
+}
+
+// /api/admin-users/<id>/storage/ pages folders and files independently
+// (folders_next / files_next). fetchStorage() loads the first page and remembers its path.
+export async function fetchStorage(path) {
+  const data = await apiFetch(path);
+  return {
+    ...data,
+    path,
+    folders: data.folders || [],
+    files: data.files || [],
+    folders_next: data.folders_next || null,
+    files_next: data.files_next || null,
+  };
+}
+
+// Appends the next page of the lists that still have a cursor; a finished list is not appended again.
+export async function fetchStorageMore(storage) {
+  const { folders_next: foldersNext, files_next: filesNext } = storage;
+  if (!foldersNext && !filesNext) return storage;
+  const url = new URL(storage.path, window.location.origin);
+  if (foldersNext) url.searchParams.set('folders_cursor', cursorOf(foldersNext, 'folders_cursor'));
+  if (filesNext) url.searchParams.set('files_cursor', cursorOf(filesNext, 'files_cursor'));
+  const data = await apiFetch(url.pathname + url.search);
+  return {
+    ...storage,
+    folders: foldersNext ? [...storage.folders, ...(data.folders || [])] : storage.folders,
+    files: filesNext ? [...storage.files, ...(data.files || [])] : storage.files,
+    folders_next: foldersNext ? (data.folders_next || null) : null,
+    files_next: filesNext ? (data.files_next || null) : null,
+  };
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export function watchChanges(onChange) {
+  let stopped = false;
+  const loop = async () => {
+    let cursor = null;
+    while (!stopped) {
+      try {
+        if (cursor === null) {
+          cursor = (await apiFetch('/api/changes/')).cursor;
+          continue;
+        }
+        // under ASGI the server holds the request up to `timeout` seconds; under WSGI it answers at once
+        const data = await apiFetch(`/api/changes/?since=${cursor}&timeout=25`);
+        if (data.cursor !== cursor) {
+          cursor = data.cursor;
+          if (!data.has_more && !stopped) onChange();
+        } else {
+          await sleep(5000);
+        }
+      } catch (err) {
+        if (err && err.status === 410) {
+          // journal was pruned past our cursor: reload everything from the current cursor
+          cursor = err.data && err.data.cursor !== undefined ? err.data.cursor : null;
+          if (!stopped) onChange();
+        } else {
+          await sleep(15000);
+        }
+      }
+    }
+  };
+  loop();
+  return () => { stopped = true; };
+}
@@ -9,6 +9,8 @@ export default function AdminPanel() {
 
   const [users, setUsers] = useState([]);
   const [loadingUsers, setLoadingUsers] = useState(false);
+  const [nextUsersUrl, setNextUsersUrl] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedUser, setSelectedUser] = useState(null);
   const [refreshFlag, setRefreshFlag] = useState(0);
 
@@ -25,7 +27,10 @@ export default function AdminPanel() {
       try {
         const res = await apiFetch(`/api/admin-users/`);
         const list = Array.isArray(res) ? res : (res.results || res.users || []);
-        if (mounted) setUsers(list || []);
+        if (mounted) {
+          setUsers(list || []);
+          setNextUsersUrl(Array.isArray(res) ? null : (res.next || null));
+        }
       } catch (e) {
         console.error("AdminPanel: failed to load users", e);
         toast("Не удалось загрузить список пользователей", { type: "error" });
@@ -37,6 +42,22 @@ export default function AdminPanel() {
     return () => { mounted = false; };
   }, [refreshFlag]);
 
+  // список пользователей постраничный: следующая страница — по курсору next
+  const loadMoreUsers = async () => {
+    if (!nextUsersUrl || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await apiFetch(nextUsersUrl);
+      setUsers(prev => [...prev, ...(res.results || [])]);
+      setNextUsersUrl(res.next || null);
+    } catch (e) {
+      console.error("AdminPanel: failed to load more users", e);
+      toast("Не удалось загрузить список пользователей", { type: "error" });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const toggleBlock = async (user, isActive) => {
     const uid = getUid(user);
     if (!uid) return toast("Не удалось определить пользователя", { type: "error" });
@@ -99,7 +120,7 @@ export default function AdminPanel() {
       <div className="card">
         <div className="card-title" style={{display: "flex", alignItems: "center", gap: 12}}>
           <div style={{ fontWeight: 700, fontSize: 18 }}>Админ — пользователи</div>
-          <div style={{ marginLeft: "auto", color: "#65748b" }}>{loadingUsers ? "Загрузка..." : `${users.length} пользователей`}</div>
+          <div style={{ marginLeft: "auto", color: "#65748b" }}>{loadingUsers ? "Загрузка..." : `${users.length}${nextUsersUrl ? "+" : ""} пользователей`}</div>
         </div>
 
         <div style={{ display: "grid", gridTemplateColumns: "320px 1fr", gap: 16, marginTop: 12 }}>
@@ -138,6 +159,11 @@ export default function AdminPanel() {
                     </div>
                   );
                 })}
+                {nextUsersUrl && (
+                  <button className="btn" onClick={loadMoreUsers} disabled={loadingMore}>
+                    {loadingMore ? "Загрузка..." : "Показать ещё"}
+                  </button>
+                )}
               </div>
             ) : (
               <div className="muted">Пользователи не найдены</div>
@@ -2,6 +2,7 @@ import React, { useEffect, useState, useRef } from "react";
 import { useDispatch, useSelector } from "react-redux";
 import {
   fetchFiles,
+  fetchMoreFiles,
   uploadFile as uploadFileThunk,
   deleteFile,
   downloadFile,
@@ -24,7 +25,7 @@ import CreateFolderTile from "./CreateFolderTile";
 import FolderTree from "./FolderTree";
 import { showToast } from "../utils/toast";
 import formatBytes from "../utils/formatBytes";
-import apiFetch from "../api";
+import { fetchStorage, fetchStorageMore, watchChanges } from "../api";
 import { useLocation, useNavigate } from "react-router-dom";
 
 function useQuery() {
@@ -72,6 +73,10 @@ export default function FileManager() {
 
   const [localFiles, setLocalFiles] = useState([]);
   const [localFolders, setLocalFolders] = useState([]);
+  // owner mode: the loaded storage pages with their cursors (see fetchStorageMore)
+  const [storagePages, setStoragePages] = useState(null);
+  const [loadingMoreStorage, setLoadingMoreStorage] = useState(false);
+  const storagePath = useRef(null);
   const [rootFiles, setRootFiles] = useState([]);
   const [rootFolders, setRootFolders] = useState([]);
   const [currentFolder, setCurrentFolder] = useState(null);
@@ -90,6 +95,13 @@ export default function FileManager() {
   const [dragOver, setDragOver] = useState(false);
   const [draggedItem, setDraggedItem] = useState(null);
 
+  const showStorage = (data) => {
+    storagePath.current = data.path;
+    setStoragePages(data);
+    setLocalFiles(data.files);
+    setLocalFolders(data.folders);
+  };
+
   useEffect(() => {
     const init = async () => {
       try {
@@ -100,9 +112,8 @@ export default function FileManager() {
 
       if (ownerMode) {
         try {
-          const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/`);
-          setLocalFiles(storage.files || []);
-          setLocalFolders(storage.folders || []);
+          const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/`);
+          showStorage(storage);
           setRootFiles(storage.files || []);
           setRootFolders(storage.folders || []);
         } catch (err) {
@@ -147,11 +158,10 @@ export default function FileManager() {
     const onChange = async () => {
       if (ownerMode) {
         try {
-          const storage = await apiFetch(
+          const storage = await fetchStorage(
             `/api/admin-users/${ownerMode}/storage/?parent=${currentFolder ?? ""}`
           );
-          setLocalFiles(storage.files || []);
-          setLocalFolders(storage.folders || []);
+          showStorage(storage);
         } catch (e) {
           /* intentionally ignore or log if you want */
         }
@@ -174,6 +184,12 @@ export default function FileManager() {
     return () => window.removeEventListener("mycloud:content-changed", onChange);
   }, [dispatch, ownerMode, currentFolder]);
 
+  // changes made in other tabs or devices: reload the open folder
+  useEffect(() => {
+    if (ownerMode) return undefined;
+    return watchChanges(() => window.dispatchEvent(new CustomEvent("mycloud:content-changed")));
+  }, [ownerMode]);
+
   const visibleFolders = (localFolders || []).filter(f => {
     if (ownerMode) return true;
     if (!user) return false;
@@ -182,6 +198,29 @@ export default function FileManager() {
     return Number(fid) === Number(user.id);
   });
 
+  const hasMore = ownerMode
+    ? Boolean(storagePages && (storagePages.folders_next || storagePages.files_next))
+    : Boolean(filesState.next);
+  const loadingMore = ownerMode ? loadingMoreStorage : filesState.loadingMore;
+
+  const loadMore = async () => {
+    if (!ownerMode) {
+      dispatch(fetchMoreFiles());
+      return;
+    }
+    if (!storagePages || loadingMoreStorage) return;
+    setLoadingMoreStorage(true);
+    try {
+      const more = await fetchStorageMore(storagePages);
+      // ignore the page if another folder was opened meanwhile
+      if (storagePath.current === more.path) showStorage(more);
+    } catch (e) {
+      showToast("Не удалось загрузить хранилище пользователя", { type: "error" });
+    } finally {
+      setLoadingMoreStorage(false);
+    }
+  };
+
   const openFolder = async (folderId) => {
     // Add current folder to history before changing
     setNavigationHistory(prev => [...prev, currentFolder]);
@@ -190,9 +229,8 @@ export default function FileManager() {
     setSelectedFolder(null);
     if (ownerMode) {
       try {
-        const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/?parent=${folderId || ""}`);
-        setLocalFiles(storage.files || []);
-        setLocalFolders(storage.folders || []);
+        const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/?parent=${folderId || ""}`);
+        showStorage(storage);
       } catch (e) { showToast("Не удалось открыть папку", { type: "error" }); }
     } else {
       try {
@@ -563,9 +601,8 @@ export default function FileManager() {
                         const loadPreviousContent = async () => {
                           if (ownerMode) {
                             try {
-                              const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/?parent=${previousFolder}`);
-                              setLocalFiles(storage.files || []);
-                              setLocalFolders(storage.folders || []);
+                              const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/?parent=${previousFolder}`);
+                              showStorage(storage);
                             } catch (e) {
                               console.error("Load previous content error", e);
                               showToast && showToast("Не удалось загрузить содержимое папки", { type: "error" });
@@ -588,9 +625,8 @@ export default function FileManager() {
                           // Reload root content for owner mode
                           const loadRootContent = async () => {
                             try {
-                              const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/`);
-                              setLocalFiles(storage.files || []);
-                              setLocalFolders(storage.folders || []);
+                              const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/`);
+                              showStorage(storage);
                               setRootFiles(storage.files || []);
                               setRootFolders(storage.folders || []);
                             } catch (e) {
@@ -620,9 +656,8 @@ export default function FileManager() {
                         // Reload root content for owner mode
                         const loadRootContent = async () => {
                           try {
-                            const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/`);
-                            setLocalFiles(storage.files || []);
-                            setLocalFolders(storage.folders || []);
+                            const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/`);
+                            showStorage(storage);
                             setRootFiles(storage.files || []);
                             setRootFolders(storage.folders || []);
                           } catch (e) {
@@ -658,9 +693,8 @@ export default function FileManager() {
                     // Reload root content for owner mode
                     const loadRootContent = async () => {
                       try {
-                        const storage = await apiFetch(`/api/admin-users/${ownerMode}/storage/`);
-                        setLocalFiles(storage.files || []);
-                        setLocalFolders(storage.folders || []);
+                        const storage = await fetchStorage(`/api/admin-users/${ownerMode}/storage/`);
+                        showStorage(storage);
                         setRootFiles(storage.files || []);
                         setRootFolders(storage.folders || []);
                       } catch (e) {
@@ -758,7 +792,7 @@ export default function FileManager() {
                       onClick={() => handleFileClick(file)}
                       style={{textAlign:"center", width:"100%"}}
                     >
-                      <div style={{fontSize:28}}>📄</div>
+                      <FileIcon file={file} />
                       {!editingFileId || editingFileId !== file.id ? (
                         <>
                           <div
@@ -786,6 +820,14 @@ export default function FileManager() {
               })}
             </div>
 
+            {hasMore && (
+              <div style={{marginTop:12, textAlign:"center"}}>
+                <button className="btn" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? "Загрузка..." : "Показать ещё"}
+                </button>
+              </div>
+            )}
+
             {uploadProgress && (
               <div style={{marginTop:12}}>
                 <div style={{fontSize:13}}>{uploadProgress.name}</div>
@@ -838,6 +880,25 @@ export default function FileManager() {
   );
 }
 
+const PREVIEW_EXTENSIONS = /\.(jpe?g|png|gif|webp|bmp|tiff?)$/i;
+
+// Миниатюра изображения с сервера (превью 128px, не оригинал); для остальных файлов и при ошибке — значок
+function FileIcon({ file }) {
+  const [failed, setFailed] = useState(false);
+  if (failed || !PREVIEW_EXTENSIONS.test(file.original_name || "")) {
+    return <div style={{fontSize:28}}>📄</div>;
+  }
+  return (
+    <img
+      src={`/api/files/${file.id}/preview/?size=128`}
+      alt=""
+      loading="lazy"
+      onError={() => setFailed(true)}
+      style={{width:64, height:48, objectFit:"cover", borderRadius:6}}
+    />
+  );
+}
+
 function InlineRename({ file, currentBase, ext, onCancel, onSave }) {
   const [val, setVal] = useState(currentBase || "");
   return (
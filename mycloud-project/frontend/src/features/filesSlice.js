@@ -1,5 +1,5 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
-import apiFetch, { postForm } from '../api';
+import apiFetch, { fetchPage, postForm } from '../api';
 import { fetchCurrentUser } from './authSlice';
 import { showToast } from '../utils/toast';
 
@@ -11,9 +11,24 @@ export const fetchFiles = createAsyncThunk(
       if (folder !== null && folder !== undefined) qs.push(`folder=${folder}`);
       if (owner) qs.push(`owner=${owner}`);
       const q = qs.length ? `?${qs.join('&')}` : '';
-      const data = await apiFetch(`/api/files/${q}`);
+      // first page only; fetchMoreFiles loads the rest on demand
+      const { items, next } = await fetchPage(`/api/files/${q}`);
       try { await thunkAPI.dispatch(fetchCurrentUser()); } catch(e){/*ignore*/}
-      return { files: data, folder, owner };
+      return { files: items, next, folder, owner };
+    } catch (err) {
+      return thunkAPI.rejectWithValue(err);
+    }
+  }
+);
+
+export const fetchMoreFiles = createAsyncThunk(
+  'files/fetchMoreFiles',
+  async (_, thunkAPI) => {
+    const { next } = thunkAPI.getState().files;
+    if (!next) return { files: [], next: null, from: null };
+    try {
+      const page = await fetchPage(next);
+      return { files: page.items, next: page.next, from: next };
     } catch (err) {
       return thunkAPI.rejectWithValue(err);
     }
@@ -112,7 +127,9 @@ const slice = createSlice({
   name: 'files',
   initialState: {
     items: [],
+    next: null,
     loading: false,
+    loadingMore: false,
     error: null,
     selected: null,
   },
@@ -130,9 +147,21 @@ const slice = createSlice({
   extraReducers: (builder) => {
     builder
       .addCase(fetchFiles.pending, (s) => { s.loading = true; s.error = null; })
-      .addCase(fetchFiles.fulfilled, (s, a) => { s.loading = false; s.items = a.payload.files || a.payload; })
+      .addCase(fetchFiles.fulfilled, (s, a) => { s.loading = false; s.items = a.payload.files || []; s.next = a.payload.next; })
       .addCase(fetchFiles.rejected, (s, a) => { s.loading = false; s.error = a.payload || a.error; })
 
+      .addCase(fetchMoreFiles.pending, (s) => { s.loadingMore = true; })
+      .addCase(fetchMoreFiles.fulfilled, (s, a) => {
+        s.loadingMore = false;
+        // the folder was reloaded while this page was in flight
+        if (a.payload.from !== s.next) return;
+        // a file added by uploadFile may also arrive with a later page
+        const seen = new Set(s.items.map(it => it.id));
+        s.items = [...s.items, ...a.payload.files.filter(it => !seen.has(it.id))];
+        s.next = a.payload.next;
+      })
+      .addCase(fetchMoreFiles.rejected, (s, a) => { s.loadingMore = false; showToast('Не удалось загрузить файлы', { type: 'error' }); })
+
       .addCase(uploadFile.pending, (s) => { s.loading = true; s.error = null; })
       .addCase(uploadFile.fulfilled, (s, a) => {
         s.loading = false;